@@ -1,7 +1,15 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 celery_app = Celery("shilat_app")
 celery_app.config_from_object("django.conf:settings", namespace="CELERY")
 celery_app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def warm_providers(**kwargs):
+    # Build provider clients once per worker process instead of on the first job
+    from shilat.services import providers
+    providers.warm()
@@ -62,6 +62,10 @@ STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Audio downloads: "nginx" hands the transfer to nginx's internal AUDIO_ACCEL_PREFIX location (X-Accel-Redirect);
+# "django" streams from the worker with ETag/Last-Modified/Range (for running without nginx)
+AUDIO_DELIVERY = os.getenv("AUDIO_DELIVERY", "django")
+AUDIO_ACCEL_PREFIX = os.getenv("AUDIO_ACCEL_PREFIX", "/protected-media/")
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOWED_ORIGINS = [o.strip() for o in os.getenv("DJANGO_CORS_ALLOWED_ORIGINS","").split(",") if o.strip()]
@@ -75,10 +79,51 @@ REST_FRAMEWORK = {
 CELERY_BROKER_URL = os.getenv("REDIS_URL","redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("REDIS_URL","redis://redis:6379/0")
 CELERY_TASK_TIME_LIMIT = 120
+# CPU-bound mixing can be served by a dedicated worker (-Q cpu) apart from the I/O-bound provider stages
+CELERY_CPU_QUEUE = os.getenv("CELERY_CPU_QUEUE", "celery")
+# quality="draft" jobs run every stage on this queue so previews never wait behind full renders
+CELERY_DRAFT_QUEUE = os.getenv("CELERY_DRAFT_QUEUE", "celery")
+CELERY_TASK_ROUTES = {
+    "shilat.tasks.mix_audio": {"queue": CELERY_CPU_QUEUE},
+    "shilat.tasks.remix_audio": {"queue": CELERY_CPU_QUEUE},
+    "shilat.tasks.build_audio_variant": {"queue": CELERY_CPU_QUEUE},
+}
+CELERY_BEAT_SCHEDULE = {
+    "sweep-pending-music": {
+        "task": "shilat.tasks.sweep_pending_music",
+        "schedule": int(os.getenv("SUNOAPI_SWEEP_INTERVAL_SEC", "120")),
+    },
+    "refresh-voice-catalogs": {
+        "task": "shilat.tasks.refresh_voice_catalogs",
+        "schedule": int(os.getenv("VOICE_CATALOG_REFRESH_SEC", "1800")),
+    },
+    "release-stale-remixes": {
+        "task": "shilat.tasks.release_stale_remixes",
+        "schedule": 300,
+    },
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL", "redis://redis:6379/1"),
+    }
+}
+
+# Job progress events: snapshots live in the cache, changes are announced on Redis pub/sub
+# (empty JOB_EVENTS_REDIS_URL: readers poll the cached snapshot every JOB_EVENTS_POLL_SEC instead)
+JOB_EVENTS_REDIS_URL = os.getenv("JOB_EVENTS_REDIS_URL", os.getenv("REDIS_URL", "redis://redis:6379/0"))
+JOB_EVENTS_POLL_SEC = float(os.getenv("JOB_EVENTS_POLL_SEC", "1"))
+JOB_EVENTS_TTL_SEC = int(os.getenv("JOB_EVENTS_TTL_SEC", "86400"))
+JOB_EVENTS_STREAM_SEC = int(os.getenv("JOB_EVENTS_STREAM_SEC", "300"))  # an SSE stream ends after this; the client reconnects
+JOB_EVENTS_HEARTBEAT_SEC = int(os.getenv("JOB_EVENTS_HEARTBEAT_SEC", "15"))
+JOB_EVENTS_RETRY_MS = int(os.getenv("JOB_EVENTS_RETRY_MS", "1000"))
+JOB_EVENTS_LONG_POLL_SEC = int(os.getenv("JOB_EVENTS_LONG_POLL_SEC", "25"))
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY","")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID","")
 ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID","eleven_multilingual_v2")
+ELEVENLABS_DRAFT_MODEL_ID = os.getenv("ELEVENLABS_DRAFT_MODEL_ID","eleven_flash_v2_5")
 GOOGLE_TTS_API_KEY = os.getenv("GOOGLE_TTS_API_KEY","")
 GOOGLE_TTS_LANGUAGE = os.getenv("GOOGLE_TTS_LANGUAGE","ar-XA")
 GOOGLE_TTS_VOICE_NAME = os.getenv("GOOGLE_TTS_VOICE_NAME","")
@@ -86,3 +131,72 @@ GOOGLE_TTS_AUDIO_ENCODING = os.getenv("GOOGLE_TTS_AUDIO_ENCODING","MP3")
 
 # SunoAPI.org (Third-party) token for AI music generation
 SUNOAPI_TOKEN = os.getenv('SUNOAPI_TOKEN', '')
+SUNOAPI_BASE_URL = os.getenv("SUNOAPI_BASE_URL", "https://api.sunoapi.org/api/v1")
+# Public base of this API as seen from sunoapi.org (e.g. https://shilat.example.com/api); empty = sweeper only
+SUNOAPI_CALLBACK_BASE_URL = os.getenv("SUNOAPI_CALLBACK_BASE_URL", "")
+SUNOAPI_MUSIC_TIMEOUT_SEC = int(os.getenv("SUNOAPI_MUSIC_TIMEOUT_SEC", "900"))
+# Instrumental beds shared per (school, rhythm, tempo bucket, style) instead of one render per job
+MUSIC_BED_LIBRARY = os.getenv("MUSIC_BED_LIBRARY", "1") == "1"
+MUSIC_BED_TEMPO_BUCKET = int(os.getenv("MUSIC_BED_TEMPO_BUCKET", "8"))
+MUSIC_BED_ROTATE = os.getenv("MUSIC_BED_ROTATE", "1") == "1"
+MUSIC_BED_VARIANTS = int(os.getenv("MUSIC_BED_VARIANTS", "1"))
+MUSIC_BED_SLOT_WAIT_SEC = int(os.getenv("MUSIC_BED_SLOT_WAIT_SEC", "30"))  # wait on another worker requesting the same slot
+# POST /api/remix/<job_id>/ answers inline for mixes up to this long (a few seconds of CPU in the web
+# worker), otherwise queues remix_audio
+REMIX_SYNC_MAX_SEC = float(os.getenv("REMIX_SYNC_MAX_SEC", "15"))
+REMIX_CLAIM_TIMEOUT_SEC = int(os.getenv("REMIX_CLAIM_TIMEOUT_SEC", "900"))  # a lost or crashed remix frees the job after this
+# quality="draft" previews: verses synthesized, output sample rate and MP3 bitrate (mono)
+DRAFT_MAX_VERSES = int(os.getenv("DRAFT_MAX_VERSES", "4"))
+DRAFT_SAMPLE_RATE = int(os.getenv("DRAFT_SAMPLE_RATE", "22050"))
+DRAFT_BITRATE = os.getenv("DRAFT_BITRATE", "48k")
+# Delivery variants (download ?variant=opus|aac|hls): HLS segment length in seconds
+HLS_SEGMENT_SEC = int(os.getenv("HLS_SEGMENT_SEC", "6"))
+
+# POST /api/submit-batch/: poems per request and meter-detection processes (0/1 = inline)
+BATCH_MAX_POEMS = int(os.getenv("BATCH_MAX_POEMS", "500"))
+BATCH_ANALYZE_WORKERS = int(os.getenv("BATCH_ANALYZE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Voice catalogs served from the cache (refreshed by beat, stale-while-revalidate after FRESH_SEC)
+VOICE_CATALOG_FRESH_SEC = int(os.getenv("VOICE_CATALOG_FRESH_SEC", "900"))
+VOICE_CATALOG_MAX_AGE_SEC = int(os.getenv("VOICE_CATALOG_MAX_AGE_SEC", "86400"))
+VOICE_CATALOG_LOCAL_TTL_SEC = int(os.getenv("VOICE_CATALOG_LOCAL_TTL_SEC", "30"))
+VOICE_CATALOG_COLD_WAIT_SEC = int(os.getenv("VOICE_CATALOG_COLD_WAIT_SEC", "10"))  # wait on another request's cold fetch
+VOICE_CATALOG_WARM = [("elevenlabs", "ar"), ("google", GOOGLE_TTS_LANGUAGE)]
+
+# Pooled provider HTTP sessions (shilat/services/http_client.py); timeouts in seconds
+PROVIDER_HTTP = {
+    "default": {
+        "pool_maxsize": int(os.getenv("PROVIDER_HTTP_POOL_MAXSIZE", "16")),
+        "retries": int(os.getenv("PROVIDER_HTTP_RETRIES", "3")),
+        "backoff_factor": float(os.getenv("PROVIDER_HTTP_BACKOFF", "0.5")),
+    },
+    # TTS POSTs are billed per call and keep the default (idempotent-only) retry methods
+    "elevenlabs": {"timeouts": {"default": 30, "tts": 90}},
+    # Generation requests are paid: only idempotent polling is retried
+    "sunoapi": {"timeouts": {"default": 60}, "retry_methods": ("GET",)},
+    "download": {"timeouts": {"default": 60}},
+}
+
+# Content-addressed cache of synthesized TTS audio (shared through the media volume)
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") == "1"
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", str(MEDIA_ROOT / "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Verse-chunked TTS: verses are synthesized concurrently and stitched back together
+TTS_CHUNKED = os.getenv("TTS_CHUNKED", "1") == "1"
+TTS_CHUNK_MAX_WORKERS = int(os.getenv("TTS_CHUNK_MAX_WORKERS", "4"))
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "240"))
+TTS_VERSE_GAP_MS = int(os.getenv("TTS_VERSE_GAP_MS", "350"))
+TTS_HEMISTICH_GAP_MS = int(os.getenv("TTS_HEMISTICH_GAP_MS", "120"))
+TTS_CROSSFADE_MS = int(os.getenv("TTS_CROSSFADE_MS", "30"))
+
+# Post-processing decodes/encodes through ffmpeg subprocesses (audio stays PCM in between)
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+
+# Vocal effects in post-processing (job tempo/pitch/intensity and the style's reverb)
+EFFECTS_ENABLED = os.getenv("EFFECTS_ENABLED", "1") == "1"
+
+# Local percussion under vocals without a music bed (job.add_percussion); kit "" = by shila school
+PERCUSSION_KIT = os.getenv("PERCUSSION_KIT", "")
+PERCUSSION_VOLUME_DB = float(os.getenv("PERCUSSION_VOLUME_DB", "-12"))
@@ -0,0 +1,88 @@
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+# Stored files leave through one of two paths once the view has checked access:
+# - "nginx": an empty response with X-Accel-Redirect; nginx sends the bytes from its internal location
+#   (AUDIO_ACCEL_PREFIX, an alias of MEDIA_ROOT) with its own ETag, Last-Modified and Range handling.
+# - "django": streamed by the worker, with the same validators and single-range support.
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK = 64 * 1024
+
+
+def _validators(field):
+    """(etag, mtime) in nginx's format: size and whole-second mtime, so both modes agree."""
+    mtime = int(field.storage.get_modified_time(field.name).timestamp())
+    return f'"{mtime:x}-{field.size:x}"', mtime
+
+
+def _byte_range(header: str, size: int):
+    """(start, end) inclusive for a single "bytes=" range; None to send everything; False if unsatisfiable."""
+    m = _RANGE_RE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None  # multi-range or malformed: the whole file, as nginx does
+    if not m.group(1):
+        length = int(m.group(2))
+        return (max(0, size - length), size - 1) if length else False
+    start = int(m.group(1))
+    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _stream(f, remaining: int):
+    try:
+        while remaining > 0:
+            chunk = f.read(min(_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def serve(request, field, content_type: str, filename: str, as_attachment: bool = True):
+    """Response delivering a stored file (FieldFile) according to AUDIO_DELIVERY."""
+    disposition = content_disposition_header(as_attachment, filename)
+    if getattr(settings, "AUDIO_DELIVERY", "django") == "nginx":
+        res = HttpResponse(content_type=content_type)
+        res["X-Accel-Redirect"] = getattr(settings, "AUDIO_ACCEL_PREFIX", "/protected-media/") + quote(field.name)
+        res["Content-Disposition"] = disposition
+        return res
+
+    etag, mtime = _validators(field)
+    last_modified = http_date(mtime)
+    conditional = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if conditional is not None:
+        if conditional.status_code == 304:
+            conditional["ETag"] = etag
+            conditional["Last-Modified"] = last_modified
+        return conditional
+    size = field.size
+    span = None
+    if_range = request.META.get("HTTP_IF_RANGE", "")
+    if "HTTP_RANGE" in request.META and (not if_range or if_range in (etag, last_modified) or etag in parse_etags(if_range)):
+        span = _byte_range(request.META["HTTP_RANGE"], size)
+    if span is False:
+        res = HttpResponse(status=416)
+        res["Content-Range"] = f"bytes */{size}"
+        return res
+
+    start, end = span or (0, size - 1)
+    f = field.storage.open(field.name, "rb")
+    if start:
+        f.seek(start)
+    res = StreamingHttpResponse(_stream(f, end - start + 1), status=206 if span else 200, content_type=content_type)
+    res["Content-Length"] = str(end - start + 1)
+    if span:
+        res["Content-Range"] = f"bytes {start}-{end}/{size}"
+    res["Accept-Ranges"] = "bytes"
+    res["ETag"] = etag
+    res["Last-Modified"] = last_modified
+    res["Content-Disposition"] = disposition
+    return res
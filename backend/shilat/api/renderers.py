@@ -0,0 +1,31 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+class MediaRenderer(BaseRenderer):
+    """Lets views that return file responses pass content negotiation for audio/playlist Accept headers.
+
+    Those views return FileResponse/HttpResponse objects, which DRF never renders; only error bodies
+    (404/401 raised before the file is chosen) reach render() and are written as JSON.
+    """
+    media_type = "*/*"
+    format = "media"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or isinstance(data, bytes):
+            return data
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Negotiates text/event-stream for the job events view, which streams its own response.
+
+    Only error bodies reach render(); they are sent as a single "error" event.
+    """
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
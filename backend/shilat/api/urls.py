@@ -1,11 +1,13 @@
 from django.urls import path
 from .views import (
-    submit_text, rhythms, styles, schools, voices, lexicon,
-    generate, job_status, download_audio
+    submit_text, submit_batch, analyze, rhythms, styles, schools, voices, lexicon,
+    generate, job_status, job_events, download_audio, hls_segment, music_callback, resume_job, remix
 )
 
 urlpatterns = [
     path("submit-text/", submit_text),
+    path("submit-batch/", submit_batch),
+    path("analyze/", analyze),
     path("rhythms/", rhythms),
     path("styles/", styles),
     path("schools/", schools),
@@ -13,5 +15,10 @@ urlpatterns = [
     path("lexicon/", lexicon),
     path("generate/", generate),
     path("job-status/<uuid:job_id>/", job_status),
+    path("job-events/<uuid:job_id>/", job_events),
+    path("job-resume/<uuid:job_id>/", resume_job),
+    path("remix/<uuid:job_id>/", remix),
     path("download/<uuid:job_id>/", download_audio),
+    path("download/<uuid:job_id>/hls/<uuid:key>/<str:name>", hls_segment),
+    path("music-callback/<uuid:job_id>/<str:token>/", music_callback),
 ]
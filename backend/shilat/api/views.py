@@ -1,21 +1,34 @@
-from rest_framework.decorators import api_view, permission_classes
+import json
+import logging
+import time
+from rest_framework.decorators import (
+    api_view, permission_classes, authentication_classes, parser_classes, renderer_classes
+)
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import FileResponse, Http404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.db import connection
 
 from shilat.models import (
     PoemTextSubmission, MelodyTemplate, CulturalStyle, ShilaSchool,
-    VoiceConversionJob, GeneratedAudio, DialectLexiconRule
+    VoiceConversionJob, GeneratedAudio, DialectLexiconRule, MusicBed, AudioVariant
 )
-from shilat.services.text_prep import clean_arabic_text
-from shilat.services.meter import detect_bahr
+from shilat.services.normalize import normalize_text
+from shilat.services.meter import analyze_lines, detect_bahr
 from shilat.services.melody_engine import suggest_rhythms
-from shilat.tasks import generate_shilat_audio
-from shilat.services.voice_providers.elevenlabs import ElevenLabsProvider
-from shilat.services.voice_providers.google_tts import GoogleTTSProvider
+from shilat.tasks import claim_remix, generate_shilat_audio, record_music_result, remix_audio
+from shilat.services.music_providers import sunoapi
+from shilat.services import audio_io, batch, events, variants, voice_catalog
+from shilat.api.parsers import NDJSONParser
+from shilat.api import delivery
+from shilat.api.renderers import EventStreamRenderer, MediaRenderer
+
+logger = logging.getLogger(__name__)
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -25,14 +38,15 @@ def submit_text(request):
     if not raw:
         return Response({"detail": "النص مطلوب"}, status=400)
 
-    cleaned = clean_arabic_text(raw)
-    bahr, conf, details = detect_bahr(cleaned)
+    # Normalized and tokenized once; meter detection reuses the verse structure
+    doc = normalize_text(raw)
+    bahr, conf, details = detect_bahr(doc)
 
     sub = PoemTextSubmission.objects.create(
         user=request.user,
         title=title,
         raw_text=raw,
-        cleaned_text=cleaned,
+        cleaned_text=doc.cleaned,
         meter_guess=bahr,
         meter_confidence=conf,
         meter_details=details,
@@ -50,6 +64,72 @@ def submit_text(request):
         status=status.HTTP_201_CREATED,
     )
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def analyze(request):
+    """Live meter feedback while typing: nothing is saved, unchanged verses come from the per-line memo."""
+    raw = request.data.get("text") or ""
+    limit = getattr(settings, "ANALYZE_MAX_CHARS", 20000)
+    if len(raw) > limit:
+        return Response({"detail": f"النص أطول من {limit} حرف"}, status=400)
+    result = analyze_lines(normalize_text(raw))
+    result["suggested_rhythms"] = [s.__dict__ for s in suggest_rhythms(result["meter_guess"])] if result["meter_guess"] else []
+    return Response(result)
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@parser_classes([JSONParser, NDJSONParser])
+def submit_batch(request):
+    """Many poems in one request: a JSON array (or {"poems": [...]}) or NDJSON of {"title", "text"} / strings."""
+    items = request.data.get("poems") if isinstance(request.data, dict) else request.data
+    if not isinstance(items, list) or not items:
+        return Response({"detail": "قائمة القصائد مطلوبة"}, status=400)
+    limit = getattr(settings, "BATCH_MAX_POEMS", 500)
+    if len(items) > limit:
+        return Response({"detail": f"الحد الأقصى {limit} قصيدة في الطلب"}, status=400)
+
+    results = [None] * len(items)
+    pending = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"text": item}
+        if not isinstance(item, dict):
+            results[i] = {"index": i, "error": "عنصر غير صالح"}
+            continue
+        raw = str(item.get("text") or "").strip()
+        title = str(item.get("title") or "").strip()[:120]
+        if not raw:
+            results[i] = {"index": i, "error": "النص مطلوب"}
+            continue
+        pending.append((i, title, raw))
+
+    subs = []
+    for (i, title, raw), res in zip(pending, batch.analyze_many([raw for _, _, raw in pending])):
+        if "error" in res:
+            results[i] = {"index": i, "error": res["error"]}
+            continue
+        sub = PoemTextSubmission(user=request.user, title=title, raw_text=raw, **res)
+        subs.append(sub)
+        results[i] = {
+            "index": i,
+            "id": str(sub.id),
+            "title": title,
+            "meter_guess": sub.meter_guess,
+            "meter_confidence": sub.meter_confidence,
+            "meter_details": sub.meter_details,
+            "suggested_rhythms": [s.__dict__ for s in suggest_rhythms(sub.meter_guess)],
+        }
+    PoemTextSubmission.objects.bulk_create(subs, batch_size=200)
+
+    failed = sum(1 for r in results if "error" in r)
+    if not subs:
+        code = status.HTTP_400_BAD_REQUEST
+    elif failed:
+        code = status.HTTP_207_MULTI_STATUS
+    else:
+        code = status.HTTP_201_CREATED
+    return Response({"created": len(subs), "failed": failed, "results": results}, status=code)
+
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def rhythms(request):
@@ -101,16 +181,15 @@ def voices(request):
     if not lang_norm.startswith("ar"):
         dialect = None
     if provider_key == "google":
-        provider = GoogleTTSProvider()
-        return Response(provider.list_voices(language_code=lang, gender=gender))
-    provider = ElevenLabsProvider()
+        return Response(voice_catalog.google_voices(language_code=lang, gender=gender))
     return Response(
-        provider.list_voices(
+        voice_catalog.elevenlabs_voices(
             language=lang,
             dialect=dialect,
             include_community=include_community,
             include_verified=include_verified,
             include_catalog=catalog,
+            gender=gender,
         )
     )
 
@@ -142,6 +221,12 @@ def generate(request):
     add_music = bool(request.data.get("add_music", False))
     music_provider = (request.data.get("music_provider") or ("sunoapi" if add_music else "none")).strip()[:16]
     music_volume_db = float(request.data.get("music_volume_db", -10.0))
+    quality = (request.data.get("quality") or "final").strip().lower()
+    if quality not in ("final", "draft"):
+        return Response({"detail": "quality يجب أن تكون final أو draft"}, status=400)
+    if quality == "draft" and music_provider == "suno_vocal":
+        # A preview never waits on a Suno vocal render: TTS over a cached bed instead
+        music_provider = "sunoapi"
 
     job = VoiceConversionJob.objects.create(
         submission=sub,
@@ -158,8 +243,10 @@ def generate(request):
         add_music=add_music,
         music_provider=music_provider if add_music else "none",
         music_volume_db=music_volume_db,
+        quality=quality,
         status="queued",
     )
+    events.publish(job.id, user_id=request.user.id, status="queued", stage="queued")
 
     generate_shilat_audio.delay(str(job.id))
     return Response({"job_id": str(job.id)}, status=202)
@@ -173,21 +260,219 @@ def job_status(request, job_id):
         {
             "job_id": str(job.id),
             "status": job.status,
+            "quality": job.quality,
             "error_message": job.error_message,
             "has_audio": audio_exists,
             "add_music": job.add_music,
             "music_provider": job.music_provider,
             "music_task_id": job.music_task_id,
             "music_audio_url": job.music_audio_url,
+            "stage": job.stage,
+            "checkpoints": {
+                "voice_stem": bool(job.voice_stem),
+                "music_task": bool(job.music_task_id),
+                "music_audio_url": bool(job.music_audio_url),
+                "music_stem": bool(job.music_stem),
+            },
         }
     )
 
+def _sse(state) -> str:
+    return f"id: {state['seq']}\nevent: progress\ndata: {json.dumps(events.public(state), ensure_ascii=False)}\n\n"
+
+def _event_stream(job_id, state, last_id: int):
+    # EventSource reconnects by itself (sending Last-Event-ID) once the stream ends
+    yield f"retry: {int(settings.JOB_EVENTS_RETRY_MS)}\n\n"
+    if not connection.in_atomic_block:
+        connection.close()  # the stream only reads the cache: no database connection held while it lasts
+    if state["seq"] > last_id:
+        yield _sse(state)
+    deadline = time.monotonic() + settings.JOB_EVENTS_STREAM_SEC
+    while not events.finished(state) and time.monotonic() < deadline:
+        nxt = events.wait(job_id, state["seq"], min(settings.JOB_EVENTS_HEARTBEAT_SEC, deadline - time.monotonic()))
+        if nxt is None:
+            yield ": keepalive\n\n"
+        else:
+            state = nxt
+            yield _sse(state)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def job_events(request, job_id):
+    """Job progress as it happens: an SSE stream (Accept: text/event-stream) or a JSON long poll.
+
+    The long poll returns at once when the snapshot is newer than ?since=<seq> (or the job is finished),
+    otherwise after the next event or ?wait= seconds. Both read the cached snapshot kept by the pipeline;
+    the database is read only when the cache does not know the job's owner yet.
+    """
+    state = events.snapshot(job_id)
+    if not state or state.get("user_id") is None:
+        job = get_object_or_404(VoiceConversionJob.objects.select_related("generatedaudio"),
+                                id=job_id, submission__user=request.user)
+        state = events.seed(job, request.user.id)
+    elif state["user_id"] != request.user.id:
+        raise Http404
+
+    if request.accepted_renderer.format == EventStreamRenderer.format:
+        try:
+            last_id = int(request.headers.get("Last-Event-ID", -1))
+        except ValueError:
+            last_id = -1
+        res = StreamingHttpResponse(_event_stream(job_id, state, last_id), content_type="text/event-stream")
+        res["Cache-Control"] = "no-cache"
+        res["X-Accel-Buffering"] = "no"  # nginx must pass events through as they are written
+        return res
+
+    try:
+        since = int(request.query_params.get("since", -1))
+        wait = float(request.query_params.get("wait", settings.JOB_EVENTS_LONG_POLL_SEC))
+    except ValueError:
+        return Response({"detail": "since و wait يجب أن تكون أرقاماً"}, status=400)
+    if state["seq"] <= since and not events.finished(state):
+        state = events.wait(job_id, since, max(0.0, min(wait, settings.JOB_EVENTS_LONG_POLL_SEC))) or state
+    return Response(events.public(state))
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def resume_job(request, job_id):
+    """Re-runs a failed job from its last checkpoint (paid provider calls that succeeded are not repeated)."""
+    job = get_object_or_404(VoiceConversionJob, id=job_id, submission__user=request.user)
+    if job.status != "failed":
+        return Response({"detail": "يمكن استئناف المهام الفاشلة فقط"}, status=409)
+    generate_shilat_audio.delay(str(job.id))
+    return Response({"job_id": str(job.id), "stage": job.stage}, status=202)
+
+# Mix settings a remix may change, with their parser and allowed range
+_REMIX_FIELDS = {
+    "music_volume_db": (float, -40.0, 6.0),
+    "intensity": (float, 0.0, 1.0),
+    "tempo": (int, 40, 240),
+    "pitch": (float, -12.0, 12.0),
+}
+
+def _flag(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def remix(request, job_id):
+    """Re-mixes a finished job from its stored stems with new mix settings (no TTS or Suno call).
+
+    Short tracks are mixed inline (200 with the new audio meta); longer ones are queued (202).
+    """
+    job = get_object_or_404(VoiceConversionJob, id=job_id, submission__user=request.user)
+    if job.status != "succeeded":
+        return Response({"detail": "يمكن إعادة مزج المهام المكتملة فقط"}, status=409)
+    if not job.voice_stem:
+        return Response({"detail": "لا يوجد مسار صوتي محفوظ لهذه المهمة"}, status=409)
+
+    changes = {}
+    for field, (cast, lo, hi) in _REMIX_FIELDS.items():
+        if field in request.data:
+            try:
+                changes[field] = max(lo, min(hi, cast(request.data[field])))
+            except (TypeError, ValueError):
+                return Response({"detail": f"قيمة غير صالحة: {field}"}, status=400)
+    if "add_percussion" in request.data:
+        changes["add_percussion"] = _flag(request.data["add_percussion"])
+    if request.data.get("music_bed_id") not in (None, ""):
+        bed = MusicBed.objects.filter(id=request.data["music_bed_id"], status="ready").first()
+        if bed is None:
+            return Response({"detail": "الخلفية الموسيقية غير متاحة"}, status=400)
+        changes.update(add_music=True, music_provider="sunoapi", music_bed_id=bed.id, music_task_id=bed.task_id,
+                       music_audio_url=bed.audio_url, music_stem=bed.audio_file.name or "", music_error="")
+    elif "add_music" in request.data:
+        wants = _flag(request.data["add_music"])
+        if wants and not (job.music_stem or job.music_audio_url):
+            return Response({"detail": "لا توجد موسيقى محفوظة لهذه المهمة"}, status=400)
+        changes["add_music"] = wants
+
+    # Two remixes never run at once; the new settings are saved only with the mix made from them
+    if not claim_remix(job.id):
+        return Response({"detail": "إعادة المزج جارية بالفعل"}, status=409)
+
+    duration = GeneratedAudio.objects.filter(job=job).values_list("duration_sec", flat=True).first() or 0.0
+    if duration > getattr(settings, "REMIX_SYNC_MAX_SEC", 15):
+        remix_audio.delay(str(job.id), changes)
+        return Response({"job_id": str(job.id), "stage": "mixing"}, status=202)
+    try:
+        meta = remix_audio(str(job.id), changes)
+    except Exception:
+        logger.exception("inline remix of job %s failed", job.id)
+        return Response({"detail": "تعذر إعادة المزج، حاول مرة أخرى"}, status=500)
+    return Response({"job_id": str(job.id), "stage": "done", "duration": meta.get("duration", 0.0),
+                     "meta": {k: v for k, v in meta.items() if k != "name"}})
+
+def _media_error(detail: str, status_code: int, **extra):
+    # Plain JSON: the client may have negotiated an audio type that DRF cannot render a dict as
+    return JsonResponse({"detail": detail, **extra}, status=status_code, json_dumps_params={"ensure_ascii": False})
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, MediaRenderer])
 def download_audio(request, job_id):
+    """The final track, or a delivery variant chosen by ?variant=opus|aac|hls (&bitrate=kbps) or the Accept header.
+
+    Variants are encoded once on first request: until then the reply is 202 with Retry-After. The bytes
+    themselves go out through nginx (X-Accel-Redirect) or a ranged stream, see shilat.api.delivery.
+    """
     job = get_object_or_404(VoiceConversionJob, id=job_id, submission__user=request.user)
     try:
         audio = GeneratedAudio.objects.get(job=job)
     except GeneratedAudio.DoesNotExist:
         raise Http404("الصوت غير جاهز بعد")
-    return FileResponse(audio.audio_file.open("rb"), as_attachment=True, filename=f"shilat-{job_id}.mp3")
+    try:
+        # ?format= is DRF's renderer override, hence ?variant=
+        choice = variants.choose(request.query_params.get("variant"), request.query_params.get("bitrate"),
+                                 request.headers.get("Accept", ""))
+    except ValueError as e:
+        return _media_error(str(e), 400)
+    if choice is None:
+        ext = audio.format or "mp3"
+        return delivery.serve(request, audio.audio_file, audio_io.CONTENT_TYPES.get(ext, "application/octet-stream"),
+                              f"shilat-{job_id}.{ext}")
+
+    variant, _ = variants.request(audio, *choice)
+    if variant.status != "ready":
+        res = _media_error("جاري تجهيز الصيغة المطلوبة", 202, format=variant.kind, bitrate=variant.bitrate)
+        res["Retry-After"] = "2"
+        return res
+    if variant.kind == "hls":
+        # Segments go through hls_segment (same access check), never a public media URL
+        base = request.build_absolute_uri(f"{request.path}hls/{variant.key}/")
+        return HttpResponse(variants.playlist(variant, base), content_type=audio_io.CONTENT_TYPES["m3u8"])
+    ext = audio_io.EXTENSIONS.get(variant.kind, variant.kind)
+    return delivery.serve(request, variant.file, audio_io.CONTENT_TYPES[ext], f"shilat-{job_id}-{variant.bitrate}k.{ext}")
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, MediaRenderer])
+def hls_segment(request, job_id, key, name):
+    """One segment of an HLS variant listed in the playlist from download_audio, for the job's owner only."""
+    variant = get_object_or_404(AudioVariant, key=key, kind="hls", status="ready",
+                                audio__job__id=job_id, audio__job__submission__user=request.user)
+    stored = variants.segment(variant, name)
+    if stored is None:
+        raise Http404("المقطع غير موجود")
+    field = variant.file
+    field.name = stored
+    ext = name.rsplit(".", 1)[-1]
+    return delivery.serve(request, field, audio_io.CONTENT_TYPES.get(ext, "application/octet-stream"), name,
+                          as_attachment=False)
+
+@api_view(["POST"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def music_callback(request, job_id, token):
+    """Completion callback from sunoapi.org (callBackUrl)."""
+    if not sunoapi.check_callback_token(job_id, token):
+        raise Http404()
+    job = get_object_or_404(VoiceConversionJob, id=job_id)
+    payload = request.data if isinstance(request.data, dict) else {}
+    task_id, audio_url, error = sunoapi.parse_callback(payload)
+    if task_id and job.music_task_id and task_id != job.music_task_id:
+        return Response({"status": "ignored"})
+    if audio_url or error:
+        record_music_result(job.id, audio_url=audio_url, error=error)
+    return Response({"status": "ok"})
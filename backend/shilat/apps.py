@@ -2,3 +2,5 @@ from django.apps import AppConfig
 class ShilatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "shilat"
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,188 @@
+import random
+import re
+import time
+from django.core.management.base import BaseCommand, CommandError
+from shilat.services.dialect import LexiconMatcher
+from shilat.services.meter import detect_bahr
+from shilat.services import effects, percussion
+from shilat.services.normalize import normalize_text
+
+_LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+
+
+def _timed(fn, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _word(rng, lo=2, hi=7):
+    return "".join(rng.choice(_LETTERS) for _ in range(rng.randint(lo, hi)))
+
+
+def bench_lexicon(cmd, opts):
+    rng = random.Random(opts["seed"])
+    n = opts["rules"] or 50000
+    rules = {}
+    while len(rules) < n:
+        # ~1 in 5 rules is a multi-word phrase
+        words = [_word(rng) for _ in range(rng.choice((1, 1, 1, 1, 2, 3)))]
+        rules[" ".join(words)] = _word(rng)
+    sources = list(rules)
+    verses = []
+    for _ in range(opts["verses"]):
+        words = [rng.choice(sources) if rng.random() < 0.3 else _word(rng) for _ in range(8)]
+        verses.append(" ".join(words))
+    text = "\n".join(verses)
+
+    compile_s, matcher = _timed(lambda: LexiconMatcher(rules.items()), 1)
+    apply_s, _ = _timed(lambda: matcher.apply(text), opts["repeat"])
+    cmd.stdout.write(f"lexicon: {matcher.size} rules compiled in {compile_s * 1000:.1f} ms")
+    cmd.stdout.write(f"lexicon: {len(verses)} verses ({len(text)} chars) applied in {apply_s * 1000:.2f} ms (best of {opts['repeat']})")
+
+
+def bench_meter(cmd, opts):
+    rng = random.Random(opts["seed"])
+    verses = [" ".join(_word(rng) for _ in range(rng.randint(4, 8))) for _ in range(max(opts["verses"], 2000))]
+    text = "\n".join(verses)
+    best, (bahr, conf, _) = _timed(lambda: detect_bahr(text), opts["repeat"])
+    cmd.stdout.write(f"meter: {len(verses)} verses in {best * 1000:.1f} ms ({len(verses) / best:,.0f} verses/s) -> {bahr} {conf}")
+
+
+def _legacy_plain(line: str) -> str:
+    t = re.sub(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]", "", line)
+    t = t.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا").replace("ى", "ي")
+    t = re.sub(r"[\u060C\u061B\u061F\!\?\,\.;:…\-\*]+", " ", t)
+    return re.sub(r"[^\S\n]+", " ", t).strip()
+
+
+def _legacy_passes(raw: str):
+    """The separate passes that normalize_text() replaced (clean, meter normalize twice per verse, tokenize)."""
+    text = raw.replace("\u0640", "")
+    text = re.sub(r"[\u200f\u200e]", "", text)
+    text = text.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا").replace("ى", "ي")
+    cleaned = "\n".join(x for x in (re.sub(r"\s+", " ", line).strip() for line in text.splitlines()) if x)
+    # detect_bahr filtered on the meter form, then scan_line normalized each kept line again
+    kept = [x.strip() for x in cleaned.splitlines() if _legacy_plain(x).strip()]
+    plain = [_legacy_plain(x) for x in kept]
+    tokens = [(m.group(0), m.start(), m.end()) for m in re.finditer(r"[\w\u0600-\u06FF]+", cleaned)]
+    return cleaned, plain, tokens
+
+
+def _single_pass(raw: str):
+    doc = normalize_text(raw)
+    return doc.cleaned, [v.plain for v in doc.verses], doc.tokens
+
+
+def bench_normalize(cmd, opts):
+    rng = random.Random(opts["seed"])
+    marks = "\u064E\u064F\u0650\u0652\u0651\u0640"
+    verses = []
+    for _ in range(max(opts["verses"], 10000)):
+        words = ["".join(c + (rng.choice(marks) if rng.random() < 0.3 else "") for c in _word(rng)) for _ in range(8)]
+        verses.append(" ".join(words[:4]) + "  *  " + "  ".join(words[4:]) + rng.choice(("", "،", "؟")))
+    raw = "\n".join(verses)
+    legacy_s, legacy = _timed(lambda: _legacy_passes(raw), opts["repeat"])
+    single_s, single = _timed(lambda: _single_pass(raw), opts["repeat"])
+    if legacy != single:
+        raise CommandError("normalize: single-pass output differs from the legacy passes")
+    cmd.stdout.write(f"normalize: {len(verses)} verses, legacy passes {legacy_s * 1000:.1f} ms, "
+                     f"single pass {single_s * 1000:.1f} ms ({legacy_s / single_s:.1f}x)")
+
+
+def bench_percussion(cmd, opts):
+    import numpy as np
+    pattern = {"time_signature": "2/4", "phrase_beats": 16, "hits": [1, 0, 1, 0], "accent": [1, 0, 0, 1]}
+    sr, seconds = 44100, 180
+    voice = np.zeros((1, seconds * sr), dtype=np.float32)
+
+    def cold():
+        percussion._cycles.clear()
+        percussion._kits.clear()
+        return percussion.render("samri", pattern, 96, "tar", sr, seconds * sr)
+
+    cold_s, _ = _timed(cold, opts["repeat"])
+    warm_s, bed = _timed(lambda: percussion.render("samri", pattern, 96, "tar", sr, seconds * sr), opts["repeat"])
+    mix_s, _ = _timed(lambda: voice + bed * np.float32(0.25), opts["repeat"])
+    cmd.stdout.write(f"percussion: {seconds} s bed cold {cold_s * 1000:.1f} ms, cached cycle {warm_s * 1000:.1f} ms, "
+                     f"mixed under the voice {mix_s * 1000:.1f} ms")
+
+
+def bench_effects(cmd, opts):
+    import numpy as np
+    sr, seconds = 44100, 180
+    t = np.arange(seconds * sr, dtype=np.float32) / sr
+    # A voice-like test tone: harmonics with a slow swell
+    x = (0.3 * np.sin(2 * np.pi * 180 * t) + 0.15 * np.sin(2 * np.pi * 360 * t)) * (0.6 + 0.4 * np.sin(2 * np.pi * 0.7 * t))
+    x = x.astype(np.float32)[None]
+    stages = [
+        ("time-stretch", lambda: effects.stretch_and_shift(x, 1.1, 0.0)),
+        ("pitch shift", lambda: effects.stretch_and_shift(x, 1.0, 2.0)),
+        ("compress", lambda: effects.compress(x, sr, 0.7)),
+        ("reverb", lambda: effects.reverb(x, sr, 0.25, "najdi")),
+        ("chain", lambda: effects.process(x, sr, 1.1, 2.0, 0.7, 0.25, "najdi")),
+    ]
+    for name, fn in stages:
+        best, _ = _timed(fn, opts["repeat"])
+        cmd.stdout.write(f"effects: {name} on {seconds} s mono in {best * 1000:.0f} ms ({seconds / best:.0f}x real time)")
+
+
+def bench_mixer(cmd, opts):
+    import tracemalloc
+    import numpy as np
+    from shilat.services import audio_io, postprocess
+    sr, seconds = 44100, 600
+    music = np.full((2, 30 * sr), 0.1, dtype=np.float32)
+
+    def voice():
+        for _ in range(seconds):
+            yield np.full((2, sr), 0.2, dtype=np.float32)
+
+    def whole():
+        v = np.concatenate(list(voice()), axis=1)
+        bed = np.tile(music, (1, -(-v.shape[1] // music.shape[1])))[:, :v.shape[1]]
+        return effects.soft_clip(v + bed * np.float32(0.3)).shape[1]
+
+    def streamed():
+        blocks = postprocess.mix_voice_with_music(voice(), audio_io.LoopReader(music), -10.0)
+        return sum(effects.soft_clip(b).shape[1] for b in blocks)
+
+    for name, fn in (("whole track", whole), ("streaming", streamed)):
+        tracemalloc.start()
+        best, _ = _timed(fn, 1)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        cmd.stdout.write(f"mixer: {name} {seconds} s stereo in {best * 1000:.0f} ms, peak {peak / 2**20:.1f} MiB")
+
+
+TARGETS = {
+    "effects": bench_effects,
+    "lexicon": bench_lexicon,
+    "meter": bench_meter,
+    "mixer": bench_mixer,
+    "normalize": bench_normalize,
+    "percussion": bench_percussion,
+}
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmarks for hot paths (synthetic data, no DB or provider calls)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=sorted(TARGETS) + ["all"])
+        parser.add_argument("--rules", type=int, default=0, help="lexicon size (default 50000)")
+        parser.add_argument("--verses", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **opts):
+        targets = sorted(TARGETS) if opts["target"] == "all" else [opts["target"]]
+        for name in targets:
+            if name not in TARGETS:
+                raise CommandError(f"unknown target {name}")
+            TARGETS[name](self, opts)
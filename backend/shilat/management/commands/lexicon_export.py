@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from shilat.models import DialectLexiconRule
+from shilat.services import lexicon_io
+
+
+class Command(BaseCommand):
+    help = "Export DialectLexiconRule rows as CSV/JSONL (streamed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="file path, or - for stdout")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension, csv for stdout")
+        parser.add_argument("--dialect", action="append", help="repeatable; default all dialects")
+        parser.add_argument("--active-only", action="store_true")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        qs = DialectLexiconRule.objects.order_by("dialect", "source")
+        if opts["dialect"]:
+            qs = qs.filter(dialect__in=opts["dialect"])
+        if opts["active_only"]:
+            qs = qs.filter(is_active=True)
+        rows = qs.values(*lexicon_io.FIELDS).iterator(chunk_size=5000)
+        try:
+            if path == "-":
+                self.stdout.ending = ""
+                lexicon_io.write_rows(self.stdout, fmt, rows)
+            else:
+                with open(path, "w", newline="", encoding="utf-8") as f:
+                    lexicon_io.write_rows(f, fmt, rows)
+        except OSError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,48 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from shilat.services import lexicon_io
+
+
+class Command(BaseCommand):
+    help = "Import DialectLexiconRule rows from CSV/JSONL (bulk upsert on dialect+source)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="file path, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--deactivate-missing", action="store_true",
+                            help="deactivate active rules of the imported dialects that are not in the file")
+        parser.add_argument("--dry-run", action="store_true", help="report the diff without writing")
+        parser.add_argument("--show-diff", action="store_true", help="print one line per changed rule")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv" if path.endswith(".csv") else "")
+        if not fmt:
+            raise CommandError("حدد --format (csv أو jsonl)")
+
+        def show(kind, dialect, source, old, new):
+            self.stdout.write(f"{kind:<11} {dialect}:{source}  {old} -> {new}" if kind == "updated" else f"{kind:<11} {dialect}:{source}  {new}")
+
+        started = time.perf_counter()
+        f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        try:
+            report = lexicon_io.upsert_rules(
+                lexicon_io.read_rows(f, fmt),
+                batch_size=opts["batch_size"],
+                dry_run=opts["dry_run"],
+                deactivate_missing=opts["deactivate_missing"],
+                on_change=show if opts["show_diff"] else None,
+            )
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+        for line, error in report["errors"]:
+            self.stderr.write(f"row {line}: {error}")
+        summary = ", ".join(f"{k}={report[k]}" for k in ("created", "updated", "unchanged", "deactivated", "invalid"))
+        prefix = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{summary} in {time.perf_counter() - started:.2f}s"))
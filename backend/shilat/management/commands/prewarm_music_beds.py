@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shilat.models import MusicBed
+from shilat.services import music_beds
+from shilat.services.music_providers import sunoapi
+
+
+class Command(BaseCommand):
+    help = "Request Suno instrumental beds for every (school, rhythm, tempo bucket, style) slot that is short of beds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tempos", help="comma-separated BPM values (default: each style's default_tempo)")
+        parser.add_argument("--styles", help="comma-separated style keys (default: all)")
+        parser.add_argument("--variants", type=int, default=0, help="beds per slot (default MUSIC_BED_VARIANTS)")
+        parser.add_argument("--limit", type=int, default=0, help="stop after requesting this many renders")
+        parser.add_argument("--dry-run", action="store_true", help="list the missing slots without requesting")
+
+    def handle(self, *args, **opts):
+        tempos = [int(t) for t in opts["tempos"].split(",")] if opts["tempos"] else None
+        styles = opts["styles"].split(",") if opts["styles"] else None
+        variants = opts["variants"] or int(getattr(settings, "MUSIC_BED_VARIANTS", 1))
+        requested = full = failed = 0
+        for slot in music_beds.matrix(tempos, styles):
+            # Beds still rendering count as filled: the sweeper records their result
+            have = MusicBed.objects.filter(status__in=("ready", "pending"), **slot).count()
+            if have >= variants:
+                full += 1
+                continue
+            for _ in range(variants - have):
+                if opts["limit"] and requested >= opts["limit"]:
+                    break
+                label = "{school_key}/{rhythm_key}/{tempo_bucket}/{style_key}".format(**slot)
+                if opts["dry_run"]:
+                    self.stdout.write(f"missing {label}")
+                    requested += 1
+                    continue
+                try:
+                    bed = music_beds.generate(slot, sunoapi.PLACEHOLDER_CALLBACK_URL)
+                    self.stdout.write(f"requested {label} task={bed.task_id}")
+                    requested += 1
+                except Exception as e:
+                    self.stderr.write(f"{label}: {e}")
+                    failed += 1
+        prefix = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}requested={requested}, full={full}, failed={failed}"))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from shilat.models import CulturalStyle, ShilaSchool, MelodyTemplate, DialectLexiconRule
+from shilat.models import CulturalStyle, ShilaSchool, MelodyTemplate
+from shilat.services.lexicon_io import upsert_rules
 
 class Command(BaseCommand):
     help = "Seed cultural styles, Shilat schools, rhythms, and dialect lexicon rules."
@@ -10,11 +11,13 @@ class Command(BaseCommand):
             ("hijazi","حجازي","لمسة حجازية وإلقاء أنعم.", 98, 0.25),
             ("khaliji","خليجي","طابع خليجي عام.", 100, 0.26),
         ]
-        for key, name, desc, tempo, rev in styles:
-            CulturalStyle.objects.update_or_create(
-                key=key,
-                defaults={"name_ar":name,"description_ar":desc,"default_tempo":tempo,"default_reverb":rev},
-            )
+        # Runs on every container start: one bulk upsert per table instead of a round-trip per row
+        CulturalStyle.objects.bulk_create(
+            [CulturalStyle(key=key, name_ar=name, description_ar=desc, default_tempo=tempo, default_reverb=rev)
+             for key, name, desc, tempo, rev in styles],
+            update_conflicts=True, unique_fields=["key"],
+            update_fields=["name_ar","description_ar","default_tempo","default_reverb"],
+        )
 
         schools = [
             ("ardah","العرضة","مدرسة العرضة السعودية (حماسية/حربية)."),
@@ -23,12 +26,11 @@ class Command(BaseCommand):
             ("ghazal","غزل","شيلات الغزل/العاطفة (أهدأ)."),
             ("mawal","موال","موال حر (تمطيط وزخارف)."),
         ]
-        school_map = {}
-        for key, name, desc in schools:
-            obj, _ = ShilaSchool.objects.update_or_create(
-                key=key, defaults={"name_ar":name,"description_ar":desc}
-            )
-            school_map[key] = obj
+        ShilaSchool.objects.bulk_create(
+            [ShilaSchool(key=key, name_ar=name, description_ar=desc) for key, name, desc in schools],
+            update_conflicts=True, unique_fields=["key"], update_fields=["name_ar","description_ar"],
+        )
+        school_map = ShilaSchool.objects.in_bulk([k for k, _, _ in schools], field_name="key")
 
         rhythms = [
             ("ardah_main","العرضة (رئيسي)", "ardah", ["kamil","tawil"], {"time_signature":"4/4","phrase_beats":16,"hits":[1,0,1,0,1,1,0,1],"accent":[1,0,0,0,0,1,0,1]}),
@@ -40,16 +42,13 @@ class Command(BaseCommand):
             ("atifi","عاطفي", "ghazal", ["tawil","kamil"], {"time_signature":"4/4","phrase_beats":16,"hits":[1,0,0,1,0,1,0,0],"accent":[1,0,0,0,0,1,0,0]}),
             ("mawal","موال", "mawal", ["tawil","kamil"], {"time_signature":"free","phrase_beats":0,"hits":[],"accent":[]}),
         ]
-        for key, name, school_key, buhur, pattern in rhythms:
-            MelodyTemplate.objects.update_or_create(
-                rhythm_key=key,
-                defaults={
-                    "name_ar":name,
-                    "school": school_map[school_key],
-                    "recommended_buhur":buhur,
-                    "pattern_json":pattern,
-                },
-            )
+        MelodyTemplate.objects.bulk_create(
+            [MelodyTemplate(rhythm_key=key, name_ar=name, school=school_map[school_key],
+                            recommended_buhur=buhur, pattern_json=pattern)
+             for key, name, school_key, buhur, pattern in rhythms],
+            update_conflicts=True, unique_fields=["rhythm_key"],
+            update_fields=["name_ar","school","recommended_buhur","pattern_json"],
+        )
 
         rules = [
             ("najdi","وش","وِش","تقريب نطق"),
@@ -58,10 +57,7 @@ class Command(BaseCommand):
             ("hijazi","فين","فِين","مدّ"),
             ("khaliji","شلونك","شِلونِك","تطبيع"),
         ]
-        for dialect, src, alias, notes in rules:
-            DialectLexiconRule.objects.update_or_create(
-                dialect=dialect, source=src,
-                defaults={"alias":alias,"notes":notes,"is_active":True},
-            )
+        upsert_rules({"dialect":dialect,"source":src,"alias":alias,"notes":notes,"is_active":True}
+                     for dialect, src, alias, notes in rules)
 
         self.stdout.write(self.style.SUCCESS("Seeded styles, schools, rhythms, and lexicon rules."))
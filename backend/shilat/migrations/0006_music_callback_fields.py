@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shilat", "0005_alter_voiceconversionjob_music_provider"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="music_error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="voice_stem",
+            field=models.FileField(blank=True, upload_to="stems/"),
+        ),
+    ]
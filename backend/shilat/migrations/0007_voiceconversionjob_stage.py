@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shilat", "0006_music_callback_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="stage",
+            field=models.CharField(
+                choices=[
+                    ("queued", "queued"),
+                    ("synthesizing", "synthesizing"),
+                    ("awaiting_music", "awaiting_music"),
+                    ("mixing", "mixing"),
+                    ("done", "done"),
+                ],
+                default="queued",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shilat", "0007_voiceconversionjob_stage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="music_stem",
+            field=models.FileField(blank=True, upload_to="stems/"),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shilat", "0008_voiceconversionjob_music_stem"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MusicBed",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("school_key", models.SlugField(blank=True)),
+                ("rhythm_key", models.SlugField()),
+                ("tempo_bucket", models.PositiveIntegerField()),
+                ("style_key", models.SlugField()),
+                ("task_id", models.CharField(blank=True, max_length=128)),
+                ("audio_url", models.URLField(blank=True)),
+                ("audio_file", models.FileField(blank=True, upload_to="music_beds/")),
+                ("status", models.CharField(choices=[("pending", "pending"), ("ready", "ready"), ("failed", "failed")], default="pending", max_length=16)),
+                ("error", models.TextField(blank=True)),
+                ("use_count", models.PositiveIntegerField(default=0)),
+                ("last_used_at", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["rhythm_key", "tempo_bucket", "style_key", "school_key", "status"], name="shilat_musi_rhythm__8ce9d9_idx")],
+            },
+        ),
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="music_bed",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="jobs", to="shilat.musicbed"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shilat", "0009_music_bed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="quality",
+            field=models.CharField(choices=[("final", "final"), ("draft", "draft")], default="final", max_length=8),
+        ),
+        migrations.AddField(
+            model_name="voiceconversionjob",
+            name="voice_key",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shilat", "0010_job_quality"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AudioVariant",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("opus", "opus"), ("aac", "aac"), ("hls", "hls")], max_length=8)),
+                ("bitrate", models.PositiveIntegerField()),
+                ("key", models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ("status", models.CharField(choices=[("pending", "pending"), ("ready", "ready"), ("failed", "failed")], default="pending", max_length=16)),
+                ("file", models.FileField(blank=True, max_length=255, upload_to="variants/")),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("audio", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="variants", to="shilat.generatedaudio")),
+            ],
+            options={
+                "unique_together": {("audio", "kind", "bitrate")},
+            },
+        ),
+    ]
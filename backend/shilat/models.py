@@ -45,10 +45,33 @@ class PoemTextSubmission(models.Model):
     meter_details = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
 
+class MusicBed(models.Model):
+    """خلفية موسيقية مولدة يعاد استخدامها لكل (مدرسة، إيقاع، نطاق سرعة، نمط)."""
+    STATUS = [("pending","pending"),("ready","ready"),("failed","failed")]
+
+    school_key = models.SlugField(blank=True)
+    rhythm_key = models.SlugField()
+    tempo_bucket = models.PositiveIntegerField()
+    style_key = models.SlugField()
+    task_id = models.CharField(max_length=128, blank=True)
+    audio_url = models.URLField(blank=True)
+    audio_file = models.FileField(upload_to="music_beds/", blank=True)
+    status = models.CharField(max_length=16, choices=STATUS, default="pending")
+    error = models.TextField(blank=True)
+    use_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["rhythm_key","tempo_bucket","style_key","school_key","status"])]
+
 class VoiceConversionJob(models.Model):
     STATUS = [("queued","queued"),("running","running"),("succeeded","succeeded"),("failed","failed")]
+    STAGES = [("queued","queued"),("synthesizing","synthesizing"),("awaiting_music","awaiting_music"),
+              ("mixing","mixing"),("done","done")]
     MUSIC_PROVIDERS = [("none","none"),("sunoapi","sunoapi"),("suno_vocal","suno_vocal")]
     VOICE_PROVIDERS = [("elevenlabs","elevenlabs"),("google","google")]
+    QUALITY = [("final","final"),("draft","draft")]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     submission = models.ForeignKey(PoemTextSubmission, on_delete=models.CASCADE)
@@ -64,6 +87,8 @@ class VoiceConversionJob(models.Model):
     intensity = models.FloatField(default=0.7)
     add_percussion = models.BooleanField(default=True)
     intro_adhan_style = models.BooleanField(default=False)
+    # draft: first verses only, cheapest TTS model, no Suno wait, low-bitrate mono preview
+    quality = models.CharField(max_length=8, choices=QUALITY, default="final")
 
     # Music add-on
     add_music = models.BooleanField(default=False)
@@ -71,9 +96,17 @@ class VoiceConversionJob(models.Model):
     music_task_id = models.CharField(max_length=128, blank=True)
     music_audio_url = models.URLField(blank=True)
     music_volume_db = models.FloatField(default=-10.0)
+    music_error = models.TextField(blank=True)
+    music_bed = models.ForeignKey(MusicBed, on_delete=models.SET_NULL, null=True, blank=True, related_name="jobs")
+    # Stage checkpoints: a retried or resumed job skips every stage whose artifact is already here
+    voice_stem = models.FileField(upload_to="stems/", blank=True)
+    music_stem = models.FileField(upload_to="stems/", blank=True)
+    # Hash of everything that shapes the vocal: jobs with the same key share one voice_stem
+    voice_key = models.CharField(max_length=64, blank=True, db_index=True)
 
     provider_job_id = models.CharField(max_length=128, blank=True)
     status = models.CharField(max_length=16, choices=STATUS, default="queued")
+    stage = models.CharField(max_length=16, choices=STAGES, default="queued")
     error_message = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -84,3 +117,23 @@ class GeneratedAudio(models.Model):
     duration_sec = models.FloatField(default=0.0)
     meta_json = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
+
+class AudioVariant(models.Model):
+    """نسخة توصيل من الصوت النهائي (Opus/AAC/HLS) تُولَّد عند أول طلب وتُحفظ لإعادة الاستخدام."""
+    KINDS = [("opus","opus"),("aac","aac"),("hls","hls")]
+    STATUS = [("pending","pending"),("ready","ready"),("failed","failed")]
+
+    audio = models.ForeignKey(GeneratedAudio, on_delete=models.CASCADE, related_name="variants")
+    kind = models.CharField(max_length=8, choices=KINDS)
+    bitrate = models.PositiveIntegerField()
+    # Unguessable storage folder and HLS segment URL component
+    key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS, default="pending")
+    # The encoded file, or the HLS playlist (its segments sit next to it in storage)
+    file = models.FileField(upload_to="variants/", max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [("audio","kind","bitrate")]
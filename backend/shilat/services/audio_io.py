@@ -0,0 +1,338 @@
+import json
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from django.core.files import File
+
+# Post-processing keeps audio as float32 PCM shaped (channels, samples): each input is decoded once by an
+# ffmpeg subprocess and the result is encoded once, straight into a temp file that storage streams from.
+_CODECS = {
+    "mp3": ["-c:a", "libmp3lame"],
+    "wav": ["-c:a", "pcm_s16le"],
+    "opus": ["-c:a", "libopus", "-vbr", "on"],
+    # MP4 with the index up front, so playback can start before the download finishes
+    "aac": ["-c:a", "aac", "-movflags", "+faststart"],
+}
+# Container extension per format where it differs from the format key
+EXTENSIONS = {"aac": "m4a"}
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg", "wav": "audio/wav", "opus": "audio/ogg", "ogg": "audio/ogg", "aac": "audio/mp4",
+    "m4a": "audio/mp4", "m3u8": "application/vnd.apple.mpegurl", "ts": "video/mp2t",
+}
+
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 25: (11025, 12000, 8000)}
+
+
+def _ffmpeg() -> str:
+    return getattr(settings, "FFMPEG_BINARY", "ffmpeg")
+
+
+def _frame_header(data: bytes, pos: int):
+    """(version, layer, bitrate bps, sample rate, channels, frame length) of the MPEG audio frame at pos, or None."""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = {3: 1, 2: 2, 0: 25}.get((b1 >> 3) & 3)
+    layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 3)
+    br_idx, sr_idx = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer is None or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    bitrate = _MP3_BITRATES[(min(version, 2), layer)][br_idx] * 1000
+    sr = _MP3_RATES[version][sr_idx]
+    pad = (b2 >> 1) & 1
+    if layer == 1:
+        length = (12 * bitrate // sr + pad) * 4
+    else:
+        length = (144 if version == 1 or layer == 2 else 72) * bitrate // sr + pad
+    return version, layer, bitrate, sr, 1 if b3 >> 6 == 3 else 2, length
+
+
+def mp3_info(data: bytes):
+    """{"sample_rate", "channels", "duration"} from MP3 frame headers (Xing/Info/VBRI frame count, else CBR size),
+    without decoding; None when data is not MP3."""
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    pos = data.find(b"\xff", start)
+    while 0 <= pos < min(len(data), start + 64 * 1024):
+        header = _frame_header(data, pos)
+        # A real sync is followed by another frame header (guards against 0xFF bytes in tags)
+        if header and (pos + header[5] >= len(data) or _frame_header(data, pos + header[5])):
+            break
+        pos = data.find(b"\xff", pos + 1)
+    else:
+        return None
+    version, layer, bitrate, sr, channels, _ = header
+    samples_per_frame = 384 if layer == 1 else (1152 if version == 1 or layer == 2 else 576)
+    side = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    frames = None
+    tag = data[pos + 4 + side:pos + 8 + side]
+    if tag in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[pos + 8 + side:pos + 12 + side])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", data[pos + 12 + side:pos + 16 + side])[0]
+    elif data[pos + 36:pos + 40] == b"VBRI":
+        frames = struct.unpack(">I", data[pos + 50:pos + 54])[0]
+    if frames:
+        duration = frames * samples_per_frame / sr
+    else:
+        end = len(data) - (128 if data[-128:-125] == b"TAG" else 0)
+        duration = (end - pos) * 8 / bitrate
+    return {"sample_rate": sr, "channels": channels, "duration": duration}
+
+
+def probe(data: bytes) -> dict:
+    """Sample rate, channels and duration without decoding: MP3 frame headers, else ffprobe container metadata."""
+    info = mp3_info(data)
+    if info:
+        return info
+    proc = subprocess.run(
+        [getattr(settings, "FFPROBE_BINARY", "ffprobe"), "-v", "error", "-select_streams", "a:0",
+         "-show_entries", "stream=sample_rate,channels:format=duration", "-of", "json", "pipe:0"],
+        input=data, capture_output=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"تعذر قراءة الملف الصوتي: {proc.stderr.decode(errors='replace').strip()}")
+    meta = json.loads(proc.stdout or b"{}")
+    stream = (meta.get("streams") or [{}])[0]
+    return {
+        "sample_rate": int(stream.get("sample_rate") or 44100),
+        "channels": int(stream.get("channels") or 1),
+        "duration": float((meta.get("format") or {}).get("duration") or 0.0),
+    }
+
+
+def decode(data: bytes, sample_rate: int | None = None, channels: int | None = None):
+    """(float32 PCM (channels, samples), sample rate); defaults to the input's own rate and channel count."""
+    if sample_rate is None or channels is None:
+        info = probe(data)
+        sample_rate = sample_rate or info["sample_rate"]
+        channels = channels or info["channels"]
+    proc = subprocess.run(
+        [_ffmpeg(), "-v", "error", "-i", "pipe:0", "-f", "f32le", "-ac", str(channels), "-ar", str(sample_rate), "pipe:1"],
+        input=data, capture_output=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"تعذر فك ترميز الصوت: {proc.stderr.decode(errors='replace').strip()}")
+    pcm = np.frombuffer(proc.stdout, dtype=np.float32)
+    return pcm[: len(pcm) - len(pcm) % channels].reshape(-1, channels).T, sample_rate
+
+
+class Decoder:
+    """Streaming decode: read(n) returns float32 (channels, <= n), empty once the input is exhausted.
+
+    src is bytes (fed to ffmpeg's stdin from a thread) or a local path; loop=True repeats a path input
+    forever with -stream_loop, so a short music bed can cover a track of any length in constant memory.
+    """
+
+    def __init__(self, src, sample_rate: int, channels: int, loop: bool = False):
+        self.channels = channels
+        self.frame_bytes = 4 * channels
+        from_pipe = isinstance(src, (bytes, bytearray, memoryview))
+        if loop and from_pipe:
+            raise ValueError("looped decoding needs a file path")
+        cmd = [_ffmpeg(), "-v", "error"] + (["-stream_loop", "-1"] if loop else [])
+        cmd += ["-i", "pipe:0" if from_pipe else str(src), "-f", "f32le", "-ac", str(channels), "-ar", str(sample_rate),
+                "pipe:1"]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if from_pipe else subprocess.DEVNULL,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._feeder = None
+        if from_pipe:
+            self._feeder = threading.Thread(target=self._feed, args=(src,), daemon=True)
+            self._feeder.start()
+
+    def _feed(self, data):
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def read(self, n: int) -> np.ndarray:
+        want = n * self.frame_bytes
+        chunks, got = [], 0
+        while got < want:
+            chunk = self.proc.stdout.read(want - got)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            got += len(chunk)
+        if not got and self.proc.poll() not in (None, 0):
+            raise RuntimeError(f"تعذر فك ترميز الصوت: {self.proc.stderr.read().decode(errors='replace').strip()}")
+        data = b"".join(chunks)
+        pcm = np.frombuffer(data[:len(data) - len(data) % self.frame_bytes], dtype=np.float32)
+        return pcm.reshape(-1, self.channels).T
+
+    def blocks(self, n: int):
+        while True:
+            block = self.read(n)
+            if not block.shape[1]:
+                return
+            yield block
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+
+
+class LoopReader:
+    """read(n) over an in-memory (channels, samples) array, repeating it when loop is set."""
+
+    def __init__(self, pcm: np.ndarray, loop: bool = True):
+        self.pcm = pcm
+        self.loop = loop
+        self.pos = 0
+
+    def read(self, n: int) -> np.ndarray:
+        size = self.pcm.shape[1]
+        if not size or (not self.loop and self.pos >= size):
+            return self.pcm[:, :0]
+        if not self.loop:
+            out = self.pcm[:, self.pos:self.pos + n]
+        else:
+            out = np.take(self.pcm, np.arange(self.pos, self.pos + n) % size, axis=1)
+        self.pos += out.shape[1]
+        return out
+
+    def blocks(self, n: int):
+        while True:
+            block = self.read(n)
+            if not block.shape[1]:
+                return
+            yield block
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def local_path(field_file):
+    """A local filesystem path for a stored file: its own path when storage is local, else a temp copy."""
+    try:
+        path = field_file.path
+    except (NotImplementedError, AttributeError):
+        path = None
+    if path and os.path.exists(path):
+        yield path
+        return
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(field_file.name)[1])
+    try:
+        with os.fdopen(fd, "wb") as out, field_file.open("rb") as src:
+            for chunk in src.chunks():
+                out.write(chunk)
+        yield tmp
+    finally:
+        os.unlink(tmp)
+
+
+class EncodedFile(File):
+    """Encoded output in a temp file; storage.save() streams it in chunks. Call cleanup() once saved."""
+
+    def __init__(self, path: str, name: str, duration: float):
+        super().__init__(open(path, "rb"), name=name)
+        self.path = path
+        self.duration = duration
+
+    def cleanup(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Encoder:
+    """Incremental encoder: write() float32 blocks of (channels, samples) as they are produced, then close()."""
+
+    def __init__(self, sample_rate: int, channels: int, fmt: str = "mp3", bitrate: str = "192k"):
+        if fmt not in _CODECS:
+            raise ValueError(f"صيغة غير مدعومة: {fmt}")
+        self.sample_rate, self.channels, self.fmt = sample_rate, channels, fmt
+        self.samples = 0
+        fd, self.path = tempfile.mkstemp(suffix=f".{EXTENSIONS.get(fmt, fmt)}")
+        os.close(fd)
+        codec = _CODECS[fmt] + ([] if fmt == "wav" else ["-b:a", bitrate])
+        self.proc = subprocess.Popen(
+            [_ffmpeg(), "-v", "error", "-y", "-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+             *codec, self.path],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+
+    def write(self, block: np.ndarray):
+        interleaved = np.ascontiguousarray(block.T, dtype=np.float32)
+        self.proc.stdin.write(memoryview(interleaved).cast("B"))
+        self.samples += block.shape[1]
+
+    def close(self, name: str) -> EncodedFile:
+        self.proc.stdin.close()
+        err = self.proc.stderr.read()
+        if self.proc.wait():
+            os.unlink(self.path)
+            raise RuntimeError(f"تعذر ترميز الصوت: {err.decode(errors='replace').strip()}")
+        return EncodedFile(self.path, name, self.samples / float(self.sample_rate))
+
+    def abort(self):
+        self.proc.kill()
+        self.proc.wait()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def encode(pcm: np.ndarray, sample_rate: int, name: str, fmt: str = "mp3", bitrate: str = "192k") -> EncodedFile:
+    enc = Encoder(sample_rate, pcm.shape[0], fmt, bitrate)
+    try:
+        # Interleaved in one-second blocks: never a second full-length copy
+        for i in range(0, pcm.shape[1], sample_rate):
+            enc.write(pcm[:, i:i + sample_rate])
+    except BaseException:
+        enc.abort()
+        raise
+    return enc.close(name)
+
+
+def transcode(src: str, fmt: str, bitrate: str, name: str, duration: float = 0.0) -> EncodedFile:
+    """File-to-file conversion of a stored track (no PCM through Python); duration is the source's."""
+    if fmt not in _CODECS:
+        raise ValueError(f"صيغة غير مدعومة: {fmt}")
+    fd, path = tempfile.mkstemp(suffix=f".{EXTENSIONS.get(fmt, fmt)}")
+    os.close(fd)
+    codec = _CODECS[fmt] + ([] if fmt == "wav" else ["-b:a", bitrate])
+    proc = subprocess.run([_ffmpeg(), "-v", "error", "-y", "-i", str(src), "-vn", *codec, path], capture_output=True)
+    if proc.returncode:
+        os.unlink(path)
+        raise RuntimeError(f"تعذر تحويل الصوت: {proc.stderr.decode(errors='replace').strip()}")
+    return EncodedFile(path, name, duration)
+
+
+def segment_hls(src: str, out_dir: str, bitrate: str, segment_sec: int = 6) -> list[str]:
+    """Cuts a stored track into AAC MPEG-TS segments plus a VOD playlist in out_dir.
+
+    Returns the file names, playlist first; the playlist refers to the segments by bare file name.
+    """
+    playlist = os.path.join(out_dir, "index.m3u8")
+    proc = subprocess.run(
+        [_ffmpeg(), "-v", "error", "-y", "-i", str(src), "-vn", "-c:a", "aac", "-b:a", bitrate,
+         "-f", "hls", "-hls_time", str(segment_sec), "-hls_playlist_type", "vod",
+         "-hls_segment_filename", os.path.join(out_dir, "seg%04d.ts"), playlist],
+        capture_output=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"تعذر تقطيع الصوت: {proc.stderr.decode(errors='replace').strip()}")
+    return ["index.m3u8"] + sorted(n for n in os.listdir(out_dir) if n.endswith(".ts"))
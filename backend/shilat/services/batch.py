@@ -0,0 +1,68 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from shilat.services.meter import detect_bahr
+from shilat.services.normalize import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Poem analysis (clean + meter detection) is pure CPU work on plain strings, so batches are spread over
+# a per-process pool of spawned interpreters (no fork of the threaded web/worker process, no Django setup).
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def analyze(raw: str) -> dict:
+    doc = normalize_text(raw)
+    bahr, conf, details = detect_bahr(doc)
+    return {"cleaned_text": doc.cleaned, "meter_guess": bahr, "meter_confidence": conf, "meter_details": details}
+
+
+def _analyze_safe(raw: str) -> dict:
+    try:
+        return analyze(raw)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _workers() -> int:
+    configured = getattr(settings, "BATCH_ANALYZE_WORKERS", None)
+    if configured is None:
+        return min(4, os.cpu_count() or 1)
+    return int(configured)
+
+
+def _get_pool(workers: int):
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def analyze_many(texts: list) -> list:
+    """analyze() for every text, in order; failures come back as {"error": ...} entries."""
+    workers = _workers()
+    if workers <= 1 or len(texts) < getattr(settings, "BATCH_POOL_MIN_POEMS", 8):
+        return [_analyze_safe(t) for t in texts]
+    try:
+        chunksize = max(1, len(texts) // (workers * 4))
+        return list(_get_pool(workers).map(_analyze_safe, texts, chunksize=chunksize))
+    except BrokenProcessPool as e:
+        logger.warning("batch analyze pool broke, running inline: %s", e)
+        _reset_pool()
+        return [_analyze_safe(t) for t in texts]
@@ -1,14 +1,100 @@
 import re
+import threading
+from django.core.cache import cache
 from shilat.models import DialectLexiconRule
+from shilat.services.normalize import WORD_RE, NormalizedText
 
-_word_re = re.compile(r"[\w\u0600-\u06FF]+")
-
-def apply_dialect_lexicon(text: str, dialect: str) -> str:
-    rules = DialectLexiconRule.objects.filter(dialect=dialect, is_active=True).values_list("source","alias")
-    if not rules:
-        return text
-    mapping = {src:alias for src,alias in rules}
-    def repl(m):
-        w = m.group(0)
-        return mapping.get(w, w)
-    return _word_re.sub(repl, text)
+# Words of a phrase rule may only be separated by whitespace within one line: a rule never spans verses
+_gap_re = re.compile(r"[^\S\n]+")
+
+# Compiled matchers are kept per process and rebuilt when the dialect's version stamp (shared
+# cache, bumped by the DialectLexiconRule signals or bump_version()) no longer matches.
+_matchers = {}
+_lock = threading.Lock()
+
+
+def _version_key(dialect: str) -> str:
+    return f"lexicon:version:{dialect}"
+
+
+def lexicon_version(dialect: str) -> int:
+    return cache.get_or_set(_version_key(dialect), 1, timeout=None)
+
+
+def bump_version(dialect: str):
+    """Invalidates compiled matchers everywhere; call it after bulk writes that skip model signals."""
+    try:
+        cache.incr(_version_key(dialect))
+    except ValueError:
+        cache.set(_version_key(dialect), 2, timeout=None)
+
+
+class LexiconMatcher:
+    """Token trie over rule sources; apply() replaces the longest matching phrase at each word, in one pass."""
+
+    def __init__(self, rules):
+        self.root = {}
+        self.size = 0
+        for source, alias in rules:
+            words = WORD_RE.findall(source or "")
+            if not words:
+                continue
+            node = self.root
+            for w in words[:-1]:
+                node = node.setdefault(w, [None, {}])[1]
+            node.setdefault(words[-1], [None, {}])[0] = alias
+            self.size += 1
+
+    def apply(self, text: str, tokens: list | None = None) -> str:
+        """tokens: (word, start, end) of text, e.g. NormalizedText.tokens, to skip tokenizing again."""
+        if not self.root or not text:
+            return text
+        if tokens is None:
+            tokens = [(m.group(0), m.start(), m.end()) for m in WORD_RE.finditer(text)]
+        out = []
+        last = 0
+        i, n = 0, len(tokens)
+        while i < n:
+            node = self.root
+            match_end, alias = -1, None
+            j = i
+            while j < n:
+                if j > i and not _gap_re.fullmatch(text, tokens[j - 1][2], tokens[j][1]):
+                    break
+                entry = node.get(tokens[j][0])
+                if entry is None:
+                    break
+                if entry[0] is not None:
+                    match_end, alias = j, entry[0]
+                node = entry[1]
+                j += 1
+            if alias is None:
+                i += 1
+                continue
+            out.append(text[last:tokens[i][1]])
+            out.append(alias)
+            last = tokens[match_end][2]
+            i = match_end + 1
+        if not out:
+            return text
+        out.append(text[last:])
+        return "".join(out)
+
+
+def get_matcher(dialect: str) -> LexiconMatcher:
+    version = lexicon_version(dialect)
+    entry = _matchers.get(dialect)
+    if entry is None or entry[0] != version:
+        with _lock:
+            entry = _matchers.get(dialect)
+            if entry is None or entry[0] != version:
+                rules = DialectLexiconRule.objects.filter(dialect=dialect, is_active=True).values_list("source", "alias")
+                entry = (version, LexiconMatcher(rules.iterator()))
+                _matchers[dialect] = entry
+    return entry[1]
+
+
+def apply_dialect_lexicon(text, dialect: str) -> str:
+    if isinstance(text, NormalizedText):
+        return get_matcher(dialect).apply(text.cleaned, text.tokens)
+    return get_matcher(dialect).apply(text)
@@ -0,0 +1,221 @@
+import json
+import logging
+import queue
+import threading
+import time
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+# Job progress is pushed, not polled. Pipeline stages call publish(), which merges the change into the
+# job's snapshot (owner, status, stage, progress, seq) and announces it on Redis pub/sub. Readers start
+# from the snapshot and wait on one pattern subscription per process, so neither database queries nor
+# Redis connections grow with the number of jobs being watched.
+# With Redis the snapshot is a hash updated by one script (fields merged, seq HINCRBY'd), so stages
+# publishing in parallel never overwrite each other; without it, the cache holds the snapshot.
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "shilat:job:"
+# Progress (percent) reached when a stage starts; "voice_ready" is the vocal stem being saved
+PROGRESS = {"synthesizing": 5, "voice_ready": 40, "awaiting_music": 50, "mixing": 80, "done": 100}
+_FIELDS = ("status", "stage", "error_message", "has_audio", "user_id")
+# While subscribed, the snapshot is still re-read this often in case a message was missed
+_RECHECK_SEC = 5.0
+# KEYS: snapshot hash, channel. ARGV: job_id, stage progress (-1: none), milestone progress, "1" when the
+# job succeeded, TTL, then field/value pairs (values JSON, as every hash value is).
+_MERGE = """
+local key = KEYS[1]
+redis.call("HSETNX", key, "job_id", ARGV[1])
+redis.call("HSETNX", key, "progress", 0)
+for i = 6, #ARGV, 2 do
+  redis.call("HSET", key, ARGV[i], ARGV[i + 1])
+end
+local progress = tonumber(redis.call("HGET", key, "progress"))
+if tonumber(ARGV[2]) >= 0 then
+  progress = tonumber(ARGV[2])
+end
+progress = math.max(progress, tonumber(ARGV[3]))
+if ARGV[4] == "1" and redis.call("HGET", key, "stage") == '"done"' then
+  progress = 100
+end
+redis.call("HSET", key, "progress", progress)
+local seq = redis.call("HINCRBY", key, "seq", 1)
+redis.call("EXPIRE", key, ARGV[5])
+redis.call("PUBLISH", KEYS[2], seq)
+return seq
+"""
+
+
+def _key(job_id) -> str:
+    return f"job-events:{job_id}"
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "JOB_EVENTS_TTL_SEC", 86400))
+
+
+def _decode(raw: dict):
+    return {k.decode(): json.loads(v) for k, v in raw.items()} or None
+
+
+def snapshot(job_id):
+    """The job's latest state, or None when nothing is known (or Redis cannot be reached)."""
+    client = _redis()
+    if client is None:
+        return cache.get(_key(job_id))
+    try:
+        return _decode(client.hgetall(_key(job_id)))
+    except redis.RedisError as e:
+        logger.warning("job event %s not read: %s", job_id, e)
+        return None
+
+
+def finished(state) -> bool:
+    """True once nothing more will happen to the job (a remix reopens a succeeded job at stage "mixing")."""
+    return state.get("status") == "failed" or (state.get("status") == "succeeded" and state.get("stage") == "done")
+
+
+def public(state) -> dict:
+    return {k: v for k, v in state.items() if k != "user_id"}
+
+
+def _redis():
+    url = getattr(settings, "JOB_EVENTS_REDIS_URL", "")
+    if not url:
+        return None
+    with _hub.lock:
+        if url not in _clients:
+            _clients[url] = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=2)
+            _merges[url] = _clients[url].register_script(_MERGE)
+        return _clients[url]
+
+
+def publish(job_id, milestone: str = "", **fields) -> None:
+    """Merges fields (and a PROGRESS milestone) into the job's snapshot and announces it; never raises."""
+    try:
+        client = _redis()
+        if client is not None:
+            pairs = [x for k, v in fields.items() if k in _FIELDS for x in (k, json.dumps(v))]
+            _merges[settings.JOB_EVENTS_REDIS_URL](keys=[_key(job_id), f"{CHANNEL_PREFIX}{job_id}"], args=[
+                json.dumps(str(job_id)), PROGRESS.get(fields["stage"], -1) if "stage" in fields else -1,
+                PROGRESS[milestone] if milestone else 0, int(fields.get("status") == "succeeded"), _ttl(), *pairs,
+            ])
+            return
+        state = cache.get(_key(job_id)) or {"job_id": str(job_id), "progress": 0, "seq": 0}
+        state.update({k: v for k, v in fields.items() if k in _FIELDS})
+        if "stage" in fields:
+            state["progress"] = PROGRESS.get(fields["stage"], state["progress"])
+        if milestone:
+            state["progress"] = max(state["progress"], PROGRESS[milestone])
+        if fields.get("status") == "succeeded" and state.get("stage") == "done":
+            state["progress"] = 100
+        state["seq"] += 1
+        cache.set(_key(job_id), state, _ttl())
+    except Exception as e:
+        # Progress events are best effort: the pipeline never fails over them
+        logger.warning("job event %s not published: %s", job_id, e)
+
+
+def seed(job, user_id) -> dict:
+    """Builds the snapshot of a job from the database (cache miss); an existing snapshot is kept."""
+    state = {
+        "job_id": str(job.id), "user_id": user_id, "status": job.status, "stage": job.stage,
+        "error_message": job.error_message, "has_audio": hasattr(job, "generatedaudio"), "seq": 0,
+    }
+    state["progress"] = 100 if finished(state) else PROGRESS.get(job.stage, 0)
+    client = _redis()
+    if client is None:
+        cached = cache.get(_key(job.id))
+        if cached:
+            cached["user_id"] = user_id
+            state = cached
+        cache.set(_key(job.id), state, _ttl())
+        return state
+    key = _key(job.id)
+    try:
+        # Fields the pipeline already published win over the database's
+        pipe = client.pipeline()
+        for k, v in state.items():
+            pipe.hsetnx(key, k, json.dumps(v))
+        pipe.hset(key, "user_id", json.dumps(user_id))
+        pipe.expire(key, _ttl())
+        pipe.hgetall(key)
+        return _decode(pipe.execute()[-1])
+    except redis.RedisError as e:
+        logger.warning("job event %s not seeded: %s", job.id, e)
+        return state
+
+
+class _Hub:
+    """One psubscribe per process, fanned out to the requests waiting on each job."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = {}
+        self.thread = None
+
+    def watch(self, job_id, url) -> queue.Queue:
+        q = queue.Queue()
+        with self.lock:
+            self.waiters.setdefault(str(job_id), set()).add(q)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._listen, args=(url,), name="job-events", daemon=True)
+                self.thread.start()
+        return q
+
+    def unwatch(self, job_id, q) -> None:
+        with self.lock:
+            waiting = self.waiters.get(str(job_id), set())
+            waiting.discard(q)
+            if not waiting:
+                self.waiters.pop(str(job_id), None)
+
+    def _listen(self, url) -> None:
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(url).pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                for message in pubsub.listen():
+                    job_id = message["channel"].decode()[len(CHANNEL_PREFIX):]
+                    with self.lock:
+                        waiting = list(self.waiters.get(job_id, ()))
+                    for q in waiting:
+                        q.put_nowait(True)
+            except Exception as e:
+                logger.warning("job events subscription lost: %s", e)
+                time.sleep(1)
+
+
+_hub = _Hub()
+_clients = {}
+_merges = {}
+
+
+def wait(job_id, since: int, timeout: float):
+    """The job's snapshot once its seq passes since, or None after timeout.
+
+    Woken by pub/sub; without JOB_EVENTS_REDIS_URL the cached snapshot is polled every JOB_EVENTS_POLL_SEC.
+    """
+    url = getattr(settings, "JOB_EVENTS_REDIS_URL", "")
+    q = _hub.watch(job_id, url) if url else None
+    step = _RECHECK_SEC if q else float(getattr(settings, "JOB_EVENTS_POLL_SEC", 1.0))
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            state = snapshot(job_id)
+            if state and state["seq"] > since:
+                return state
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            if q is None:
+                time.sleep(min(left, step))
+                continue
+            try:
+                q.get(timeout=min(left, step))
+            except queue.Empty:
+                pass
+    finally:
+        if q is not None:
+            _hub.unwatch(job_id, q)
@@ -0,0 +1,81 @@
+import os
+import threading
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Per-provider HTTP sessions: pooled keep-alive connections plus jittered exponential backoff on
+# 429/5xx that honours Retry-After. Overridable per provider through settings.PROVIDER_HTTP.
+# Only idempotent methods are retried by default: a provider whose POSTs are safe to repeat opts in
+# through its "retry_methods" (billed requests such as TTS synthesis must not).
+DEFAULTS = {
+    "pool_connections": 4,
+    "pool_maxsize": 16,
+    "retries": 3,
+    "backoff_factor": 0.5,
+    "backoff_max": 20.0,
+    "backoff_jitter": 0.5,
+    "retry_statuses": (429, 500, 502, 503, 504),
+    "retry_methods": ("GET", "HEAD", "OPTIONS"),
+    "timeouts": {"default": 30},
+}
+
+_lock = threading.Lock()
+_sessions = {}
+
+
+def provider_config(provider: str) -> dict:
+    cfg = dict(DEFAULTS)
+    cfg.update((getattr(settings, "PROVIDER_HTTP", {}) or {}).get("default", {}))
+    cfg.update((getattr(settings, "PROVIDER_HTTP", {}) or {}).get(provider, {}))
+    cfg["timeouts"] = {**DEFAULTS["timeouts"], **cfg.get("timeouts", {})}
+    return cfg
+
+
+def _build(provider: str) -> requests.Session:
+    cfg = provider_config(provider)
+    retry = Retry(
+        total=cfg["retries"],
+        connect=cfg["retries"],
+        read=cfg["retries"],
+        status=cfg["retries"],
+        backoff_factor=cfg["backoff_factor"],
+        backoff_max=cfg["backoff_max"],
+        backoff_jitter=cfg["backoff_jitter"],
+        status_forcelist=cfg["retry_statuses"],
+        allowed_methods=frozenset(cfg["retry_methods"]),
+        respect_retry_after_header=True,
+        # Hand the last response back so callers keep using raise_for_status()
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=cfg["pool_connections"], pool_maxsize=cfg["pool_maxsize"], max_retries=retry)
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def session(provider: str) -> requests.Session:
+    """Shared session for a provider, created lazily once per process (never inherited across fork)."""
+    key = (os.getpid(), provider)
+    s = _sessions.get(key)
+    if s is None:
+        with _lock:
+            s = _sessions.get(key)
+            if s is None:
+                s = _sessions[key] = _build(provider)
+    return s
+
+
+def timeout(provider: str, op: str = "default"):
+    timeouts = provider_config(provider)["timeouts"]
+    return timeouts.get(op, timeouts["default"])
+
+
+def reset():
+    """Drops every pooled session (tests / settings changes)."""
+    with _lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
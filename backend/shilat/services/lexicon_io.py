@@ -0,0 +1,141 @@
+import csv
+import json
+from itertools import islice
+from django.db import transaction
+from shilat.models import DialectLexiconRule
+from shilat.services.dialect import bump_version
+
+FIELDS = ("dialect", "source", "alias", "notes", "is_active")
+DIALECTS = {k for k, _ in DialectLexiconRule.DIALECT_CHOICES}
+_MAX_LEN = {f.name: f.max_length for f in DialectLexiconRule._meta.fields if getattr(f, "max_length", None)}
+_FALSE = {"0", "false", "no", "n", "off", ""}
+
+
+def _bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return True
+    return str(value).strip().lower() not in _FALSE
+
+
+def read_rows(f, fmt: str):
+    """Streams rule dicts from an open CSV (with header) or JSONL file."""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+    elif fmt == "jsonl":
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f"صيغة غير مدعومة: {fmt}")
+
+
+def write_rows(f, fmt: str, rows):
+    if fmt == "csv":
+        w = csv.writer(f)
+        w.writerow(FIELDS)
+        for r in rows:
+            w.writerow([r[k] for k in FIELDS])
+    elif fmt == "jsonl":
+        for r in rows:
+            f.write(json.dumps(dict(zip(FIELDS, (r[k] for k in FIELDS))), ensure_ascii=False) + "\n")
+    else:
+        raise ValueError(f"صيغة غير مدعومة: {fmt}")
+
+
+def _clean(row: dict):
+    rule = {
+        "dialect": (row.get("dialect") or "").strip(),
+        "source": (row.get("source") or "").strip(),
+        "alias": (row.get("alias") or "").strip(),
+        "notes": (row.get("notes") or "").strip(),
+        "is_active": _bool(row.get("is_active")),
+    }
+    if rule["dialect"] not in DIALECTS:
+        return None, f"لهجة غير معروفة: {rule['dialect']!r}"
+    if not rule["source"] or not rule["alias"]:
+        return None, "source و alias مطلوبان"
+    for name in ("source", "alias", "notes"):
+        if len(rule[name]) > _MAX_LEN[name]:
+            return None, f"{name} أطول من {_MAX_LEN[name]} حرفًا"
+    return rule, ""
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def upsert_rules(rows, batch_size: int = 2000, dry_run: bool = False, deactivate_missing: bool = False,
+                 on_change=None) -> dict:
+    """Bulk upsert on (dialect, source); only new or changed rows are written.
+
+    Returns counts plus the first few invalid rows; with deactivate_missing, active rules of the
+    imported dialects that are absent from the input are deactivated. on_change(kind, dialect, source,
+    old_alias, new_alias) is called for every created/updated/deactivated rule.
+    """
+    report = {"created": 0, "updated": 0, "unchanged": 0, "deactivated": 0, "invalid": 0, "errors": []}
+    seen = {}
+    with transaction.atomic():
+        for batch in _batches(enumerate(rows, start=1), batch_size):
+            incoming = {}
+            for line, row in batch:
+                rule, error = _clean(row)
+                if rule is None:
+                    report["invalid"] += 1
+                    if len(report["errors"]) < 20:
+                        report["errors"].append((line, error))
+                    continue
+                # Later rows win over earlier duplicates
+                incoming[(rule["dialect"], rule["source"])] = rule
+                seen.setdefault(rule["dialect"], set()).add(rule["source"])
+            existing = {}
+            for dialect in {d for d, _ in incoming}:
+                qs = DialectLexiconRule.objects.filter(
+                    dialect=dialect, source__in=[s for d, s in incoming if d == dialect]
+                ).values_list("source", "alias", "notes", "is_active")
+                for source, alias, notes, is_active in qs:
+                    existing[(dialect, source)] = (alias, notes, is_active)
+            changed = []
+            for key, rule in incoming.items():
+                old = existing.get(key)
+                if old is None:
+                    kind = "created"
+                elif old != (rule["alias"], rule["notes"], rule["is_active"]):
+                    kind = "updated"
+                else:
+                    report["unchanged"] += 1
+                    continue
+                report[kind] += 1
+                if on_change:
+                    on_change(kind, key[0], key[1], old[0] if old else "", rule["alias"])
+                changed.append(DialectLexiconRule(**rule))
+            if changed and not dry_run:
+                DialectLexiconRule.objects.bulk_create(
+                    changed,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=["dialect", "source"],
+                    update_fields=["alias", "notes", "is_active"],
+                )
+        if deactivate_missing:
+            for dialect, sources in seen.items():
+                active = DialectLexiconRule.objects.filter(dialect=dialect, is_active=True).values_list("id", "source", "alias")
+                missing = []
+                for pk, source, alias in active.iterator():
+                    if source not in sources:
+                        missing.append(pk)
+                        if on_change:
+                            on_change("deactivated", dialect, source, alias, alias)
+                report["deactivated"] += len(missing)
+                if not dry_run:
+                    for ids in _batches(missing, batch_size):
+                        DialectLexiconRule.objects.filter(id__in=ids).update(is_active=False)
+    if not dry_run and (report["created"] or report["updated"] or report["deactivated"]):
+        # bulk_create/update skip model signals: invalidate compiled matchers explicitly
+        for dialect in seen:
+            bump_version(dialect)
+    return report
@@ -11,6 +11,19 @@ METER_TO_RHYTHM = {
     "basit": ["samri", "khammari"],
     "mutaqarib": ["dahha", "hamasi"],
     "rajaz": ["dahha", "hamasi"],
+    "mutadarik": ["dahha", "hamasi"],
+    "wafir": ["ardah_main", "samri"],
+    "ramal": ["samri", "atifi"],
+    "khafif": ["samri", "atifi", "modih"],
+    "madid": ["samri", "atifi"],
+    "hazaj": ["dahha", "modih"],
+    "sari": ["samri", "khammari"],
+    "munsarih": ["samri", "modih"],
+    "mujtath": ["atifi", "modih"],
+    "mudari": ["atifi"],
+    "muqtadab": ["atifi"],
+    "mashub": ["samri", "khammari"],
+    "hilali": ["ardah_main", "samri"],
 }
 
 def suggest_rhythms(meter_guess: str):
@@ -1,95 +1,446 @@
 import re
-from dataclasses import dataclass
-from .text_prep import strip_diacritics
+import threading
+from collections import OrderedDict
+import numpy as np
+from .normalize import NormalizedText, plain, strip_diacritics
 
 AR_LETTERS = re.compile(r"[\u0621-\u064A]+")
-PUNCT = re.compile(r"[\u060C\u061B\u061F\!\?\,\.;:…\-]+")
-SPACES = re.compile(r"\s+")
-
-LONG_VOWELS = set("اويآ")
-HAMZA_FORMS = set("أإؤئء")
-
-@dataclass
-class MeterResult:
-    bahr: str
-    score: float
-    pattern: str
-
-BAHR_PATTERNS = {
-    "tawil":   "--U--U--|--U--U--",
-    "kamil":   "--U--U--|--U--U--",
-    "basit":   "-U--U--|-U--U--",
-    "mutaqarib":"-U--U--U--U--U-",
-    "rajaz":   "-U--U--U--U-",
+# Hemistich separators inside one line: "*", "…"/"...", a tab or a wide gap
+_HEMISTICH_SPLIT = re.compile(r"\s*(?:\*|…|\.\.\.|\t|\s{3,})\s*")
+
+FATHA, DAMMA, KASRA, SUKUN, SHADDA = "\u064E", "\u064F", "\u0650", "\u0652", "\u0651"
+HARAKAT = {FATHA, DAMMA, KASRA}
+TANWEEN = {"\u064B", "\u064C", "\u064D"}
+_MARKS = HARAKAT | TANWEEN | {SUKUN, SHADDA}
+_MARK_RE = re.compile(r"[\u064B-\u0652]")
+
+# Tafa'il ("-" long syllable, "U" short): canonical form and the permitted zihaf variants.
+FEET = {
+    "fauulun": ("U--", ["U-U"]),                          # فعولن، فعولُ (قبض)
+    "mafaaiilun": ("U---", ["U-U-", "U--U"]),             # مفاعيلن، مفاعلن (قبض)، مفاعيلُ (كف)
+    "faailun": ("-U-", ["UU-"]),                          # فاعلن، فعِلن (خبن)
+    "faailun_khabab": ("-U-", ["UU-", "--"]),             # فاعلن، فعِلن، فعْلن (تشعيث؛ الخبب)
+    "faailaatun": ("-U--", ["UU--", "-U-U", "UU-U"]),     # فاعلاتن، فعلاتن، فاعلاتُ، فعلاتُ
+    "mustafilun": ("--U-", ["U-U-", "-UU-", "UUU-"]),     # مستفعلن، متفعلن (خبن)، مستعلن (طي)، متعلن (خبل)
+    "mafuulaatu": ("---U", ["-U-U", "U--U"]),             # مفعولاتُ، مفعُلاتُ (طي)، معولاتُ (خبن)
+    "mutafaailun": ("UU-U-", ["--U-"]),                   # متفاعلن، متْفاعلن (إضمار)
+    "mufaalatun": ("U-UU-", ["U---"]),                    # مفاعلتن، مفاعلْتن (عصب)
+}
+
+# Feet of one hemistich plus the forms allowed in its last foot ('arud/darb, 'ilal included).
+METERS = {
+    "tawil": ("الطويل", ["fauulun", "mafaaiilun", "fauulun", "mafaaiilun"], ["U---", "U-U-", "U--"]),
+    "madid": ("المديد", ["faailaatun", "faailun", "faailaatun"], ["-U--", "UU--", "-U-", "UU-"]),
+    "basit": ("البسيط", ["mustafilun", "faailun", "mustafilun", "faailun"], ["-U-", "UU-", "--"]),
+    "wafir": ("الوافر", ["mufaalatun", "mufaalatun", "fauulun"], ["U--"]),
+    "kamil": ("الكامل", ["mutafaailun"] * 3, ["UU-U-", "--U-", "UU--", "---"]),
+    "hazaj": ("الهزج", ["mafaaiilun"] * 2, ["U---", "U-U-", "U--"]),
+    "rajaz": ("الرجز", ["mustafilun"] * 3, ["--U-", "U-U-", "-UU-", "---"]),
+    "ramal": ("الرمل", ["faailaatun", "faailaatun", "faailun"], ["-U-", "UU-", "-U--"]),
+    "sari": ("السريع", ["mustafilun", "mustafilun", "faailun"], ["-U-", "UU-", "--"]),
+    "munsarih": ("المنسرح", ["mustafilun", "mafuulaatu", "mustafilun"], ["--U-", "-UU-", "U-U-", "---"]),
+    "khafif": ("الخفيف", ["faailaatun", "mustafilun", "faailaatun"], ["-U--", "UU--", "---", "-U-"]),
+    "mudari": ("المضارع", ["mafaaiilun", "faailaatun"], ["-U--"]),
+    "muqtadab": ("المقتضب", ["mafuulaatu", "mustafilun"], ["-UU-", "--U-"]),
+    "mujtath": ("المجتث", ["mustafilun", "faailaatun"], ["-U--", "UU--", "---"]),
+    "mutaqarib": ("المتقارب", ["fauulun"] * 4, ["U--", "U-U", "U-"]),
+    "mutadarik": ("المتدارك", ["faailun_khabab"] * 4, ["-U-", "UU-", "--"]),
+    # Nabati meters: best-effort foot sequences (descriptions differ between sources)
+    "mashub": ("المسحوب", ["mustafilun", "mustafilun", "faailaatun"], ["-U--", "---"]),
+    "hilali": ("الهلالي", ["mustafilun", "mustafilun", "fauulun"], ["U--", "U-"]),
 }
 
-def _normalize(text: str) -> str:
-    t = strip_diacritics(text)
-    t = t.replace("أ","ا").replace("إ","ا").replace("آ","ا")
-    t = t.replace("ى","ي")
-    t = PUNCT.sub(" ", t)
-    t = SPACES.sub(" ", t).strip()
-    return t
-
-def _syllable_pattern(line: str) -> str:
-    tokens = []
-    for w in line.split():
-        m = AR_LETTERS.search(w)
-        if not m:
+# Forms only trusted on vocalized scans: the heuristic scan of bare text over-produces long syllables,
+# and the all-long khabab feet (and the merge edges) then absorb verses of every other meter
+_VOCALIZED_ONLY = {"faailun_khabab": {"--"}, "mutadarik": {"--"}}
+
+# Canonical hemistich of every meter (shown as the candidate "template")
+BAHR_PATTERNS = {name: "|".join(FEET[f][0] for f in feet) for name, (_, feet, _) in METERS.items()}
+
+LONG, SHORT, PAD = 1, -1, 0
+_SYMBOLS = {LONG: "-", SHORT: "U"}
+# Verses aligned per batch; bounds memory to chunk x edges
+_VERSE_CHUNK = 256
+# Edit costs of the alignment
+_SUBSTITUTE, _DELETE, _SKIP, _MERGE = 1.0, 1.0, 1.0, 0.5
+# Confidence factor of a verse scanned heuristically (no harakat): its syllables are guesses
+_PLAIN_CONFIDENCE = 0.75
+
+
+def _verses(text) -> list:
+    """(line, meter form) of every verse with letters; NormalizedText input reuses its verses."""
+    if isinstance(text, NormalizedText):
+        return [(v.text, v.plain) for v in text.verses if v.plain]
+    pairs = ((x.strip(), plain(x)) for x in (text or "").splitlines())
+    return [(line, p) for line, p in pairs if p]
+
+
+def _symbols(pattern: str) -> list:
+    return [LONG if c == "-" else SHORT for c in pattern]
+
+
+class MeterAutomaton:
+    """Every meter's permitted hemistich forms compiled into one NFA over long/short syllables.
+
+    Each foot slot is a trie of its variants; an epsilon loop from the end of a meter back to its
+    start lets a line hold one hemistich or a full bayt. Alignment is a vectorized edit-distance DP
+    over the edge list: one step per syllable for a whole batch of verses, so the cost is linear in
+    verse length whatever the number of variants. With vocalized=False the _VOCALIZED_ONLY forms and
+    the merge edges are left out (for heuristic scans).
+    """
+
+    def __init__(self, meters: dict, vocalized: bool = True):
+        self.names = list(meters)
+        self.n_states = 0
+        edges = []
+        starts, ends = [], []
+        for name in self.names:
+            _, feet, final = meters[name]
+            start = node = self._new_state()
+            starts.append(start)
+            for i, foot in enumerate(feet):
+                canonical, variants = FEET[foot]
+                last = i == len(feet) - 1
+                forms = final if last else [canonical] + variants
+                if not vocalized:
+                    forms = [f for f in forms if f not in _VOCALIZED_ONLY.get(name if last else foot, ())]
+                node = self._add_slot(edges, node, forms)
+            ends.append(node)
+        self.starts = np.array(starts)
+        self.ends = np.array(ends)
+
+        # Double-step edges: two short syllables heard as one long, or a template syllable the
+        # scanner missed, without epsilon closures inside a DP step.
+        out = {}
+        for src, dst, label, cost in edges:
+            out.setdefault(src, []).append((dst, label))
+        extra = []
+        for src, dst, label, _ in edges:
+            for dst2, label2 in out.get(dst, ()):
+                if vocalized and label == SHORT and label2 == SHORT:
+                    extra.append((src, dst2, LONG, _MERGE))
+                extra.append((src, dst2, label2, _SKIP))
+        edges = sorted(set(edges + extra), key=lambda e: (e[1], e[0]))
+
+        arr = np.array(edges, dtype=np.float64)
+        self.src = arr[:, 0].astype(np.intp)
+        dst = arr[:, 1].astype(np.intp)
+        self.label = arr[:, 2].astype(np.int8)
+        self.cost = arr[:, 3].astype(np.float32)
+        # Incoming edges grouped by in-degree: the per-state minimum is then a few dense reshapes
+        targets, first, degree = np.unique(dst, return_index=True, return_counts=True)
+        self.groups = []
+        for d in np.unique(degree):
+            sel = degree == d
+            edges_idx = (first[sel][:, None] + np.arange(d)[None, :]).ravel()
+            self.groups.append((targets[sel], edges_idx, int(d)))
+
+    def _new_state(self) -> int:
+        self.n_states += 1
+        return self.n_states - 1
+
+    def _add_slot(self, edges, start: int, forms: list) -> int:
+        end = self._new_state()
+        trie = {"": start}
+        for form in forms:
+            syms = _symbols(form)
+            for k in range(len(syms)):
+                prefix = form[:k]
+                if k == len(syms) - 1:
+                    edges.append((trie[prefix], end, syms[k], 0.0))
+                elif form[:k + 1] not in trie:
+                    trie[form[:k + 1]] = self._new_state()
+                    edges.append((trie[prefix], trie[form[:k + 1]], syms[k], 0.0))
+        return end
+
+    def align(self, encoded: list) -> np.ndarray:
+        """Minimum edit cost of every verse against every meter: (verses, meters)."""
+        out = np.full((len(encoded), len(self.names)), np.inf, dtype=np.float32)
+        # Longest verses first, so the verses still being scanned are always a prefix of the batch
+        order = sorted(range(len(encoded)), key=lambda i: -len(encoded[i]))
+        for c in range(0, len(order), _VERSE_CHUNK):
+            idx = order[c:c + _VERSE_CHUNK]
+            lens = np.array([len(encoded[i]) for i in idx])
+            steps = int(lens[0]) if len(idx) else 0
+            seq = np.full((max(steps, 1), len(idx)), PAD, dtype=np.int8)
+            for j, i in enumerate(idx):
+                seq[:len(encoded[i]), j] = encoded[i]
+            # States x verses, so gathers and the per-state reduction run along contiguous rows
+            cost = np.full((self.n_states, len(idx)), np.inf, dtype=np.float32)
+            cost[self.starts] = 0.0
+            for step in range(steps):
+                n = int(np.count_nonzero(lens > step))
+                cur = cost[:, :n]
+                cand = cur[self.src] + self.cost[:, None]
+                cand += _SUBSTITUTE * (self.label[:, None] != seq[step, :n])
+                new = cur + _DELETE
+                for targets, edges_idx, d in self.groups:
+                    best = cand[edges_idx].reshape(len(targets), d, n).min(axis=1) if d > 1 else cand[edges_idx]
+                    new[targets] = np.minimum(new[targets], best)
+                # A finished hemistich may be followed by the second one
+                new[self.starts] = np.minimum(new[self.starts], new[self.ends])
+                cost[:, :n] = new
+            out[idx] = cost[self.ends].T
+        return out
+
+
+AUTOMATON = MeterAutomaton(METERS)
+PLAIN_AUTOMATON = MeterAutomaton(METERS, vocalized=False)
+
+_SUN_LETTERS = set("تثدذرزسشصضطظلن")
+# Particles whose last letter is still (the heuristic otherwise voices a word's case ending)
+_STILL_ENDINGS = {"من", "عن", "لم", "قد", "هل", "بل", "لن", "كم", "ان", "إن", "أن", "مذ", "منذ", "لو", "او", "أو"}
+_ARTICLE_PREFIXES = ("", "و", "ف", "ب", "ك", "وب", "فب", "وك", "فل", "ول")
+# Words starting with ال that are not the article (إلى, إلّا, ألف ... once hamza is normalized away)
+_NOT_ARTICLE = {"الي", "اليك", "اليه", "اليها", "اليهم", "اليكم", "الينا", "الا", "الف", "الم"}
+
+
+def _guess_word(word: str, verse_start: bool) -> list:
+    """Moving (1) / still (0) letters of one bare word: long-vowel letters and the article are read as
+    written, other consonants alternate moving/still the way most Arabic patterns do."""
+    n = len(word)
+    article = next((len(p) for p in _ARTICLE_PREFIXES if word.startswith(p + "ال") and n > len(p) + 3
+                    and word[len(p):] not in _NOT_ARTICLE), None)
+    # An alif right after the article or a one-letter prefix carries a hamza (normalized أ/إ): a consonant
+    hamza = article + 2 if article is not None else (1 if n > 2 and word[0] in "وفبكل" else -1)
+    units = []
+    for j, ch in enumerate(word):
+        nxt = word[j + 1] if j + 1 < n else ""
+        if article is not None and j == article:
+            if verse_start and j == 0:
+                units.append(1)  # hamzat al-wasl, voiced only at the very start of the verse
+            continue
+        if article is not None and j == article + 1:
+            units.append(0)  # lam of the article, or the still half of a doubled sun letter
             continue
-        ww = m.group(0)
-        for ch in ww:
-            if ch in LONG_VOWELS:
-                tokens.append("-")
-            elif ch in HAMZA_FORMS:
-                tokens.append("U")
+        if ch == "آ":
+            units += [1, 0]
+        elif ch in "اى" and j and j != hamza:
+            units.append(0)
+        elif ch in "وي" and j and units and units[-1] == 1 and nxt not in ("ا", "ى") and not (nxt == "ي" and j + 2 == n):
+            units.append(0)  # long vowel
+        elif j == n - 1:
+            units.append(0 if word in _STILL_ENDINGS else 1)
+        elif nxt in "اىآ" or (nxt in "وي" and (word[j + 2] if j + 2 < n else "") not in "اوي"):
+            units.append(1)
+        elif not units or units[-1] == 0:
+            units.append(1)
+        else:
+            units.append(0 if j + 2 < n else 1)
+    return units
+
+
+def _scan_plain(line: str) -> np.ndarray:
+    """Heuristic scansion of an unvocalized verse (same letters-to-syllables steps as the vocalized one)."""
+    units = []
+    for i, half in enumerate(h for h in _HEMISTICH_SPLIT.split(strip_diacritics(line)) if h.strip()):
+        half_units = []
+        for wi, word in enumerate(AR_LETTERS.findall(half)):
+            half_units += _guess_word(word, verse_start=i == 0 and wi == 0)
+        if half_units and half_units[-1] == 1:
+            half_units.append(0)  # ishba' at the end of the hemistich
+        units += half_units
+    return _syllables(units)
+
+
+def is_vocalized(line: str) -> bool:
+    letters = sum(len(w) for w in AR_LETTERS.findall(strip_diacritics(line)))
+    return bool(letters) and len(_MARK_RE.findall(line)) >= 0.4 * letters
+
+
+def _letters_with_marks(word: str):
+    out = []
+    for ch in word:
+        if ch in _MARKS:
+            if out:
+                out[-1][1].add(ch)
+        elif "\u0621" <= ch <= "\u064A":
+            out.append((ch, set()))
+    return out
+
+
+def _is_wasl(letters, li: int) -> bool:
+    """Unmarked alif of the article or an imperative, at word start or after a one-letter prefix."""
+    ch, marks = letters[li]
+    if ch != "ا" or marks or li + 1 >= len(letters):
+        return False
+    if li == 1 and not (letters[0][0] in "وفبكل" and letters[0][1] & HARAKAT):
+        return False
+    if li > 1:
+        return False
+    nxt, nxt_marks = letters[li + 1]
+    return li == 0 or nxt == "ل" or SUKUN in nxt_marks
+
+
+def _scan_hemistich(text: str, verse_start: bool) -> list:
+    units = []  # 1 = mutaharrik, 0 = sakin
+    for wi, word in enumerate(text.split()):
+        letters = _letters_with_marks(word)
+        article = False
+        for li, (ch, marks) in enumerate(letters):
+            last = li == len(letters) - 1
+            if _is_wasl(letters, li):
+                # Hamzat al-wasl is only voiced at the very start of the verse
+                if verse_start and wi == 0 and li == 0:
+                    units.append(1)
+                article = letters[li + 1][0] == "ل"
+                continue
+            if article and ch == "ل" and not marks:
+                article = False
+                if li + 1 < len(letters) and SHADDA in letters[li + 1][1]:
+                    continue  # lam shamsiya, assimilated into the doubled letter
+                units.append(0)
+                continue
+            if ch == "آ":
+                units += [1, 0]
+            elif ch in "اى" and not marks & HARAKAT:
+                if not (last and li and letters[li - 1][0] == "و" and SUKUN in letters[li - 1][1]):
+                    units.append(0)  # long vowel (alif al-fariqa of قالوا is silent)
+            elif SHADDA in marks:
+                units += [0, 1]
+            elif marks & TANWEEN:
+                units += [1, 0]
+            elif SUKUN in marks:
+                units.append(0)
+            elif marks & HARAKAT:
+                units.append(1)
+            elif ch in "وي" and units and units[-1] == 1:
+                units.append(0)  # unmarked long vowel
             else:
-                tokens.append("U")
-    if not tokens:
-        return ""
-    compressed = []
-    for i, x in enumerate(tokens):
-        if i and x == "U" and tokens[i-1] == "U":
-            if compressed and compressed[-1] == "U":
-                compressed[-1] = "-"
+                units.append(0 if last else 1)
+    if units and units[-1] == 1:
+        units.append(0)  # ishba' at the end of the hemistich
+    return units
+
+
+def _scan_vocalized(line: str) -> np.ndarray:
+    """Scansion from harakat (simplified kitaba 'arudiya): letters become moving/still, then syllables."""
+    units = []
+    for i, half in enumerate(h for h in _HEMISTICH_SPLIT.split(line) if h.strip()):
+        units += _scan_hemistich(half, verse_start=i == 0)
+    return _syllables(units)
+
+
+def _syllables(units: list) -> np.ndarray:
+    syl = []
+    i = 0
+    while i < len(units):
+        if units[i] == 1:
+            if i + 1 < len(units) and units[i + 1] == 0:
+                syl.append(LONG)
+                i += 2
             else:
-                compressed.append("-")
+                syl.append(SHORT)
+                i += 1
         else:
-            compressed.append(x)
-    return "".join(compressed)[:48]
-
-def _score(pattern: str, templ: str) -> float:
-    t = templ.replace("|","")
-    if not pattern or not t:
-        return 0.0
-    best = 0.0
-    for start in range(0, max(1, len(pattern)-len(t)+1)):
-        window = pattern[start:start+len(t)]
-        matches = sum(1 for a,b in zip(window, t) if a==b)
-        best = max(best, matches/len(t))
-    if len(pattern) < len(t):
-        matches = sum(1 for a,b in zip(pattern, t[:len(pattern)]) if a==b)
-        best = max(best, matches/max(1,len(t)))
-    return best
-
-def detect_bahr(text: str):
-    t = _normalize(text)
-    lines = [x.strip() for x in t.split("\n") if x.strip()]
-    if not lines:
-        return ("", 0.0, {})
+            i += 1  # two stills in a row: the second is dropped
+    return np.array(syl, dtype=np.int8)
+
 
-    sample = " ".join(lines[:2])
-    pat = _syllable_pattern(sample)
+def scan_line(line: str) -> np.ndarray:
+    """Syllables of one verse: from its harakat when the line is vocalized, else heuristically."""
+    if is_vocalized(line):
+        return _scan_vocalized(line)
+    return _scan_plain(line)
 
-    results = []
-    for bahr, templ in BAHR_PATTERNS.items():
-        results.append(MeterResult(bahr=bahr, score=_score(pat, templ), pattern=templ))
-    results.sort(key=lambda x: x.score, reverse=True)
-    best = results[0]
-    gap = best.score - (results[1].score if len(results)>1 else 0.0)
-    conf = max(0.0, min(0.98, best.score*0.75 + gap*0.35))
+
+def score_verses(encoded: list, vocalized=None) -> np.ndarray:
+    """Alignment score in [0, 1] of every verse against every meter: (verses, bahrs).
+
+    Verses flagged False in vocalized (heuristic scans) are aligned on PLAIN_AUTOMATON.
+    """
+    vocalized = [True] * len(encoded) if vocalized is None else list(vocalized)
+    cost = np.empty((len(encoded), len(AUTOMATON.names)), dtype=np.float32)
+    for automaton, flag in ((AUTOMATON, True), (PLAIN_AUTOMATON, False)):
+        idx = [i for i, v in enumerate(vocalized) if v == flag]
+        if idx:
+            cost[idx] = automaton.align([encoded[i] for i in idx])
+    lens = np.array([max(len(x), 1) for x in encoded], dtype=np.float32)[:, None]
+    return np.clip(1.0 - cost / lens, 0.0, 1.0)
+
+
+def _summarize(encoded: list, scores: np.ndarray, vocalized=None):
+    names = AUTOMATON.names
+    # Each verse votes for its best bahr; the poem score is the mean over verses
+    mean = scores.mean(axis=0)
+    votes = np.bincount(scores.argmax(axis=1), minlength=len(names))
+    order = np.lexsort((-votes, -mean))
+    best = order[0]
+    gap = float(mean[best] - (mean[order[1]] if len(order) > 1 else 0.0))
+    agreement = float(votes[best]) / len(encoded)
+    conf = max(0.0, min(0.98, (float(mean[best]) * 0.75 + gap * 0.35) * (0.5 + 0.5 * agreement)))
+    if vocalized is not None:
+        # Heuristic scans fit some meter closely by chance: they cannot earn the confidence harakat do
+        plain_share = 1.0 - sum(bool(v) for v in vocalized) / len(vocalized)
+        conf *= 1.0 - (1.0 - _PLAIN_CONFIDENCE) * plain_share
     details = {
-        "sample_pattern": pat,
-        "candidates": [{"bahr":r.bahr,"score":round(r.score,3),"template":r.pattern} for r in results[:5]],
+        "sample_pattern": "".join(_SYMBOLS[int(x)] for x in encoded[0]),
+        "verses": len(encoded),
+        "votes": {names[i]: int(votes[i]) for i in order if votes[i]},
+        "candidates": [
+            {"bahr": names[i], "name_ar": METERS[names[i]][0], "score": round(float(mean[i]), 3),
+             "template": BAHR_PATTERNS[names[i]]}
+            for i in order[:5]
+        ],
     }
-    return (best.bahr, float(round(conf,3)), details)
+    return (names[best], float(round(conf, 3)), details)
+
+
+def detect_bahr(text):
+    verses = _verses(text)
+    if not verses:
+        return ("", 0.0, {})
+    scanned = [(scan_line(line), is_vocalized(line)) for line, _ in verses]
+    scanned = [x for x in scanned if len(x[0])] or scanned
+    encoded, vocalized = [e for e, _ in scanned], [v for _, v in scanned]
+    return _summarize(encoded, score_verses(encoded, vocalized), vocalized)
+
+
+# Per-line memo for live analysis: editing one verse only rescans that verse
+_LINE_CACHE_SIZE = 4096
+_line_cache = OrderedDict()
+_line_lock = threading.Lock()
+
+
+def scan_lines_cached(lines: list):
+    """(encoded, scores, vocalized) for lines of already-cleaned text, scanning only lines not seen recently."""
+    found = {}
+    with _line_lock:
+        for line in lines:
+            if line in _line_cache:
+                _line_cache.move_to_end(line)
+                found[line] = _line_cache[line]
+    missing = list(dict.fromkeys(line for line in lines if line not in found))
+    if missing:
+        encoded = [scan_line(line) for line in missing]
+        vocalized = [is_vocalized(line) for line in missing]
+        scores = score_verses(encoded, vocalized)
+        with _line_lock:
+            for line, enc, row, voc in zip(missing, encoded, scores, vocalized):
+                found[line] = _line_cache[line] = (enc, row, voc)
+            while len(_line_cache) > _LINE_CACHE_SIZE:
+                _line_cache.popitem(last=False)
+    return ([found[line][0] for line in lines], np.array([found[line][1] for line in lines]).reshape(len(lines), -1),
+            [found[line][2] for line in lines])
+
+
+def analyze_lines(text) -> dict:
+    """Per-line scansion plus the poem-level guess, memoized per line (nothing is stored)."""
+    verses = _verses(text)
+    if not verses:
+        return {"meter_guess": "", "meter_confidence": 0.0, "meter_details": {}, "lines": []}
+    lines = [line for line, _ in verses]
+    encoded, scores, vocalized = scan_lines_cached(lines)
+    names = AUTOMATON.names
+    per_line = []
+    for line, enc, row in zip(lines, encoded, scores):
+        best = int(row.argmax())
+        per_line.append({
+            "text": line,
+            "pattern": "".join(_SYMBOLS[int(x)] for x in enc),
+            "bahr": names[best] if len(enc) else "",
+            "score": round(float(row[best]), 3) if len(enc) else 0.0,
+        })
+    keep = [i for i, e in enumerate(encoded) if len(e)] or list(range(len(encoded)))
+    bahr, conf, details = _summarize([encoded[i] for i in keep], scores[keep], [vocalized[i] for i in keep])
+    return {"meter_guess": bahr, "meter_confidence": conf, "meter_details": details, "lines": per_line}
@@ -0,0 +1,131 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db.models import F
+from django.utils import timezone
+from shilat.models import CulturalStyle, MelodyTemplate, MusicBed
+from shilat.services import http_client, providers
+
+# The instrumental prompt depends only on (school, rhythm, tempo, style): one Suno render per slot serves
+# every job that lands in it. Jobs take a ready bed, wait on one still rendering, or request the first one.
+
+
+def tempo_bucket(tempo) -> int:
+    size = max(1, int(getattr(settings, "MUSIC_BED_TEMPO_BUCKET", 8)))
+    return max(size, int(round(int(tempo or 96) / size)) * size)
+
+
+def slot(job) -> dict:
+    melody = job.melody
+    return {
+        "school_key": melody.school.key if melody.school_id else "",
+        "rhythm_key": melody.rhythm_key,
+        "tempo_bucket": tempo_bucket(job.tempo),
+        "style_key": job.cultural_style.key,
+    }
+
+
+def prompt(school_key: str, rhythm_key: str, tempo_bucket: int, style_key: str) -> dict:
+    school = school_key or "samri"
+    return {
+        "prompt": f"Traditional Saudi/Gulf percussion and instrumental bed for shilat. School: {school}. "
+                  f"Rhythm: {rhythm_key}. Tempo around {tempo_bucket} BPM. Regional style: {style_key}.",
+        "style": "Gulf, Traditional, Percussion, Shilat",
+        "title": f"Shilat Bed - {school}",
+    }
+
+
+def generate(slot: dict, callback_url: str) -> MusicBed:
+    """Submits one instrumental render for the slot; the bed stays pending until its result is recorded."""
+    task_id = providers.music("sunoapi").generate_instrumental(model="V4_5ALL", callback_url=callback_url,
+                                                               **prompt(**slot))
+    return MusicBed.objects.create(task_id=task_id, **slot)
+
+
+def pick(slot: dict):
+    """A ready bed of the slot, counted as used; least used first when MUSIC_BED_ROTATE is on. None if empty."""
+    beds = MusicBed.objects.filter(status="ready", **slot)
+    if getattr(settings, "MUSIC_BED_ROTATE", True):
+        beds = beds.order_by("use_count", F("last_used_at").asc(nulls_first=True), "id")
+    else:
+        beds = beds.order_by("id")
+    bed = beds.first()
+    if bed is not None:
+        now = timezone.now()
+        MusicBed.objects.filter(id=bed.id).update(use_count=F("use_count") + 1, last_used_at=now)
+        bed.use_count, bed.last_used_at = bed.use_count + 1, now
+    return bed
+
+
+def rendering(slot: dict):
+    """The newest bed of the slot still rendering (and not past SUNOAPI_MUSIC_TIMEOUT_SEC), or None."""
+    timeout = timedelta(seconds=getattr(settings, "SUNOAPI_MUSIC_TIMEOUT_SEC", 900))
+    return (MusicBed.objects.filter(status="pending", created_at__gte=timezone.now() - timeout, **slot)
+            .exclude(task_id="").order_by("-id").first())
+
+
+def _render_once(slot: dict, callback_url: str) -> MusicBed:
+    """A bed of the slot, requesting a render only if no other worker is requesting one right now.
+
+    Concurrent callers wait up to MUSIC_BED_SLOT_WAIT_SEC for that render to be recorded and attach to it.
+    """
+    key = "music-bed-slot:" + ":".join(str(slot[k]) for k in ("school_key", "rhythm_key", "tempo_bucket", "style_key"))
+    deadline = time.time() + getattr(settings, "MUSIC_BED_SLOT_WAIT_SEC", 30)
+    while True:
+        if cache.add(key, 1, timeout=120):
+            try:
+                # Re-checked under the lock: the previous holder may have just recorded its render
+                return rendering(slot) or generate(slot, callback_url)
+            finally:
+                cache.delete(key)
+        bed = rendering(slot) or pick(slot)
+        if bed is not None:
+            return bed
+        if time.time() >= deadline:
+            raise RuntimeError("music bed render for this slot is still being requested")
+        time.sleep(0.5)
+
+
+def assign(job, callback_url: str, bed: MusicBed = None) -> MusicBed:
+    """Attaches the job to a bed of its slot: a ready one, one still rendering, or a newly requested one."""
+    s = slot(job)
+    bed = bed or pick(s) or rendering(s) or _render_once(s, callback_url)
+    job.music_bed = bed
+    job.music_task_id = bed.task_id
+    fields = ["music_bed", "music_task_id"]
+    if bed.status == "ready":
+        job.music_audio_url = bed.audio_url
+        fields.append("music_audio_url")
+        if bed.audio_file:
+            # Shares the stored bed: the mix reads it without downloading anything
+            job.music_stem.name = bed.audio_file.name
+            fields.append("music_stem")
+    job.save(update_fields=fields)
+    return bed
+
+
+def store(bed: MusicBed):
+    """Downloads a ready bed into audio_file: provider URLs expire, the library must not."""
+    r = http_client.session("download").get(bed.audio_url, timeout=http_client.timeout("download"))
+    r.raise_for_status()
+    ext = bed.audio_url.split("?")[0].split(".")[-1].lower()
+    if ext not in ("mp3", "m4a", "aac", "wav", "ogg"):
+        ext = "mp3"
+    bed.audio_file.save(f"bed-{bed.id}.{ext}", ContentFile(r.content), save=False)
+    bed.save(update_fields=["audio_file"])
+
+
+def matrix(tempos=None, styles=None):
+    """Every (school, rhythm, tempo bucket, style) slot of the seeded rhythms and styles."""
+    style_rows = CulturalStyle.objects.order_by("key")
+    if styles:
+        style_rows = style_rows.filter(key__in=styles)
+    style_rows = list(style_rows)
+    buckets = sorted({tempo_bucket(t) for t in tempos} if tempos else {tempo_bucket(s.default_tempo) for s in style_rows})
+    for melody in MelodyTemplate.objects.select_related("school").order_by("rhythm_key"):
+        for style in style_rows:
+            for bucket in buckets:
+                yield {"school_key": melody.school.key if melody.school_id else "", "rhythm_key": melody.rhythm_key,
+                       "tempo_bucket": bucket, "style_key": style.key}
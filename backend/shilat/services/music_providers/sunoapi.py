@@ -1,31 +1,78 @@
-import time
-import requests
 from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from shilat.services import http_client
+
+# Placeholder used when no public callback URL is configured; the sweeper then picks the result up.
+PLACEHOLDER_CALLBACK_URL = "https://example.invalid/cb"
+FAILED_STATUSES = {"CREATE_TASK_FAILED", "GENERATE_AUDIO_FAILED", "CALLBACK_EXCEPTION", "SENSITIVE_WORD_ERROR"}
+
+
+def callback_token(job_id) -> str:
+    return salted_hmac("shilat.sunoapi.callback", str(job_id)).hexdigest()[:32]
+
+
+def check_callback_token(job_id, token: str) -> bool:
+    return constant_time_compare(callback_token(job_id), token or "")
+
+
+def callback_url(job_id) -> str:
+    base = (getattr(settings, "SUNOAPI_CALLBACK_BASE_URL", "") or "").rstrip("/")
+    if not base:
+        return PLACEHOLDER_CALLBACK_URL
+    return f"{base}/music-callback/{job_id}/{callback_token(job_id)}/"
+
+
+def audio_url_from_details(info: dict) -> str:
+    """audioUrl of the first finished track in a record-info response (empty while rendering)."""
+    resp = (info.get("response") or {})
+    suno = (resp.get("sunoData") or [])
+    if suno and suno[0].get("audioUrl"):
+        return suno[0]["audioUrl"]
+    return ""
+
+
+def parse_callback(payload: dict):
+    """Returns (task_id, audio_url, error) from a sunoapi.org callback body; all empty for interim callbacks."""
+    data = payload.get("data") or {}
+    task_id = data.get("task_id") or data.get("taskId") or ""
+    kind = (data.get("callbackType") or "").lower()
+    if payload.get("code") != 200 or kind == "error":
+        return task_id, "", f"SunoAPI callback error: {payload.get('msg') or payload.get('code')}"
+    if kind not in ("first", "complete"):
+        return task_id, "", ""
+    for item in data.get("data") or []:
+        url = item.get("audio_url") or item.get("audioUrl") or ""
+        if url:
+            return task_id, url, ""
+    return task_id, "", ""
 
 class SunoApiProvider:
     """Third-party provider for music generation via api.sunoapi.org (not official Suno API)."""
 
     def __init__(self):
         self.token = getattr(settings, "SUNOAPI_TOKEN", "") or ""
-        self.base_url = "https://api.sunoapi.org/api/v1"
+        self.base_url = (getattr(settings, "SUNOAPI_BASE_URL", "") or "https://api.sunoapi.org/api/v1").rstrip("/")
+        self.http = http_client.session("sunoapi")
 
     def _headers(self):
         return {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
 
-    def generate_instrumental(self, prompt: str, style: str, title: str, model: str = "V4_5ALL") -> str:
+    def generate_instrumental(self, prompt: str, style: str, title: str, model: str = "V4_5ALL",
+                              callback_url: str = PLACEHOLDER_CALLBACK_URL) -> str:
         if not self.token:
             raise RuntimeError("SUNOAPI_TOKEN is missing")
         url = f"{self.base_url}/generate"
-        payload = {"customMode": True, "instrumental": True, "model": model, "callBackUrl": "https://example.invalid/cb",
+        payload = {"customMode": True, "instrumental": True, "model": model, "callBackUrl": callback_url,
                    "prompt": prompt or "", "style": style, "title": title}
-        r = requests.post(url, json=payload, headers=self._headers(), timeout=60)
+        r = self.http.post(url, json=payload, headers=self._headers(), timeout=http_client.timeout("sunoapi"))
         r.raise_for_status()
         data = r.json()
         if data.get("code") != 200:
             raise RuntimeError(f"SunoAPI error: {data}")
         return data["data"]["taskId"]
 
-    def generate_vocal(self, lyrics: str, style: str, title: str, model: str = "V4_5ALL") -> str:
+    def generate_vocal(self, lyrics: str, style: str, title: str, model: str = "V4_5ALL",
+                       callback_url: str = PLACEHOLDER_CALLBACK_URL) -> str:
         """Generate full vocal+music (singing) track."""
         if not self.token:
             raise RuntimeError("SUNOAPI_TOKEN is missing")
@@ -38,9 +85,9 @@ class SunoApiProvider:
             "style": style,
             "title": title,
             "model": model,
-            "callBackUrl": "https://example.invalid/cb",
+            "callBackUrl": callback_url,
         }
-        r = requests.post(url, json=payload, headers=self._headers(), timeout=60)
+        r = self.http.post(url, json=payload, headers=self._headers(), timeout=http_client.timeout("sunoapi"))
         r.raise_for_status()
         data = r.json()
         if data.get("code") != 200:
@@ -49,23 +96,9 @@ class SunoApiProvider:
 
     def get_details(self, task_id: str) -> dict:
         url = f"{self.base_url}/generate/record-info"
-        r = requests.get(url, headers=self._headers(), params={"taskId": task_id}, timeout=60)
+        r = self.http.get(url, headers=self._headers(), params={"taskId": task_id}, timeout=http_client.timeout("sunoapi"))
         r.raise_for_status()
         data = r.json()
         if data.get("code") != 200:
             raise RuntimeError(f"SunoAPI details error: {data}")
         return data.get("data") or {}
-
-    def wait_for_audio_url(self, task_id: str, timeout_sec: int = 240, poll_sec: float = 4.0) -> str:
-        t0 = time.time()
-        last_status = None
-        while time.time() - t0 < timeout_sec:
-            info = self.get_details(task_id)
-            last_status = info.get("status")
-            if last_status == "SUCCESS":
-                resp = (info.get("response") or {})
-                suno = (resp.get("sunoData") or [])
-                if suno and suno[0].get("audioUrl"):
-                    return suno[0]["audioUrl"]
-            time.sleep(poll_sec)
-        raise RuntimeError(f"SunoAPI timeout last_status={last_status}")
@@ -0,0 +1,135 @@
+import bisect
+import re
+
+# One normalization pass shared by submission cleaning, meter detection, lexicon rewriting and TTS chunking:
+# a poem is cleaned, split into verses and tokenized once, and every consumer reads the same structure.
+_DROP = ("\u0640", "\u200f", "\u200e")
+_FOLD = (("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ى", "ي"))
+_DIACRITICS = (*range(0x0610, 0x061B), *range(0x064B, 0x0660), 0x0670, *range(0x06D6, 0x06EE))
+# str.translate table indexed by code point (a list is several times faster than a dict here); code points
+# past its end are left as they are. Strips diacritics and applies the folds again for uncleaned input.
+STRIP_TABLE = [chr(i) for i in range(0x0700)]
+for _cp in _DIACRITICS:
+    STRIP_TABLE[_cp] = ""
+PLAIN_TABLE = STRIP_TABLE.copy()
+for _src, _dst in _FOLD:
+    PLAIN_TABLE[ord(_src)] = _dst
+PLAIN_TABLE[0x0640] = ""
+
+WORD_RE = re.compile(r"[\w\u0600-\u06FF]+")
+PUNCT_RE = re.compile(r"[\u060C\u061B\u061F\!\?\,\.;:…\-\*]+")
+_LINE_ENDS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+def fold(text: str) -> str:
+    """Drops tatweel and direction marks, folds alef forms and alef maqsura (line breaks are untouched)."""
+    for ch in _DROP:
+        if ch in text:
+            text = text.replace(ch, "")
+    for src, dst in _FOLD:
+        if src in text:
+            text = text.replace(src, dst)
+    return text
+
+
+class Verse:
+    """One non-empty line: cleaned text, its offset in the cleaned text and its span in the raw input."""
+
+    __slots__ = ("doc", "text", "start", "raw_start", "raw_end", "_plain")
+
+    def __init__(self, doc, text: str, start: int, raw_start: int, raw_end: int):
+        self.doc = doc
+        self.text = text
+        self.start = start
+        self.raw_start = raw_start
+        self.raw_end = raw_end
+        self._plain = None
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    @property
+    def plain(self) -> str:
+        """Meter form: no diacritics, punctuation as spaces."""
+        if self._plain is None:
+            self.doc.plain_forms()
+        return self._plain
+
+    @property
+    def tokens(self) -> list:
+        tokens = self.doc.tokens
+        lo = bisect.bisect_left(tokens, self.start, key=lambda t: t[1])
+        hi = bisect.bisect_left(tokens, self.end, lo, key=lambda t: t[1])
+        return tokens[lo:hi]
+
+
+class NormalizedText:
+    """raw -> cleaned text (what clean_arabic_text returns), its verses and (word, start, end) tokens."""
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.verses = []
+        raw_lines = raw.splitlines(True)
+        lines = fold(raw).splitlines()
+        if len(lines) != len(raw_lines):
+            # A dropped mark between "\r" and "\n" merged two breaks: fold line by line instead
+            lines = [fold(x.rstrip(_LINE_ENDS)) for x in raw_lines]
+        pos = start = 0
+        for raw_line, line in zip(raw_lines, lines):
+            text = " ".join(line.split())
+            if text:
+                self.verses.append(Verse(self, text, start, pos, pos + len(raw_line.rstrip(_LINE_ENDS))))
+                start += len(text) + 1
+            pos += len(raw_line)
+        self.cleaned = "\n".join(v.text for v in self.verses)
+        self._tokens = None
+
+    @property
+    def tokens(self) -> list:
+        """(word, start, end) over the cleaned text, in order; computed once."""
+        if self._tokens is None:
+            self._tokens = [(m.group(0), m.start(), m.end()) for m in WORD_RE.finditer(self.cleaned)]
+        return self._tokens
+
+    def plain_forms(self) -> list:
+        """Meter form of every verse, computed for the whole text in one translate/sub pass."""
+        if self.verses and self.verses[0]._plain is None:
+            forms = PUNCT_RE.sub(" ", self.cleaned.translate(STRIP_TABLE)).split("\n")
+            for v, form in zip(self.verses, forms):
+                v._plain = " ".join(form.split())
+        return [v._plain for v in self.verses]
+
+    def raw_span(self, token) -> tuple:
+        """Span of a token in the raw input (the verse span if the word cannot be matched one to one)."""
+        i = bisect.bisect_right(self.verses, token[1], key=lambda v: v.start) - 1
+        verse = self.verses[i]
+        k = sum(1 for t in verse.tokens if t[1] < token[1])
+        raw_words = [m.span() for m in WORD_RE.finditer(self.raw, verse.raw_start, verse.raw_end)]
+        if len(raw_words) != len(verse.tokens):
+            return (verse.raw_start, verse.raw_end)
+        return raw_words[k]
+
+
+def normalize_text(raw: str) -> NormalizedText:
+    return NormalizedText(raw or "")
+
+
+def clean(text: str) -> str:
+    return NormalizedText(text or "").cleaned
+
+
+def strip_diacritics(text: str) -> str:
+    return text.translate(STRIP_TABLE)
+
+
+def plain(line: str) -> str:
+    """Meter form of one line of uncleaned text."""
+    return " ".join(PUNCT_RE.sub(" ", line.translate(PLAIN_TABLE)).split())
+
+
+def lines(text) -> list:
+    """Stripped non-empty lines, without cleaning (for text that is already cleaned or rewritten)."""
+    if isinstance(text, NormalizedText):
+        return [v.text for v in text.verses]
+    return [s for s in (x.strip() for x in (text or "").splitlines()) if s]
@@ -0,0 +1,129 @@
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+
+KITS = ("tabl", "tar", "clap")
+# Default kit per shila school (MelodyTemplate.pattern_json["kit"] or PERCUSSION_KIT override it)
+_SCHOOL_KITS = {"ardah": "tabl", "samri": "tar", "ghazal": "tar", "mawal": "tar", "dahha": "clap"}
+# Hit gains: phrase downbeat, accented (dum) and plain (tak) strokes
+_DOWNBEAT, _ACCENT, _PLAIN = 1.0, 0.85, 0.55
+
+# Rendered loop cycles per (rhythm_key, tempo, kit, sample rate, pattern); a bed is the cycle tiled
+_CYCLE_CACHE_SIZE = 64
+_cycles = OrderedDict()
+_kits = {}
+_lock = threading.Lock()
+
+
+def _drum(sr: int, freq: float, drop: float, decay: float, noise: float, length: float, rng) -> np.ndarray:
+    """Membrane stroke: a sine whose pitch falls from freq * (1 + drop) to freq, plus a short noise attack."""
+    t = np.arange(int(length * sr), dtype=np.float64) / sr
+    f = freq * (1.0 + drop * np.exp(-t * 40.0))
+    body = np.sin(2 * np.pi * np.cumsum(f) / sr) * np.exp(-t / decay)
+    attack = rng.standard_normal(len(t)) * np.exp(-t / (decay * 0.2)) * noise
+    x = body + attack
+    return (x / np.abs(x).max()).astype(np.float32)
+
+
+def _clap(sr: int, bursts: int, rng) -> np.ndarray:
+    """Hand clap: a few noise bursts ~10 ms apart and a short tail, with the low end removed."""
+    t = np.arange(int(0.25 * sr), dtype=np.float64) / sr
+    env = np.zeros_like(t)
+    for k in range(bursts):
+        start = k * 0.011
+        env += (t >= start) * np.exp(-np.clip(t - start, 0, None) / (0.005 if k < bursts - 1 else 0.06))
+    x = np.diff(rng.standard_normal(len(t) + 1)) * env
+    return (x / np.abs(x).max()).astype(np.float32)
+
+
+def _kit(kit: str, sr: int) -> dict:
+    key = (kit, sr)
+    if key not in _kits:
+        rng = np.random.default_rng(7)
+        if kit == "tar":
+            samples = {"dum": _drum(sr, 110, 1.0, 0.12, 0.25, 0.5, rng), "tak": _drum(sr, 320, 0.5, 0.04, 0.6, 0.2, rng)}
+        elif kit == "clap":
+            samples = {"dum": _clap(sr, 4, rng), "tak": _clap(sr, 3, rng)}
+        else:
+            samples = {"dum": _drum(sr, 70, 1.5, 0.18, 0.15, 0.6, rng), "tak": _drum(sr, 180, 0.8, 0.06, 0.5, 0.25, rng)}
+        _kits[key] = samples
+    return _kits[key]
+
+
+def _bar_beats(time_signature: str):
+    try:
+        num, den = (int(x) for x in str(time_signature).split("/"))
+    except ValueError:
+        return None
+    return num * 4.0 / den if num > 0 and den > 0 else None
+
+
+def kit_for(melody) -> str:
+    pattern = melody.pattern_json or {}
+    school = melody.school.key if melody.school_id else ""
+    kit = pattern.get("kit") or getattr(settings, "PERCUSSION_KIT", "") or _SCHOOL_KITS.get(school, "tabl")
+    return kit if kit in KITS else "tabl"
+
+
+def _render_cycle(pattern: dict, tempo: int, kit: str, sr: int):
+    hits = list(pattern.get("hits") or [])
+    accent = list(pattern.get("accent") or [])
+    bar_beats = _bar_beats(pattern.get("time_signature", "4/4"))
+    if not any(hits) or bar_beats is None:
+        return None  # free rhythm (mawal): no beat
+    bars = max(1, round((pattern.get("phrase_beats") or bar_beats) / bar_beats))
+    step_beats = bar_beats / len(hits)
+    samples_per_beat = 60.0 / tempo * sr
+    n = int(round(bars * bar_beats * samples_per_beat))
+    out = np.zeros(n, dtype=np.float32)
+    strokes = _kit(kit, sr)
+    for bar in range(bars):
+        for i, hit in enumerate(hits):
+            if not hit:
+                continue
+            accented = i < len(accent) and accent[i]
+            gain = _DOWNBEAT if bar == 0 and i == 0 else (_ACCENT if accented else _PLAIN)
+            s = strokes["dum" if accented else "tak"][:n] * gain
+            pos = int(round((bar * bar_beats + i * step_beats) * samples_per_beat)) % n
+            head = min(len(s), n - pos)
+            out[pos:pos + head] += s[:head]
+            # Tails past the cycle end wrap to its start so the tiled loop is seamless
+            out[:len(s) - head] += s[head:]
+    peak = float(np.abs(out).max())
+    if peak > 0.9:
+        out *= 0.9 / peak
+    return out
+
+
+def cycle(rhythm_key: str, pattern: dict, tempo: int, kit: str, sr: int):
+    """One phrase of the rhythm as float32 mono in [-1, 1], or None for free rhythms; cached."""
+    tempo = max(40, min(240, int(tempo or 96)))
+    key = (rhythm_key, tempo, kit, sr, json.dumps(pattern, sort_keys=True))
+    with _lock:
+        if key in _cycles:
+            _cycles.move_to_end(key)
+            return _cycles[key]
+    out = _render_cycle(pattern, tempo, kit, sr)
+    with _lock:
+        _cycles[key] = out
+        while len(_cycles) > _CYCLE_CACHE_SIZE:
+            _cycles.popitem(last=False)
+    return out
+
+
+def render(rhythm_key: str, pattern: dict, tempo: int, kit: str, sr: int, n_samples: int):
+    """A beat bed of exactly n_samples, or None when the rhythm has no beat."""
+    loop = cycle(rhythm_key, pattern, tempo, kit, sr)
+    if loop is None or n_samples <= 0:
+        return None
+    return np.tile(loop, -(-n_samples // len(loop)))[:n_samples]
+
+
+def bed(job, sr: int):
+    """(one cycle of the job's rhythm to loop under the vocal, kit), or (None, "") for free rhythms."""
+    melody = job.melody
+    kit = kit_for(melody)
+    loop = cycle(melody.rhythm_key, melody.pattern_json or {}, job.tempo, kit, sr)
+    return (loop, kit) if loop is not None else (None, "")
@@ -1,94 +1,178 @@
-import io
 import uuid
-import requests
+from contextlib import ExitStack, closing
+import numpy as np
+from django.conf import settings
 from django.core.files.base import ContentFile
-from pydub import AudioSegment
+from shilat.services import audio_io, effects, http_client, music_beds, percussion, providers
 
 def _download(url: str) -> bytes:
-    r = requests.get(url, timeout=60)
+    r = http_client.session("download").get(url, timeout=http_client.timeout("download"))
     r.raise_for_status()
     return r.content
 
-def mix_voice_with_music(voice_mp3: bytes, music_mp3: bytes, music_volume_db: float = -10.0) -> bytes:
-    voice = AudioSegment.from_file(io.BytesIO(voice_mp3), format="mp3")
-    music = AudioSegment.from_file(io.BytesIO(music_mp3), format="mp3")
-
-    if len(music) < len(voice):
-        loops = (len(voice) // len(music)) + 1
-        music = (music * loops)[:len(voice)]
+# Mixing runs block by block (voice -> effects -> music/beat -> encoder) so memory does not grow with duration
+_BLOCK_SEC = 1
+
+
+def mix_voice_with_music(voice_blocks, music, music_volume_db: float = -10.0):
+    """Sums music.read() (looped or trimmed by the reader) under each vocal block, attenuated; yields mixed blocks."""
+    gain = np.float32(10.0 ** (float(music_volume_db) / 20.0))
+    for block in voice_blocks:
+        bed = music.read(block.shape[1])
+        if bed.shape[1] < block.shape[1]:
+            bed = np.pad(bed, ((0, 0), (0, block.shape[1] - bed.shape[1])))
+        yield block + bed * gain
+
+def request_music(job, callback_url: str) -> str:
+    """Submit the Suno generation for a job and return its task id without waiting for the render."""
+    provider = providers.music(job.music_provider)
+
+    school = job.melody.school.key if job.melody.school else "samri"
+    if job.music_provider == "suno_vocal":
+        style = "Gulf, Shilat, Vocal, Traditional"
+        title = f"Shilat Vocal - {school}"
+        lyrics = getattr(job.submission, "raw_text", "") or getattr(job.submission, "cleaned_text", "")
+        task_id = provider.generate_vocal(lyrics=lyrics, style=style, title=title, model="V4_5ALL",
+                                          callback_url=callback_url)
     else:
-        music = music[:len(voice)]
-
-    music = music + float(music_volume_db)
-    mixed = music.overlay(voice)
+        task_id = provider.generate_instrumental(model="V4_5ALL", callback_url=callback_url,
+                                                 **music_beds.prompt(school, job.melody.rhythm_key, job.tempo,
+                                                                     job.cultural_style.key))
+    job.music_task_id = task_id
+    job.save(update_fields=["music_task_id"])
+    return task_id
+
+def fetch_music_stem(job) -> bytes:
+    """Downloaded music for the job, checkpointed on job.music_stem so a retry never downloads it twice."""
+    if job.music_stem:
+        with job.music_stem.open("rb") as f:
+            return f.read()
+    bed = job.music_bed if job.music_bed_id else None
+    if bed is not None and bed.audio_file:
+        # Library beds are stored once and shared by every job that uses them
+        job.music_stem.name = bed.audio_file.name
+        job.save(update_fields=["music_stem"])
+        with job.music_stem.open("rb") as f:
+            return f.read()
+    data = _download(job.music_audio_url)
+    ext = job.music_audio_url.split("?")[0].split(".")[-1].lower()
+    if ext not in ("mp3", "m4a", "aac", "wav", "ogg"):
+        ext = "mp3"
+    job.music_stem.save(f"{job.id}-music.{ext}", ContentFile(data), save=False)
+    job.save(update_fields=["music_stem"])
+    return data
+
+class _Prefixed:
+    """A reader that first returns an already-read block, then continues from the underlying reader."""
+
+    def __init__(self, head: np.ndarray, reader):
+        self.head, self.reader = head, reader
+
+    def read(self, n: int) -> np.ndarray:
+        if self.head is None:
+            return self.reader.read(n)
+        out = self.head[:, :n]
+        rest = self.head[:, n:]
+        self.head = rest if rest.shape[1] else None
+        if out.shape[1] < n:
+            out = np.concatenate((out, self.reader.read(n - out.shape[1])), axis=1)
+        return out
+
+
+def encode_blocks(blocks, sr: int, channels: int, name: str, fmt: str = "mp3", bitrate: str = "192k"):
+    """Feeds blocks through the limiter into one incremental encoder; returns the EncodedFile."""
+    enc = audio_io.Encoder(sr, channels, fmt, bitrate)
+    try:
+        for block in blocks:
+            enc.write(effects.soft_clip(block))
+    except BaseException:
+        enc.abort()
+        raise
+    return enc.close(name)
+
+
+def _voice_blocks(tts_audio_bytes: bytes, job, stack: ExitStack):
+    """(vocal blocks after effects, sample rate, channels); the vocal is decoded and processed block by block."""
+    info = audio_io.probe(tts_audio_bytes)
+    sr, channels = info["sample_rate"], info["channels"]
+    if getattr(job, "quality", "final") == "draft":
+        # Previews are mixed and encoded as low-rate mono: about a quarter of the work of a final render
+        sr, channels = min(sr, settings.DRAFT_SAMPLE_RATE), 1
+    block = sr * _BLOCK_SEC
+    params = effects.job_params(job) if getattr(settings, "EFFECTS_ENABLED", True) else {}
+    source = stack.enter_context(closing(audio_io.Decoder(tts_audio_bytes, sr, channels)))
+    blocks = source.blocks(block)
+    if params:
+        blocks = effects.stream(blocks, sr, channels, **params)
+    return blocks, sr, channels
 
-    out = io.BytesIO()
-    mixed.export(out, format="mp3", bitrate="192k")
-    return out.getvalue()
 
 def post_process_audio(tts_audio_bytes: bytes, job):
-    final_bytes = tts_audio_bytes
-    meta = {"format": "mp3"}
-
-    if getattr(job, "add_music", False) and getattr(job, "music_provider", "none") == "suno_vocal":
-        try:
-            from shilat.services.music_providers.sunoapi import SunoApiProvider
-            provider = SunoApiProvider()
-
-            school = job.melody.school.key if job.melody.school else "samri"
-            style = "Gulf, Shilat, Vocal, Traditional"
-            title = f"Shilat Vocal - {school}"
-            lyrics = getattr(job.submission, "raw_text", "") or getattr(job.submission, "cleaned_text", "")
+    """Mixes the vocal with the music already rendered for the job (job.music_audio_url) or a local beat.
 
-            task_id = provider.generate_vocal(lyrics=lyrics, style=style, title=title, model="V4_5ALL")
-            job.music_task_id = task_id
-            job.save(update_fields=["music_task_id"])
-
-            audio_url = provider.wait_for_audio_url(task_id)
-            job.music_audio_url = audio_url
-            job.save(update_fields=["music_audio_url"])
-
-            final_bytes = _download(audio_url)
-            meta.update({"music_task_id": task_id, "music_audio_url": audio_url, "mode": "vocal"})
-        except Exception as e:
-            meta["music_error"] = str(e)
-
-    elif getattr(job, "add_music", False) and getattr(job, "music_provider", "none") == "sunoapi":
-        try:
-            from shilat.services.music_providers.sunoapi import SunoApiProvider
-            provider = SunoApiProvider()
-
-            school = job.melody.school.key if job.melody.school else "samri"
-            prompt = f"Traditional Saudi/Gulf percussion and instrumental bed for shilat. School: {school}. Rhythm: {job.melody.rhythm_key}. Tempo around {job.tempo} BPM."
-            style = "Gulf, Traditional, Percussion, Shilat"
-            title = f"Shilat Bed - {school}"
-
-            task_id = provider.generate_instrumental(prompt=prompt, style=style, title=title, model="V4_5ALL")
-            job.music_task_id = task_id
-            job.save(update_fields=["music_task_id"])
-
-            audio_url = provider.wait_for_audio_url(task_id)
-            job.music_audio_url = audio_url
-            job.save(update_fields=["music_audio_url"])
-
-            music_bytes = _download(audio_url)
-            final_bytes = mix_voice_with_music(tts_audio_bytes, music_bytes, getattr(job,"music_volume_db",-10.0))
-            meta.update({"music_task_id": task_id, "music_audio_url": audio_url})
-        except Exception as e:
-            meta["music_error"] = str(e)
-
-    # Try to infer format for duration/metadata
-    fmt = "mp3"
-    if getattr(job, "music_provider", "") == "suno_vocal" and getattr(job, "music_audio_url", ""):
+    The vocal streams block by block through effects, the looped music bed or percussion, and one incremental
+    encoder writing a temp file (meta["django_file"], an audio_io.EncodedFile) that storage streams from.
+    """
+    meta = {"format": "mp3"}
+    music_provider = getattr(job, "music_provider", "none")
+    music_bytes = None
+
+    if getattr(job, "add_music", False) and music_provider in ("suno_vocal", "sunoapi"):
+        audio_url = getattr(job, "music_audio_url", "")
+        if getattr(job, "music_error", ""):
+            meta["music_error"] = job.music_error
+        elif not audio_url:
+            meta["music_error"] = "music not available"
+        else:
+            # Download failures propagate so the mix stage can retry from the checkpoint
+            music_bytes = fetch_music_stem(job)
+
+    if music_provider == "suno_vocal" and music_bytes is not None:
+        # The Suno render is the final track: stored as delivered, never decoded or re-encoded
         ext = job.music_audio_url.split("?")[0].split(".")[-1].lower()
-        if ext in ("mp3", "m4a", "aac", "wav", "ogg"):
-            fmt = ext
-    try:
-        duration = AudioSegment.from_file(io.BytesIO(final_bytes), format=fmt if fmt != "auto" else None).duration_seconds
-    except Exception:
-        duration = 0.0
-    filename = f"{uuid.uuid4()}.{fmt if fmt!='auto' else 'mp3'}"
-    django_file = ContentFile(final_bytes, name=filename)
-    meta["duration"] = float(duration)
-    meta["django_file"] = django_file
+        fmt = ext if ext in ("mp3", "m4a", "aac", "wav", "ogg") else "mp3"
+        try:
+            duration = audio_io.probe(music_bytes)["duration"]
+        except Exception:
+            duration = 0.0
+        meta.update({"format": fmt, "mode": "vocal", "music_task_id": job.music_task_id,
+                     "music_audio_url": job.music_audio_url, "duration": float(duration)})
+        meta["django_file"] = ContentFile(music_bytes, name=f"{uuid.uuid4()}.{fmt}")
+        return meta
+    if not tts_audio_bytes:
+        meta.update({"duration": 0.0, "django_file": ContentFile(b"", name=f"{uuid.uuid4()}.mp3")})
+        return meta
+
+    with ExitStack() as stack:
+        blocks, sr, channels = _voice_blocks(tts_audio_bytes, job, stack)
+        if music_bytes is not None:
+            try:
+                path = stack.enter_context(audio_io.local_path(job.music_stem))
+                music = stack.enter_context(closing(audio_io.Decoder(path, sr, channels, loop=True)))
+                first = music.read(sr * _BLOCK_SEC)
+                if not first.shape[1]:
+                    raise RuntimeError("music stem is empty")
+                music = _Prefixed(first, music)
+                blocks = mix_voice_with_music(blocks, music, getattr(job, "music_volume_db", -10.0))
+                meta.update({"music_task_id": job.music_task_id, "music_audio_url": job.music_audio_url})
+            except Exception as e:
+                meta["music_error"] = str(e)
+
+        # The Suno bed already carries percussion: the local beat is only for vocals without music
+        if getattr(job, "add_percussion", False) and "music_task_id" not in meta:
+            try:
+                bed, kit = percussion.bed(job, sr)
+                if bed is not None:
+                    volume_db = float(getattr(settings, "PERCUSSION_VOLUME_DB", -12.0))
+                    blocks = mix_voice_with_music(blocks, audio_io.LoopReader(bed[None]), volume_db)
+                    meta["percussion"] = kit
+            except Exception as e:
+                meta["percussion_error"] = str(e)
+
+        draft = getattr(job, "quality", "final") == "draft"
+        bitrate = settings.DRAFT_BITRATE if draft else "192k"
+        meta["django_file"] = encode_blocks(blocks, sr, channels, f"{uuid.uuid4()}.mp3", bitrate=bitrate)
+        if draft:
+            meta["quality"] = "draft"
+    meta["duration"] = meta["django_file"].duration
     return meta
@@ -0,0 +1,87 @@
+import importlib
+import logging
+import os
+import threading
+from django.core.signals import setting_changed
+
+logger = logging.getLogger(__name__)
+
+# Provider registry: job.voice_provider / job.music_provider keys map to "module:Class" paths that are
+# imported and instantiated on first use, then reused by the process (SDK clients, gRPC channels and
+# pooled HTTP sessions are built once). Celery workers warm them in worker_process_init, after the fork.
+VOICE = "voice"
+MUSIC = "music"
+
+_targets = {
+    (VOICE, "elevenlabs"): "shilat.services.voice_providers.elevenlabs:ElevenLabsProvider",
+    (VOICE, "google"): "shilat.services.voice_providers.google_tts:GoogleTTSProvider",
+    (MUSIC, "sunoapi"): "shilat.services.music_providers.sunoapi:SunoApiProvider",
+    (MUSIC, "suno_vocal"): "shilat.services.music_providers.sunoapi:SunoApiProvider",
+}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(kind: str, key: str, target: str):
+    """Registers (or replaces) a provider class by dotted "module:Class" path; nothing is imported yet."""
+    with _lock:
+        _targets[(kind, key)] = target
+
+
+def keys(kind: str) -> list[str]:
+    return [k for (t, k) in _targets if t == kind]
+
+
+def _load(target: str):
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def get(kind: str, key: str):
+    try:
+        target = _targets[(kind, key)]
+    except KeyError:
+        raise ValueError(f"مزود غير معروف: {kind}/{key}")
+    # Keyed by pid: a client created before a fork must not be shared with the child
+    slot = (os.getpid(), target)
+    provider = _instances.get(slot)
+    if provider is None:
+        with _lock:
+            provider = _instances.get(slot)
+            if provider is None:
+                provider = _load(target)()
+                _instances[slot] = provider
+    return provider
+
+
+def voice(key: str):
+    return get(VOICE, key)
+
+
+def music(key: str):
+    return get(MUSIC, key)
+
+
+def warm() -> list[str]:
+    """Instantiates every registered provider that is configured; missing credentials are skipped."""
+    ready = []
+    for kind, key in list(_targets):
+        try:
+            get(kind, key)
+            ready.append(f"{kind}:{key}")
+        except Exception as e:
+            logger.info("provider %s/%s not warmed: %s", kind, key, e)
+    return ready
+
+
+def reset():
+    with _lock:
+        _instances.clear()
+
+
+def _on_setting_changed(**kwargs):
+    # Providers read their credentials/endpoints at construction time
+    reset()
+
+
+setting_changed.connect(_on_setting_changed)
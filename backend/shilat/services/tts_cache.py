@@ -0,0 +1,154 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+# Eviction trims the cache to this fraction of max_bytes, so the next writes do not each trigger a scan
+_LOW_WATER = 0.9
+
+
+def cache_key(provider: str, voice_id: str, model_id: str, voice_settings, language: str, text: str, **extra) -> str:
+    """Content address of one synthesis request (provider + voice + settings + post-lexicon text)."""
+    parts = {
+        "provider": provider,
+        "voice_id": voice_id or "",
+        "model_id": model_id or "",
+        "voice_settings": voice_settings or {},
+        "language": language or "",
+        "text": text,
+    }
+    if extra:
+        parts["extra"] = extra
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+
+def _count(name: str, n: int = 1):
+    with _lock:
+        _stats[name] += n
+
+
+class TTSCache:
+    """Disk cache of synthesized audio, evicted least-recently-used first once it grows past max_bytes.
+
+    Recency is tracked through the file mtime, which is bumped on every hit, so the cache
+    can be shared by every process that mounts the media volume. The total size is kept in a
+    sidecar file (<root>/.size, updated under flock), so a write only scans the directory when
+    the cache has actually outgrown max_bytes.
+    """
+
+    def __init__(self, root=None, max_bytes: int | None = None):
+        self.root = Path(root or getattr(settings, "TTS_CACHE_DIR", Path(settings.MEDIA_ROOT) / "tts_cache"))
+        self.max_bytes = int(max_bytes if max_bytes is not None else getattr(settings, "TTS_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        if self.max_bytes > 0 and self._update_size(len(data)) > self.max_bytes:
+            self.evict()
+
+    def _scan(self):
+        entries = []
+        for p in self.root.glob("*/*.bin"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def _update_size(self, added: int = 0, total: int | None = None) -> int:
+        """Adds to (or, given total, resets) the running size in the sidecar; scans when it is missing."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".size", "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if total is None:
+                f.seek(0)
+                raw = f.read().strip()
+                # Overwritten keys are counted twice: the estimate only errs high, and evict() resets it
+                total = int(raw) + added if raw.isdigit() else sum(size for _, size, _ in self._scan())
+            f.truncate(0)
+            f.write(str(total))
+        return total
+
+    def evict(self):
+        if self.max_bytes <= 0:
+            return 0
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > self.max_bytes:
+            target = int(self.max_bytes * _LOW_WATER)
+            entries.sort()
+            for _, size, p in entries:
+                if total <= target:
+                    break
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    continue
+                total -= size
+                removed += 1
+            _count("evictions", removed)
+        self._update_size(total=total)
+        return removed
+
+    def get_or_synthesize(self, key: str, synthesize) -> bytes:
+        data = self.get(key)
+        if data is not None:
+            _count("hits")
+            logger.info("tts cache hit %s", key[:12])
+            return data
+        _count("misses")
+        logger.info("tts cache miss %s", key[:12])
+        data = synthesize()
+        if data:
+            try:
+                self.put(key, data)
+            except OSError as e:
+                logger.warning("tts cache write failed: %s", e)
+        return data
+
+
+def get_or_synthesize(key: str, synthesize) -> bytes:
+    if not getattr(settings, "TTS_CACHE_ENABLED", True):
+        return synthesize()
+    return TTSCache().get_or_synthesize(key, synthesize)
@@ -0,0 +1,141 @@
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from django.conf import settings
+from pydub import AudioSegment
+from shilat.services import tts_cache
+from shilat.services.normalize import lines
+
+_SENTENCE_END = re.compile(r"(?<=[.!?؟؛…*])\s+")
+_HEMISTICH_BREAK = re.compile(r"\s*(?:\*|…|\.\.\.|،|\s-\s|\t)\s*")
+
+
+@dataclass
+class Chunk:
+    text: str
+    gap_ms: int
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def signature() -> dict:
+    """Stitching parameters that change the rendered audio (part of the stitched cache key)."""
+    return {
+        "verse_gap_ms": int(_setting("TTS_VERSE_GAP_MS", 350)),
+        "hemistich_gap_ms": int(_setting("TTS_HEMISTICH_GAP_MS", 120)),
+        "crossfade_ms": int(_setting("TTS_CROSSFADE_MS", 30)),
+        "max_chars": int(_setting("TTS_CHUNK_MAX_CHARS", 240)),
+    }
+
+
+def _split_long(text: str, max_chars: int) -> list[str]:
+    """Split an over-long verse into hemistichs: explicit separators first, then the word boundary nearest the middle."""
+    if len(text) <= max_chars:
+        return [text]
+    parts = [p for p in _HEMISTICH_BREAK.split(text) if p.strip()]
+    if len(parts) < 2:
+        parts = [p for p in _SENTENCE_END.split(text) if p.strip()]
+    if len(parts) < 2:
+        words = text.split()
+        if len(words) < 2:
+            return [text]
+        mid = len(text) / 2
+        best, best_dist, pos = 1, None, -1
+        for i in range(1, len(words)):
+            pos += len(words[i - 1]) + 1
+            dist = abs(pos - mid)
+            if best_dist is None or dist < best_dist:
+                best, best_dist = i, dist
+        parts = [" ".join(words[:best]), " ".join(words[best:])]
+    out = []
+    for p in parts:
+        out.extend(_split_long(p.strip(), max_chars))
+    return out
+
+
+def split_verses(text, max_chars: int | None = None) -> list[Chunk]:
+    """One chunk per verse (line); verses longer than max_chars are split into hemistichs.
+
+    text may be a NormalizedText, whose verses are used as they are.
+    """
+    sig = signature()
+    max_chars = max_chars or sig["max_chars"]
+    chunks = []
+    for line in lines(text):
+        parts = _split_long(line, max_chars)
+        for i, p in enumerate(parts):
+            last = i == len(parts) - 1
+            chunks.append(Chunk(p, sig["verse_gap_ms"] if last else sig["hemistich_gap_ms"]))
+    if chunks:
+        chunks[-1].gap_ms = 0
+    return chunks
+
+
+def pack_chunks(chunks: list[Chunk], max_bytes: int) -> list[Chunk]:
+    """Merge consecutive chunks back together while they fit a provider's per-request input limit."""
+    packed = []
+    for c in chunks:
+        if packed and len((packed[-1].text + "\n" + c.text).encode("utf-8")) <= max_bytes:
+            packed[-1] = Chunk(packed[-1].text + "\n" + c.text, c.gap_ms)
+        else:
+            packed.append(Chunk(c.text, c.gap_ms))
+    return packed
+
+
+def synthesize_units(chunks: list[Chunk], synth_one, max_workers: int | None = None) -> list[bytes]:
+    """Synthesize chunks concurrently on a bounded pool; results keep the input order."""
+    if not chunks:
+        return []
+    max_workers = max(1, min(int(max_workers or _setting("TTS_CHUNK_MAX_WORKERS", 4)), len(chunks)))
+    if max_workers == 1:
+        return [synth_one(c.text) for c in chunks]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-chunk") as pool:
+        return list(pool.map(lambda c: synth_one(c.text), chunks))
+
+
+def stitch(chunks: list[Chunk], audios: list[bytes], fmt: str = "mp3", crossfade_ms: int | None = None) -> bytes:
+    """Concatenate chunk audio with each chunk's trailing gap and a short crossfade at every join."""
+    crossfade_ms = signature()["crossfade_ms"] if crossfade_ms is None else int(crossfade_ms)
+    out = None
+    for chunk, data in zip(chunks, audios):
+        seg = AudioSegment.from_file(io.BytesIO(data), format=fmt)
+        if out is None:
+            out = seg
+        else:
+            xf = max(0, min(crossfade_ms, len(out), len(seg)))
+            out = out.append(seg, crossfade=xf)
+        if chunk.gap_ms:
+            out = out + AudioSegment.silent(duration=chunk.gap_ms, frame_rate=out.frame_rate)
+    if out is None:
+        return b""
+    buf = io.BytesIO()
+    if fmt == "mp3":
+        out.export(buf, format="mp3", bitrate="192k")
+    else:
+        out.export(buf, format=fmt)
+    return buf.getvalue()
+
+
+def synthesize(text: str, synth_one, key_for, fmt: str = "mp3", max_bytes: int | None = None) -> bytes:
+    """Provider-agnostic verse-chunked synthesis.
+
+    synth_one(text) -> audio bytes for one chunk (cached per chunk by the provider).
+    key_for(text, **extra) -> cache key; the stitched result is cached under it too.
+    max_bytes forces chunking for providers with a hard per-request input limit.
+    """
+    enabled = _setting("TTS_CHUNKED", True)
+    too_long = max_bytes and len(text.encode("utf-8")) > max_bytes
+    if not enabled and not too_long:
+        return synth_one(text)
+
+    chunks = split_verses(text)
+    if not enabled:
+        chunks = pack_chunks(chunks, max_bytes)
+    if len(chunks) <= 1:
+        return synth_one(text)
+
+    key = key_for(text, chunking=signature(), chunk_count=len(chunks))
+    return tts_cache.get_or_synthesize(key, lambda: stitch(chunks, synthesize_units(chunks, synth_one), fmt=fmt))
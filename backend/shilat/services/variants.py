@@ -0,0 +1,153 @@
+import os
+import posixpath
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from shilat.models import AudioVariant
+from shilat.services import audio_io
+
+# Delivery variants of a GeneratedAudio: encoded once by a worker on first request, then served from storage.
+# The AudioVariant rows (one per audio, kind and bitrate) are the index; a new mix drops them with purge().
+KINDS = {
+    "opus": {"bitrates": (32, 48, 64, 96), "default": 48},
+    "aac": {"bitrates": (64, 96, 128, 192), "default": 96},
+    "hls": {"bitrates": (64, 96, 128), "default": 96},
+}
+# Accept media types (lower case, without parameters) -> kind; None keeps the stored original
+_ACCEPT = {
+    "audio/ogg": "opus", "audio/opus": "opus", "audio/webm": "opus",
+    "audio/mp4": "aac", "audio/aac": "aac", "audio/x-m4a": "aac",
+    "application/vnd.apple.mpegurl": "hls", "application/x-mpegurl": "hls", "audio/mpegurl": "hls",
+    "audio/mpeg": None, "audio/mp3": None,
+}
+_FORMAT_ALIASES = {"m4a": "aac", "mp4": "aac", "ogg": "opus", "m3u8": "hls"}
+
+
+def _from_accept(header: str):
+    """Best kind the Accept header asks for, by q-value then order; "" when it names no audio type we know."""
+    offers = []
+    for i, part in enumerate((header or "").split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        media = fields[0].lower()
+        q = 1.0
+        for f in fields[1:]:
+            if f.startswith("q="):
+                try:
+                    q = float(f[2:])
+                except ValueError:
+                    q = 0.0
+        if media in _ACCEPT and q > 0:
+            offers.append((-q, i, _ACCEPT[media]))
+    return min(offers)[2] if offers else ""
+
+
+def choose(fmt: str = "", bitrate=None, accept: str = ""):
+    """(kind, kbps) to serve, or None for the original file. An unknown fmt raises ValueError."""
+    fmt = (fmt or "").strip().lower()
+    if not fmt:
+        kind = _from_accept(accept)
+    elif fmt in ("original", "mp3"):
+        kind = None
+    else:
+        kind = _FORMAT_ALIASES.get(fmt, fmt)
+        if kind not in KINDS:
+            raise ValueError(f"صيغة غير مدعومة: {fmt}")
+    if not kind:
+        return None
+    spec = KINDS[kind]
+    try:
+        wanted = int(str(bitrate).lower().rstrip("k")) if bitrate else spec["default"]
+    except ValueError:
+        raise ValueError(f"معدل بت غير صالح: {bitrate}")
+    # Snapped to the nearest offered bitrate so clients cannot fan out unbounded encodes
+    return kind, min(spec["bitrates"], key=lambda b: (abs(b - wanted), b))
+
+
+def request(audio, kind: str, bitrate: int):
+    """The variant row, enqueueing its build when it is new (or failed before); returns (variant, enqueued)."""
+    from shilat.tasks import build_audio_variant
+    variant, created = AudioVariant.objects.get_or_create(audio=audio, kind=kind, bitrate=bitrate)
+    if not created and variant.status == "failed":
+        created = bool(AudioVariant.objects.filter(id=variant.id, status="failed").update(status="pending", error=""))
+        variant.status = "pending"
+    if created:
+        build_audio_variant.delay(variant.id)
+    return variant, created
+
+
+def _store_dir(variant) -> str:
+    # Random per variant: nothing under variants/ can be found from job or audio ids
+    return f"variants/{variant.key.hex}"
+
+
+def build(variant):
+    """Encodes the variant from the stored mix and saves it (HLS: segments first, then the playlist)."""
+    audio = variant.audio
+    bitrate = f"{variant.bitrate}k"
+    with audio_io.local_path(audio.audio_file) as src:
+        if variant.kind != "hls":
+            ext = audio_io.EXTENSIONS.get(variant.kind, variant.kind)
+            encoded = audio_io.transcode(src, variant.kind, bitrate, f"audio.{ext}", audio.duration_sec)
+            try:
+                variant.file.name = default_storage.save(f"{_store_dir(variant)}/audio.{ext}", encoded)
+            finally:
+                encoded.cleanup()
+            variant.size = variant.file.size
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                names = audio_io.segment_hls(src, tmp, bitrate, int(getattr(settings, "HLS_SEGMENT_SEC", 6)))
+                renamed, size = {}, 0
+                for name in names[1:]:
+                    with open(os.path.join(tmp, name), "rb") as f:
+                        stored = default_storage.save(f"{_store_dir(variant)}/{name}", File(f))
+                    renamed[name] = posixpath.basename(stored)
+                    size += default_storage.size(stored)
+                # Storage may rename on collision: the playlist names what was actually stored
+                with open(os.path.join(tmp, names[0]), encoding="utf-8") as f:
+                    playlist = "".join(renamed.get(line.strip(), line.strip()) + "\n" for line in f)
+                variant.file.name = default_storage.save(f"{_store_dir(variant)}/{names[0]}",
+                                                         ContentFile(playlist.encode("utf-8")))
+                variant.size = size
+    variant.status = "ready"
+    variant.error = ""
+    variant.save(update_fields=["file", "size", "status", "error"])
+
+
+def _playlist_entries(variant):
+    """(line, storage name or None) for each line of an HLS variant's playlist."""
+    folder = posixpath.dirname(variant.file.name)
+    with default_storage.open(variant.file.name) as f:
+        lines = f.read().decode("utf-8").splitlines()
+    return [(line, None if not line.strip() or line.startswith("#") else posixpath.join(folder, line.strip()))
+            for line in lines]
+
+
+def playlist(variant, segment_base: str) -> str:
+    """The HLS playlist with each segment pointing at segment_base + its file name (the checked segment view)."""
+    return "".join(f"{segment_base}{posixpath.basename(name)}\n" if name else f"{line}\n"
+                   for line, name in _playlist_entries(variant))
+
+
+def segment(variant, name: str):
+    """Storage name of one of the variant's HLS segments, or None if its playlist does not list name."""
+    for _, stored in _playlist_entries(variant):
+        if stored and posixpath.basename(stored) == name:
+            return stored
+    return None
+
+
+def purge(audio) -> int:
+    """Deletes every variant of an audio and its files (the mix they were made from has changed)."""
+    removed = 0
+    for variant in AudioVariant.objects.filter(audio=audio):
+        if variant.file:
+            names = []
+            if variant.kind == "hls" and default_storage.exists(variant.file.name):
+                names = [name for _, name in _playlist_entries(variant) if name]
+            for name in names + [variant.file.name]:
+                default_storage.delete(name)
+        variant.delete()
+        removed += 1
+    return removed
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from shilat.services import providers
+from shilat.services.voice_providers.elevenlabs import DIALECT_BUCKETS, _is_arabic_voice, _match_dialect
+
+logger = logging.getLogger(__name__)
+
+# Voice catalogs are fetched in the background (Celery beat + stale-while-revalidate), stored in the
+# shared cache with a prebuilt index, and answered from process memory by the /voices endpoint.
+SNAPSHOT_VERSION = 1
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _norm(s: str) -> str:
+    return (s or "").strip().lower()
+
+
+def language_key(provider: str, language: str) -> str:
+    lang = _norm(language)
+    if provider == "elevenlabs":
+        return "ar" if lang.startswith("ar") else (lang or "all")
+    return (language or "").strip() or _setting("GOOGLE_TTS_LANGUAGE", "ar-XA")
+
+
+def _cache_key(provider: str, lang_key: str) -> str:
+    return f"voices:v{SNAPSHOT_VERSION}:{provider}:{lang_key}"
+
+
+def _positions(index: dict, name: str, value=None) -> set:
+    bucket = index.get(name, {})
+    if value is None:
+        return set(bucket)
+    return set(bucket.get(value, ()))
+
+
+def _build_elevenlabs(lang_key: str) -> dict:
+    provider = providers.voice("elevenlabs")
+    # Intentionally the full catalog whatever a caller asked for: one snapshot per language serves every
+    # include_community/include_catalog/include_verified combination through the "source" index
+    raw = provider.fetch_catalog(lang_key, include_community=True, include_catalog=True)
+    voices = []
+    index = {"arabic": [], "arabic_verified": [], "source": {}, "dialect": {}, "gender": {}}
+    for pos, (source, v) in enumerate(raw):
+        item = provider.voice_item(v)
+        voices.append(item)
+        index["source"].setdefault(source, []).append(pos)
+        if _is_arabic_voice(v):
+            index["arabic"].append(pos)
+        if _is_arabic_voice(v, include_verified=True):
+            index["arabic_verified"].append(pos)
+        for bucket in DIALECT_BUCKETS:
+            if _match_dialect(item, bucket):
+                index["dialect"].setdefault(bucket, []).append(pos)
+        gender = _norm(item["labels"].get("gender"))
+        if gender:
+            index["gender"].setdefault(gender, []).append(pos)
+    return {"voices": voices, "index": index}
+
+
+def _build_google(lang_key: str) -> dict:
+    voices = providers.voice("google").list_voices(language_code=lang_key)
+    index = {"gender": {}}
+    for pos, item in enumerate(voices):
+        index["gender"].setdefault(item["labels"]["gender"], []).append(pos)
+    return {"voices": voices, "index": index}
+
+
+BUILDERS = {"elevenlabs": _build_elevenlabs, "google": _build_google}
+
+
+def refresh(provider: str, lang_key: str) -> dict:
+    """Fetches the provider catalog, rebuilds the index and publishes it to the shared cache."""
+    snap = BUILDERS[provider](lang_key)
+    snap["fetched_at"] = time.time()
+    cache.set(_cache_key(provider, lang_key), snap, timeout=_setting("VOICE_CATALOG_MAX_AGE_SEC", 86400))
+    cache.delete(_cache_key(provider, lang_key) + ":refreshing")
+    _remember(provider, lang_key, snap)
+    logger.info("voice catalog %s/%s refreshed: %d voices", provider, lang_key, len(snap["voices"]))
+    return snap
+
+
+def _remember(provider, lang_key, snap):
+    prepared = {
+        "snap": snap,
+        "checked_at": time.time(),
+        "index": {
+            name: ({k: set(v) for k, v in val.items()} if isinstance(val, dict) else set(val))
+            for name, val in snap["index"].items()
+        },
+    }
+    with _local_lock:
+        _local[(provider, lang_key)] = prepared
+    return prepared
+
+
+def _schedule_refresh(provider: str, lang_key: str):
+    # One background refresh at a time per catalog across all processes
+    if cache.add(_cache_key(provider, lang_key) + ":refreshing", 1, timeout=300):
+        from shilat.tasks import refresh_voice_catalog
+        refresh_voice_catalog.delay(provider, lang_key)
+
+
+def _cold_fill(provider: str, lang_key: str):
+    """Snapshot for an empty cache: one request fetches it inline, concurrent ones wait for that fetch.
+
+    Returns None when the fetch did not land within VOICE_CATALOG_COLD_WAIT_SEC.
+    """
+    key = _cache_key(provider, lang_key)
+    if cache.add(key + ":building", 1, timeout=120):
+        try:
+            return refresh(provider, lang_key)
+        finally:
+            cache.delete(key + ":building")
+    deadline = time.time() + _setting("VOICE_CATALOG_COLD_WAIT_SEC", 10)
+    while time.time() < deadline:
+        time.sleep(0.2)
+        snap = cache.get(key)
+        if snap is not None:
+            return snap
+    return None
+
+
+def _catalog(provider: str, lang_key: str) -> dict:
+    now = time.time()
+    entry = _local.get((provider, lang_key))
+    if entry is None or now - entry["checked_at"] > _setting("VOICE_CATALOG_LOCAL_TTL_SEC", 30):
+        snap = cache.get(_cache_key(provider, lang_key))
+        if snap is None:
+            # Cold start: nothing cached anywhere yet
+            snap = _cold_fill(provider, lang_key)
+            if snap is None:
+                # Still being fetched elsewhere: an empty list now beats piling on the provider
+                return {"snap": {"voices": [], "fetched_at": now}, "index": {}}
+        if entry is None or entry["snap"]["fetched_at"] != snap["fetched_at"]:
+            entry = _remember(provider, lang_key, snap)
+        else:
+            entry["checked_at"] = now
+    if now - entry["snap"]["fetched_at"] > _setting("VOICE_CATALOG_FRESH_SEC", 900):
+        _schedule_refresh(provider, lang_key)
+    return entry
+
+
+def elevenlabs_voices(language: str = "ar", dialect: str | None = None, include_community: bool = True,
+                      include_verified: bool = False, include_catalog: bool = False, gender: str = ""):
+    """Same result as ElevenLabsProvider.list_voices, answered from the indexed snapshot."""
+    lang_key = language_key("elevenlabs", language)
+    entry = _catalog("elevenlabs", lang_key)
+    voices, index = entry["snap"]["voices"], entry["index"]
+
+    picked = _positions(index, "source", "base")
+    if include_community:
+        picked |= _positions(index, "source", "community")
+    if include_catalog:
+        picked |= _positions(index, "source", "catalog")
+
+    lang_norm = _norm(language)
+    filter_ar = lang_norm.startswith("ar") and lang_norm not in ("", "all", "any")
+    if filter_ar:
+        picked &= _positions(index, "arabic_verified" if include_verified else "arabic")
+        if dialect and _norm(dialect) in DIALECT_BUCKETS:
+            picked &= _positions(index, "dialect", _norm(dialect))
+        elif dialect:
+            picked = {p for p in picked if _match_dialect(voices[p], dialect)}
+    if gender:
+        picked &= _positions(index, "gender", _norm(gender))
+    return [voices[p] for p in sorted(picked)]
+
+
+def google_voices(language_code: str | None = None, gender: str | None = None):
+    lang_key = language_key("google", language_code or "")
+    entry = _catalog("google", lang_key)
+    voices, index = entry["snap"]["voices"], entry["index"]
+    gender = (gender or "").upper()
+    if gender in ("MALE", "FEMALE", "NEUTRAL"):
+        return [voices[p] for p in sorted(_positions(index, "gender", gender))]
+    return list(voices)
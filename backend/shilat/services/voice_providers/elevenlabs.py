@@ -2,9 +2,23 @@
 import re
 import requests
 from django.conf import settings
+from shilat.services import http_client, tts_cache, tts_chunking
 
 _ARABIC_RE = re.compile(r"[\u0600-\u06FF]")
 
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.35,
+    "similarity_boost": 0.85,
+    "style": 0.55,
+    "use_speaker_boost": True,
+}
+
+DIALECT_BUCKETS = {
+    "najdi": ["najdi", "najd", "saudi", "ksa", "riyadh", "qassim"],
+    "hijazi": ["hijazi", "hejaz", "jeddah", "makkah", "mecca", "medina", "taif"],
+    "khaliji": ["gulf", "khaleeji", "khaliji", "emirati", "kuwait", "qatari", "bahrain", "omani", "uae"],
+}
+
 
 def _norm(s: str) -> str:
     return (s or "").strip().lower()
@@ -52,13 +66,7 @@ def _match_dialect(v: dict, dialect: str | None) -> bool:
         _norm(labels.get("region") or ""),
         _norm(labels.get("description") or ""),
     ])
-
-    buckets = {
-        "najdi": ["najdi", "najd", "saudi", "ksa", "riyadh", "qassim"],
-        "hijazi": ["hijazi", "hejaz", "jeddah", "makkah", "mecca", "medina", "taif"],
-        "khaliji": ["gulf", "khaleeji", "khaliji", "emirati", "kuwait", "qatari", "bahrain", "omani", "uae"],
-    }
-    keys = buckets.get(dialect, [dialect])
+    keys = DIALECT_BUCKETS.get(dialect, [dialect])
     return any(k in hay for k in keys)
 
 
@@ -67,6 +75,7 @@ class ElevenLabsProvider:
         self.api_key = settings.ELEVENLABS_API_KEY
         self.base_url = "https://api.elevenlabs.io"
         self.model_id = settings.ELEVENLABS_MODEL_ID
+        self.http = http_client.session("elevenlabs")
 
     def _headers(self, accept="application/json"):
         return {
@@ -97,7 +106,7 @@ class ElevenLabsProvider:
             q = dict(params)
             if next_token:
                 q["next_page_token"] = next_token
-            r = requests.get(url, headers=self._headers(), params=q, timeout=30)
+            r = self.http.get(url, headers=self._headers(), params=q, timeout=http_client.timeout("elevenlabs"))
             try:
                 r.raise_for_status()
             except requests.HTTPError:
@@ -119,7 +128,7 @@ class ElevenLabsProvider:
             params = {"page": page, "page_size": page_size}
             if language and language not in ("all", "any", ""):
                 params["language"] = language
-            r = requests.get(url, headers=self._headers(), params=params, timeout=30)
+            r = self.http.get(url, headers=self._headers(), params=params, timeout=http_client.timeout("elevenlabs"))
             if r.status_code in (401, 402, 403, 404):
                 break
             r.raise_for_status()
@@ -130,60 +139,61 @@ class ElevenLabsProvider:
                 break
         return voices
 
-    def list_voices(
-        self,
-        language: str = "ar",
-        dialect: str | None = None,
-        include_community: bool = True,
-        include_verified: bool = False,
-        include_catalog: bool = False,
-    ):
+    def fetch_catalog(self, language: str = "ar", include_community: bool = True, include_catalog: bool = False):
+        """Raw voices as (source, voice) pairs, deduplicated in base → community → catalog order."""
         if not self.api_key:
             raise RuntimeError("ELEVENLABS_API_KEY غير موجود")
 
         all_voices = []
         seen = set()
 
-        base_list = self._list_voices_v2({"page_size": 100}, allow_fail=False)
-        for v in base_list:
-            vid = v.get("voice_id")
-            if vid and vid not in seen:
-                seen.add(vid)
-                all_voices.append(v)
+        def add(source, voices):
+            for v in voices:
+                vid = v.get("voice_id")
+                if vid and vid not in seen:
+                    seen.add(vid)
+                    all_voices.append((source, v))
+
+        add("base", self._list_voices_v2({"page_size": 100}, allow_fail=False))
 
         if include_community:
             comm_params = {"page_size": 100, "voice_type": "community"}
             if language and _norm(language).startswith("ar"):
                 comm_params["search"] = "arabic"
-            comm_list = self._list_voices_v2(comm_params, allow_fail=True)
-            for v in comm_list:
-                vid = v.get("voice_id")
-                if vid and vid not in seen:
-                    seen.add(vid)
-                    all_voices.append(v)
+            add("community", self._list_voices_v2(comm_params, allow_fail=True))
 
         if include_catalog:
-            cat_list = self._search_library(_norm(language))
-            for v in cat_list:
-                vid = v.get("voice_id")
-                if vid and vid not in seen:
-                    seen.add(vid)
-                    all_voices.append(v)
+            add("catalog", self._search_library(_norm(language)))
+        return all_voices
+
+    def voice_item(self, v: dict) -> dict:
+        return {
+            "voice_id": v.get("voice_id"),
+            "name": v.get("name"),
+            "category": v.get("category"),
+            "preview_url": self._pick_preview(v),
+            "labels": v.get("labels", {}) or {},
+            "fine_tuning": v.get("fine_tuning") or {},
+            "verified_languages": v.get("verified_languages") or [],
+        }
+
+    def list_voices(
+        self,
+        language: str = "ar",
+        dialect: str | None = None,
+        include_community: bool = True,
+        include_verified: bool = False,
+        include_catalog: bool = False,
+    ):
+        """Live listing (several paginated API calls); the API serves shilat.services.voice_catalog instead."""
+        all_voices = self.fetch_catalog(language, include_community=include_community, include_catalog=include_catalog)
 
         lang_norm = _norm(language)
         filter_ar = lang_norm.startswith("ar") and lang_norm not in ("", "all", "any")
 
         out = []
-        for v in all_voices:
-            item = {
-                "voice_id": v.get("voice_id"),
-                "name": v.get("name"),
-                "category": v.get("category"),
-                "preview_url": self._pick_preview(v),
-                "labels": v.get("labels", {}) or {},
-                "fine_tuning": v.get("fine_tuning") or {},
-                "verified_languages": v.get("verified_languages") or [],
-            }
+        for _, v in all_voices:
+            item = self.voice_item(v)
             if filter_ar and not _is_arabic_voice(v, include_verified=include_verified):
                 continue
             if dialect and filter_ar and not _match_dialect(item, dialect):
@@ -191,32 +201,69 @@ class ElevenLabsProvider:
             out.append(item)
         return out
 
+    def model_for(self, job) -> str:
+        """Draft previews use the cheapest model (ELEVENLABS_DRAFT_MODEL_ID)."""
+        if getattr(job, "quality", "final") == "draft":
+            return getattr(settings, "ELEVENLABS_DRAFT_MODEL_ID", "") or self.model_id
+        return self.model_id
+
+    def _voice_id(self, job) -> str:
+        """ELEVENLABS_VOICE_ID, when set, overrides the job's chosen voice."""
+        return (os.getenv("ELEVENLABS_VOICE_ID") or settings.ELEVENLABS_VOICE_ID or "").strip() or job.voice_actor
+
+    def stem_key(self, job) -> str:
+        """Content address of the job's whole vocal: the voice, model and settings it is synthesized with."""
+        return tts_cache.cache_key("elevenlabs", self._voice_id(job), self.model_for(job), DEFAULT_VOICE_SETTINGS, "",
+                                   (job.submission.cleaned_text or "").strip(), stem=True)
+
     def synthesize_shilat(self, job, pronunciation_dictionary_locators=None):
         if not self.api_key:
             raise RuntimeError("ELEVENLABS_API_KEY غير موجود في .env")
 
-        voice_id = (os.getenv("ELEVENLABS_VOICE_ID") or settings.ELEVENLABS_VOICE_ID or "").strip()
-        if not voice_id:
-            voice_id = job.voice_actor
+        voice_id = self._voice_id(job)
 
         text = (job.submission.cleaned_text or "").strip()
         if not text:
             raise RuntimeError("النص المنظف فارغ")
 
+        locators = pronunciation_dictionary_locators or []
+        voice_settings = dict(DEFAULT_VOICE_SETTINGS)
+        model_id = self.model_for(job)
+        return tts_chunking.synthesize(
+            text,
+            lambda t: self.synthesize_text(t, voice_id, voice_settings, pronunciation_dictionary_locators=locators,
+                                           model_id=model_id),
+            lambda t, **extra: tts_cache.cache_key(
+                "elevenlabs", voice_id, model_id, voice_settings, "", t,
+                pronunciation_dictionary_locators=locators, **extra,
+            ),
+        )
+
+    def synthesize_job(self, job) -> bytes:
+        return self.synthesize_shilat(job, pronunciation_dictionary_locators=None)
+
+    def synthesize_text(self, text: str, voice_id: str, voice_settings=None, pronunciation_dictionary_locators=None,
+                        model_id: str | None = None):
+        voice_settings = voice_settings or dict(DEFAULT_VOICE_SETTINGS)
+        model_id = model_id or self.model_id
         payload = {
             "text": text,
-            "model_id": self.model_id,
-            "voice_settings": {
-                "stability": 0.35,
-                "similarity_boost": 0.85,
-                "style": 0.55,
-                "use_speaker_boost": True,
-            },
+            "model_id": model_id,
+            "voice_settings": voice_settings,
         }
         if pronunciation_dictionary_locators:
             payload["pronunciation_dictionary_locators"] = pronunciation_dictionary_locators
 
-        url = f"{self.base_url}/v1/text-to-speech/{voice_id}"
-        r = requests.post(url, json=payload, headers=self._headers(accept="audio/mpeg"), timeout=90)
-        r.raise_for_status()
-        return r.content
+        key = tts_cache.cache_key(
+            "elevenlabs", voice_id, model_id, voice_settings, "", text,
+            pronunciation_dictionary_locators=pronunciation_dictionary_locators or [],
+        )
+
+        def _request():
+            url = f"{self.base_url}/v1/text-to-speech/{voice_id}"
+            r = self.http.post(url, json=payload, headers=self._headers(accept="audio/mpeg"),
+                               timeout=http_client.timeout("elevenlabs", "tts"))
+            r.raise_for_status()
+            return r.content
+
+        return tts_cache.get_or_synthesize(key, _request)
@@ -1,6 +1,11 @@
 import os
 from django.conf import settings
 from google.cloud import texttospeech
+from shilat.services import tts_cache, tts_chunking
+
+# Google TTS rejects requests whose input exceeds 5000 bytes.
+MAX_INPUT_BYTES = 4800
+_ENCODING_FORMATS = {"MP3": "mp3", "OGG_OPUS": "ogg", "LINEAR16": "wav"}
 
 
 class GoogleTTSProvider:
@@ -59,6 +64,30 @@ class GoogleTTSProvider:
 
         lang = language_code or self.language
 
+        def key_for(t, **extra):
+            return self._key(t, voice_name, lang, speaking_rate, pitch, **extra)
+
+        return tts_chunking.synthesize(
+            text,
+            lambda t: tts_cache.get_or_synthesize(key_for(t), lambda: self._synthesize_one(t, voice_name, lang, speaking_rate, pitch)),
+            key_for,
+            fmt=_ENCODING_FORMATS.get(self.default_encoding, "mp3"),
+            max_bytes=MAX_INPUT_BYTES,
+        )
+
+    def _key(self, text: str, voice_name: str, lang: str, speaking_rate: float = 1.0, pitch: float = 0.0, **extra) -> str:
+        voice_settings = {"speaking_rate": speaking_rate, "pitch": pitch}
+        return tts_cache.cache_key("google", voice_name, "", voice_settings, lang, text,
+                                   audio_encoding=self.default_encoding, **extra)
+
+    def synthesize_job(self, job) -> bytes:
+        return self.synthesize(job.submission.cleaned_text, voice_id=job.voice_actor or self.default_voice)
+
+    def stem_key(self, job) -> str:
+        """Content address of the job's whole vocal, with the voice, language and encoding synthesize_job uses."""
+        return self._key(job.submission.cleaned_text, job.voice_actor or self.default_voice, self.language, stem=True)
+
+    def _synthesize_one(self, text: str, voice_name: str, lang: str, speaking_rate: float, pitch: float):
         synthesis_input = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(language_code=lang, name=voice_name)
 
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import DialectLexiconRule
+from .services.dialect import bump_version
+
+@receiver(post_save, sender=DialectLexiconRule)
+@receiver(post_delete, sender=DialectLexiconRule)
+def invalidate_lexicon(sender, instance, **kwargs):
+    bump_version(instance.dialect)
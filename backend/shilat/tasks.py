@@ -1,51 +1,375 @@
-from celery import shared_task
+import json
+import logging
+from datetime import timedelta
+from functools import partial
+import requests
+from celery import group, shared_task
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db import transaction
-from shilat.models import VoiceConversionJob, GeneratedAudio
+from django.utils import timezone
+from shilat.models import AudioVariant, MusicBed, VoiceConversionJob, GeneratedAudio
 from django.conf import settings
-from shilat.services.voice_providers.elevenlabs import ElevenLabsProvider
-from shilat.services.voice_providers.google_tts import GoogleTTSProvider
-from shilat.services.postprocess import post_process_audio
+from shilat.services.postprocess import post_process_audio, request_music
 from shilat.services.dialect import apply_dialect_lexicon
+from shilat.services.normalize import lines, normalize_text
+from shilat.services.music_providers import sunoapi
+from shilat.services import events, music_beds, providers, variants, voice_catalog
 
-@shared_task(bind=True, max_retries=1)
-def generate_shilat_audio(self, job_id: str):
-    job = VoiceConversionJob.objects.get(id=job_id)
-    job.status = "running"
-    job.save(update_fields=["status"])
+# Pipeline: generate_shilat_audio fans out to (synthesize_voice | request_job_music) in parallel,
+# then mix_audio (CPU, routable to its own queue) -> persist_audio. Stages hand audio over through
+# artifacts on the job (voice_stem, music_task_id/music_audio_url, music_stem), never through the
+# broker. Those artifacts double as checkpoints: a retried or resumed job skips every finished stage.
+# Every stage transition is also published to the job's event stream (shilat.services.events).
+
+logger = logging.getLogger(__name__)
+
+# Transient provider/network errors are retried (from the last checkpoint) before failing the job
+RETRYABLE = (requests.RequestException,)
+
+def _wants_music(job) -> bool:
+    return job.add_music and job.music_provider in ("sunoapi", "suno_vocal")
+
+def _draft_beat_only(job) -> bool:
+    """A preview without a ready library bed: mixed over the local beat, its saved settings untouched."""
+    return job.quality == "draft" and _wants_music(job) and not job.music_audio_url
+
+def _fail(job_id, e):
+    VoiceConversionJob.objects.filter(id=job_id).update(status="failed", error_message=str(e))
+    events.publish(job_id, status="failed", error_message=str(e))
+
+def _retry_or_fail(task, job_id, e):
+    if isinstance(e, RETRYABLE) and task.request.retries < task.max_retries:
+        raise task.retry(exc=e, countdown=10 * (2 ** task.request.retries))
+    _fail(job_id, e)
+    raise e
+
+def enqueue_mix(job_id):
+    (mix_audio.si(str(job_id)) | persist_audio.s(str(job_id))).delay()
+
+def record_music_result(job_id, audio_url: str = "", error: str = "") -> bool:
+    """Stores the music outcome once and enqueues the mix/persist stages.
+
+    Called by the Suno callback and by the fallback sweeper; the conditional update makes
+    sure only the first of them moves the job forward. A job waiting on a library bed
+    records the result on the bed, which releases every job waiting on it.
+    """
+    bed_id = VoiceConversionJob.objects.filter(id=job_id).values_list("music_bed_id", flat=True).first()
+    if bed_id:
+        return record_bed_result(bed_id, audio_url=audio_url, error=error) > 0
+    return _record_job_music(job_id, audio_url, error)
+
+def _record_job_music(job_id, audio_url: str, error: str) -> bool:
+    updated = VoiceConversionJob.objects.filter(
+        id=job_id, status="running", music_audio_url="", music_error="",
+    ).update(music_audio_url=audio_url, music_error=error)
+    if updated:
+        enqueue_mix(str(job_id))
+    return bool(updated)
+
+def record_bed_result(bed_id, audio_url: str = "", error: str = "") -> int:
+    """Marks a rendering bed ready (or failed) once; returns how many waiting jobs were released."""
+    done = MusicBed.objects.filter(id=bed_id, status="pending").update(
+        status="ready" if audio_url else "failed", audio_url=audio_url, error=error,
+    )
+    if done and audio_url:
+        store_music_bed.delay(bed_id)
+    # A late or repeated result never overrides the first one
+    audio_url, error = MusicBed.objects.filter(id=bed_id).values_list("audio_url", "error").get()
+    waiting = VoiceConversionJob.objects.filter(music_bed_id=bed_id, status="running", music_audio_url="", music_error="")
+    return sum(_record_job_music(job_id, audio_url, error) for job_id in waiting.values_list("id", flat=True))
+
+@shared_task(bind=True, max_retries=3)
+def store_music_bed(self, bed_id):
+    """Copies a newly ready bed into storage (skipped when already stored)."""
+    bed = MusicBed.objects.filter(id=bed_id, status="ready").first()
+    if bed is None or bed.audio_file:
+        return False
     try:
-        job.submission.cleaned_text = apply_dialect_lexicon(job.submission.cleaned_text, job.cultural_style.key)
+        music_beds.store(bed)
+    except RETRYABLE as e:
+        raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+    return True
 
-        # If we will generate a full vocal track via Suno, skip TTS
-        if job.music_provider == "suno_vocal":
-            audio_bytes = b""
-        elif job.voice_provider == "google":
-            g = GoogleTTSProvider()
-            audio_bytes = g.synthesize(
-                job.submission.cleaned_text,
-                voice_id=job.voice_actor or getattr(settings, "GOOGLE_TTS_VOICE_NAME", ""),
-                language_code=getattr(settings, "GOOGLE_TTS_LANGUAGE", "ar-XA"),
-            )
+@shared_task
+def generate_shilat_audio(job_id: str):
+    """Starts (or resumes) the pipeline; stages with a checkpoint on the job return immediately."""
+    VoiceConversionJob.objects.filter(id=job_id).update(status="running", stage="synthesizing", error_message="")
+    events.publish(job_id, status="running", stage="synthesizing", error_message="")
+    stages = [synthesize_voice.si(job_id), request_job_music.si(job_id), mix_audio.si(job_id), persist_audio.s(job_id)]
+    if VoiceConversionJob.objects.filter(id=job_id, quality="draft").exists():
+        # Previews skip the CPU queue and the full renders waiting on it
+        stages = [sig.set(queue=settings.CELERY_DRAFT_QUEUE) for sig in stages]
+    pipeline = group(stages[0], stages[1]) | stages[2] | stages[3]
+    pipeline.apply_async()
+    return True
+
+@shared_task(bind=True, max_retries=2)
+def synthesize_voice(self, job_id: str):
+    job = VoiceConversionJob.objects.select_related("submission", "cultural_style").get(id=job_id)
+    # If we will generate a full vocal track via Suno, skip TTS
+    if job.music_provider == "suno_vocal" and job.add_music:
+        return False
+    if job.voice_stem:
+        return True
+    try:
+        doc = normalize_text(job.submission.cleaned_text)
+        if job.quality == "draft":
+            doc = normalize_text("\n".join(lines(doc)[:settings.DRAFT_MAX_VERSES]))
+        job.submission.cleaned_text = apply_dialect_lexicon(doc, job.cultural_style.key)
+        provider = providers.voice(job.voice_provider)
+        # Only the provider knows the voice, model and settings it really synthesizes with; without stem_key
+        # its stems are never shared
+        job.voice_key = provider.stem_key(job) if hasattr(provider, "stem_key") else ""
+        # Same text, voice and model as an earlier job (a draft or a re-render): share its stem
+        shared = job.voice_key and (VoiceConversionJob.objects.filter(voice_key=job.voice_key).exclude(id=job.id)
+                                    .exclude(voice_stem="").values_list("voice_stem", flat=True).first())
+        if shared:
+            job.voice_stem.name = shared
         else:
-            provider = ElevenLabsProvider()
-            audio_bytes = provider.synthesize_shilat(job, pronunciation_dictionary_locators=None)
+            job.voice_stem.save(f"{job.id}.mp3", ContentFile(provider.synthesize_job(job)), save=False)
+        job.save(update_fields=["voice_stem", "voice_key"])
+        events.publish(job_id, milestone="voice_ready")
+        return True
+    except Exception as e:
+        _retry_or_fail(self, job_id, e)
 
-        meta = post_process_audio(audio_bytes, job)
+@shared_task(bind=True, max_retries=2)
+def request_job_music(self, job_id: str):
+    """Submits the Suno render and returns at once; its callback (or the sweeper) resumes the job."""
+    job = VoiceConversionJob.objects.select_related("submission", "cultural_style", "melody__school", "music_bed").get(id=job_id)
+    if not _wants_music(job):
+        return False
+    if job.quality == "draft" and not job.music_audio_url:
+        # Previews never wait on Suno: a ready library bed, else the local beat stands in for the music
+        bed = music_beds.pick(music_beds.slot(job)) if job.music_provider == "sunoapi" else None
+        if bed is not None:
+            music_beds.assign(job, "", bed=bed)
+        return True
+    if job.music_bed_id and job.music_bed.status != "pending":
+        if not (job.music_audio_url or job.music_error):
+            bed = job.music_bed
+            _record_job_music(job_id, bed.audio_url, bed.error or ("" if bed.audio_url else "music not available"))
+        return True
+    if job.music_task_id:
+        # Already submitted on an earlier attempt: never start (and pay for) a second render.
+        if not (job.music_audio_url or job.music_error):
+            try:
+                url = sunoapi.audio_url_from_details(providers.music(job.music_provider).get_details(job.music_task_id))
+            except Exception:
+                url = ""
+            if url:
+                VoiceConversionJob.objects.filter(id=job_id, music_audio_url="").update(music_audio_url=url)
+        return True
+    try:
+        if job.music_provider == "sunoapi" and getattr(settings, "MUSIC_BED_LIBRARY", True):
+            # Shared instrumental beds: most jobs find a ready one and never wait on Suno
+            music_beds.assign(job, sunoapi.callback_url(job.id))
+        else:
+            request_music(job, sunoapi.callback_url(job.id))
+        return True
+    except Exception as e:
+        if job.music_provider == "suno_vocal":
+            _retry_or_fail(self, job_id, e)
+        # An instrumental bed is optional: finish with the vocal alone
+        VoiceConversionJob.objects.filter(id=job_id).update(music_error=str(e))
+        return False
+
+def _mix_and_store(job) -> dict:
+    """Mixes the job's stems with its current settings and saves the result; returns the GeneratedAudio meta."""
+    if _draft_beat_only(job):
+        job.add_music, job.add_percussion = False, True
+    audio_bytes = b""
+    if job.voice_stem:
+        with job.voice_stem.open("rb") as f:
+            audio_bytes = f.read()
+    meta = post_process_audio(audio_bytes, job)
+    django_file = meta.pop("django_file")
+    try:
+        meta["name"] = default_storage.save(f"generated/{django_file.name}", django_file)
+    finally:
+        # Encoded output lives in a temp file that storage has just streamed from
+        if hasattr(django_file, "cleanup"):
+            django_file.cleanup()
+    meta["stems"] = {"voice": job.voice_stem.name or "", "music": job.music_stem.name or ""}
+    return meta
+
+@shared_task(bind=True, max_retries=2)
+def mix_audio(self, job_id: str):
+    """Mixes and encodes the final track once every input is in; returns None while still waiting."""
+    job = VoiceConversionJob.objects.select_related("melody__school").get(id=job_id)
+    if job.status != "running":
+        return None
+    voice_ready = bool(job.voice_stem) or job.music_provider == "suno_vocal"
+    music_ready = not _wants_music(job) or _draft_beat_only(job) or bool(job.music_audio_url or job.music_error)
+    if not (voice_ready and music_ready):
+        if voice_ready and VoiceConversionJob.objects.filter(id=job_id, stage="synthesizing").update(stage="awaiting_music"):
+            events.publish(job_id, stage="awaiting_music")
+        return None
+    # The chord and a music callback may both get here; only one of them mixes.
+    claimed = VoiceConversionJob.objects.filter(id=job_id, status="running").exclude(stage="mixing").update(stage="mixing")
+    if not claimed:
+        return None
+    events.publish(job_id, stage="mixing")
+    try:
+        return _mix_and_store(job)
+    except Exception as e:
+        # Release the claim so the retry (or a manual resume) can mix again
+        VoiceConversionJob.objects.filter(id=job_id, stage="mixing").update(stage="awaiting_music")
+        events.publish(job_id, stage="awaiting_music")
+        _retry_or_fail(self, job_id, e)
 
+@shared_task(bind=True, max_retries=2)
+def persist_audio(self, meta, job_id: str, changes=None):
+    """Records the mix (and, for a remix, the settings it was made with) and marks the job done."""
+    if not meta:
+        return False
+    try:
         with transaction.atomic():
-            GeneratedAudio.objects.update_or_create(
-                job=job,
+            audio, created = GeneratedAudio.objects.update_or_create(
+                job_id=job_id,
                 defaults={
-                    "audio_file": meta["django_file"],
+                    "audio_file": meta["name"],
                     "format": meta.get("format","mp3"),
                     "duration_sec": meta.get("duration",0.0),
-                    "meta_json": {k:v for k,v in meta.items() if k != "django_file"},
+                    "meta_json": {k:v for k,v in meta.items() if k != "name"},
                 }
             )
-            job.status = "succeeded"
-            job.save(update_fields=["status"])
+            VoiceConversionJob.objects.filter(id=job_id).update(status="succeeded", stage="done", **(changes or {}))
+        events.publish(job_id, status="succeeded", stage="done", has_audio=True)
+        if not created:
+            # Delivery variants were encoded from the previous mix
+            variants.purge(audio)
         return True
     except Exception as e:
-        job.status = "failed"
-        job.error_message = str(e)
-        job.save(update_fields=["status","error_message"])
+        _retry_or_fail(self, job_id, e)
+
+@shared_task
+def build_audio_variant(variant_id):
+    """Encodes one delivery variant; a failure is kept on the row and the next request retries it."""
+    variant = AudioVariant.objects.select_related("audio").filter(id=variant_id, status="pending").first()
+    if variant is None:
+        return False
+    try:
+        variants.build(variant)
+    except Exception as e:
+        logger.warning("audio variant %s failed: %s", variant_id, e)
+        AudioVariant.objects.filter(id=variant_id).update(status="failed", error=str(e))
+        return False
+    return True
+
+def _remix_claim_key(job_id) -> str:
+    return f"remix-claim:{job_id}"
+
+def claim_remix(job_id) -> bool:
+    """Marks a finished job as being re-mixed (stage="mixing"); False while another remix holds it.
+
+    The claim is a lease of REMIX_CLAIM_TIMEOUT_SEC, so a remix that was lost or crashed frees the job.
+    """
+    key = _remix_claim_key(job_id)
+    if not cache.add(key, 1, timeout=int(getattr(settings, "REMIX_CLAIM_TIMEOUT_SEC", 900))):
+        return False
+    if not VoiceConversionJob.objects.filter(id=job_id, status="succeeded").update(stage="mixing", error_message=""):
+        cache.delete(key)
+        return False
+    events.publish(job_id, stage="mixing", error_message="")
+    return True
+
+@shared_task(bind=True, max_retries=2)
+def remix_audio(self, job_id: str, changes=None):
+    """Re-mixes a finished job's stored stems with new mix settings: CPU only, no provider call.
+
+    The caller has claimed the job (claim_remix). changes (field -> value) are applied to the mix and saved
+    on the job only together with its result; the previous mix is replaced and deleted on success.
+    """
+    changes = changes or {}
+    job = VoiceConversionJob.objects.select_related("cultural_style", "melody__school", "music_bed").get(id=job_id)
+    for field, value in changes.items():
+        if field == "music_stem":
+            job.music_stem.name = value
+        else:
+            setattr(job, field, value)
+    previous = GeneratedAudio.objects.filter(job_id=job_id).values_list("audio_file", flat=True).first()
+    try:
+        meta = _mix_and_store(job)
+    except Exception as e:
+        if isinstance(e, RETRYABLE) and not self.request.called_directly and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=10 * (2 ** self.request.retries))
+        # The previous mix and its settings are still in place: the job stays succeeded
+        VoiceConversionJob.objects.filter(id=job_id, stage="mixing").update(stage="done", error_message=str(e))
+        events.publish(job_id, stage="done", error_message=str(e))
+        cache.delete(_remix_claim_key(job_id))
         raise
+    meta["remix"] = True
+    try:
+        persist_audio(meta, job_id, changes)
+    finally:
+        cache.delete(_remix_claim_key(job_id))
+    if previous and previous != meta["name"]:
+        default_storage.delete(previous)
+    return meta
+
+@shared_task
+def release_stale_remixes():
+    """Returns finished jobs left at stage "mixing" by a lost or crashed remix (lease expired) to "done"."""
+    released = 0
+    for job_id in VoiceConversionJob.objects.filter(status="succeeded", stage="mixing").values_list("id", flat=True):
+        key = _remix_claim_key(job_id)
+        # Taking the lease ourselves keeps a remix from claiming the job in between
+        if not cache.add(key, 1, timeout=60):
+            continue
+        try:
+            if VoiceConversionJob.objects.filter(id=job_id, status="succeeded", stage="mixing").update(stage="done"):
+                events.publish(job_id, stage="done")
+                released += 1
+        finally:
+            cache.delete(key)
+    return released
+
+@shared_task
+def sweep_pending_music():
+    """Low-frequency fallback for lost or unreachable Suno callbacks."""
+    timeout = timedelta(seconds=getattr(settings, "SUNOAPI_MUSIC_TIMEOUT_SEC", 900))
+    # Library beds (including prewarmed ones nobody waits on yet) are polled once per bed, not per job
+    beds = MusicBed.objects.filter(status="pending").exclude(task_id="").only("id", "task_id", "created_at")
+    pending = VoiceConversionJob.objects.filter(
+        status="running", add_music=True, music_audio_url="", music_error="", music_bed__isnull=True,
+    ).exclude(music_task_id="").only("id", "music_task_id", "created_at")
+    targets = [(bed.task_id, bed.created_at, partial(record_bed_result, bed.id)) for bed in beds]
+    targets += [(job.music_task_id, job.created_at, partial(record_music_result, job.id)) for job in pending]
+    if not targets:
+        return 0
+    provider = providers.music("sunoapi")
+    finished = 0
+    for task_id, created_at, record in targets:
+        try:
+            info = provider.get_details(task_id)
+        except Exception:
+            continue
+        url = sunoapi.audio_url_from_details(info)
+        status = info.get("status") or ""
+        if url:
+            finished += record(audio_url=url)
+        elif status in sunoapi.FAILED_STATUSES:
+            finished += record(error=f"SunoAPI status={status}")
+        elif timezone.now() - created_at > timeout:
+            finished += record(error=f"SunoAPI timeout last_status={status}")
+    return finished
+
+@shared_task
+def refresh_voice_catalog(provider: str, lang_key: str):
+    voice_catalog.refresh(provider, lang_key)
+    return True
+
+@shared_task
+def refresh_voice_catalogs():
+    """Periodic warm-up of the catalogs the /voices endpoint serves by default."""
+    refreshed = 0
+    for provider, language in getattr(settings, "VOICE_CATALOG_WARM", []):
+        try:
+            voice_catalog.refresh(provider, voice_catalog.language_key(provider, language))
+            refreshed += 1
+        except Exception as e:
+            logger.warning("voice catalog %s/%s refresh failed: %s", provider, language, e)
+    return refreshed
@@ -0,0 +1,11 @@
+from django.contrib.auth import get_user_model
+from shilat.models import CulturalStyle, MelodyTemplate, PoemTextSubmission, VoiceConversionJob
+
+def make_job(text="بيت", **kwargs):
+    user = get_user_model().objects.create_user(username=f"u{VoiceConversionJob.objects.count()}", password="x")
+    style, _ = CulturalStyle.objects.get_or_create(key="najdi", defaults={"name_ar": "نجدي"})
+    melody, _ = MelodyTemplate.objects.get_or_create(rhythm_key="samri", defaults={"name_ar": "السامري", "pattern_json": {}})
+    sub = PoemTextSubmission.objects.create(user=user, raw_text=text, cleaned_text=text)
+    defaults = {"status": "running", "add_music": True, "music_provider": "sunoapi"}
+    defaults.update(kwargs)
+    return VoiceConversionJob.objects.create(submission=sub, cultural_style=style, melody=melody, **defaults)
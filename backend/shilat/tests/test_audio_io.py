@@ -0,0 +1,53 @@
+import shutil
+import struct
+import unittest
+import numpy as np
+from django.test import SimpleTestCase
+from shilat.services import audio_io
+
+
+def _frames(header: bytes, length: int, count: int, first: bytes = b"") -> bytes:
+    frame = header + bytes(length - 4)
+    head = (header + first + bytes(length - 4 - len(first))) if first else frame
+    return head + frame * (count - 1)
+
+
+class Mp3InfoTests(SimpleTestCase):
+    def test_cbr_duration_from_size(self):
+        # MPEG-1 layer III, 128 kbps, 44.1 kHz, stereo: 417-byte frames
+        data = _frames(b"\xff\xfb\x90\x00", 417, 100)
+        info = audio_io.mp3_info(data)
+        self.assertEqual((info["sample_rate"], info["channels"]), (44100, 2))
+        self.assertAlmostEqual(info["duration"], 100 * 1152 / 44100, delta=0.02)
+
+    def test_xing_frame_count_and_id3(self):
+        xing = bytes(32) + b"Xing" + struct.pack(">II", 1, 250)
+        tag = b"ID3\x04\x00\x00\x00\x00\x00\x14" + b"\xff\xfb" * 10
+        info = audio_io.mp3_info(tag + _frames(b"\xff\xfb\x90\x00", 417, 3, xing))
+        self.assertAlmostEqual(info["duration"], 250 * 1152 / 44100, places=3)
+
+    def test_mpeg2_mono(self):
+        # MPEG-2 layer III, 64 kbps, 24 kHz, mono: 192-byte frames of 576 samples
+        info = audio_io.mp3_info(_frames(b"\xff\xf3\x84\xc0", 192, 50))
+        self.assertEqual((info["sample_rate"], info["channels"]), (24000, 1))
+        self.assertAlmostEqual(info["duration"], 50 * 576 / 24000, delta=0.01)
+
+    def test_not_mp3(self):
+        self.assertIsNone(audio_io.mp3_info(b"RIFF" + bytes(100)))
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg not installed")
+class CodecTests(SimpleTestCase):
+    def test_encode_once_then_decode(self):
+        sr = 22050
+        t = np.arange(sr * 2, dtype=np.float32) / sr
+        pcm = (0.3 * np.sin(2 * np.pi * 440 * t))[None].astype(np.float32)
+        encoded = audio_io.encode(pcm, sr, "x.mp3")
+        try:
+            self.assertAlmostEqual(encoded.duration, 2.0)
+            data = encoded.read()
+            self.assertAlmostEqual(audio_io.mp3_info(data)["duration"], 2.0, delta=0.1)
+            decoded, rate = audio_io.decode(data)
+            self.assertEqual((decoded.shape[0], rate), (1, sr))
+        finally:
+            encoded.cleanup()
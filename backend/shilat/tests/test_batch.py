@@ -0,0 +1,42 @@
+import json
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.models import PoemTextSubmission
+from shilat.services import batch
+
+VERSE = "قِفَا نَبْكِ مِنْ ذِكْرَى حَبِيبٍ وَمَنْزِلِ * بِسِقْطِ اللِّوَى بَيْنَ الدَّخُولِ فَحَوْمَلِ"
+
+
+@override_settings(BATCH_ANALYZE_WORKERS=0)
+class SubmitBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("poet", password="x"))
+
+    def test_json_array(self):
+        res = self.client.post("/api/submit-batch/", [{"title": "معلقة", "text": VERSE}, VERSE], format="json")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data["created"], 2)
+        self.assertEqual([r["meter_guess"] for r in res.data["results"]], ["tawil", "tawil"])
+        self.assertTrue(res.data["results"][0]["suggested_rhythms"])
+        self.assertEqual(PoemTextSubmission.objects.filter(meter_guess="tawil").count(), 2)
+
+    def test_ndjson_partial_failure(self):
+        body = "\n".join(json.dumps(x, ensure_ascii=False) for x in [{"text": VERSE}, {"text": "  "}, 5])
+        res = self.client.post("/api/submit-batch/", body.encode(), content_type="application/x-ndjson")
+        self.assertEqual(res.status_code, 207)
+        self.assertEqual([("error" in r) for r in res.data["results"]], [False, True, True])
+        self.assertEqual(PoemTextSubmission.objects.count(), 1)
+
+    def test_all_failed(self):
+        res = self.client.post("/api/submit-batch/", [{"text": ""}], format="json")
+        self.assertEqual(res.status_code, 400)
+
+
+class AnalyzePoolTests(TestCase):
+    @override_settings(BATCH_ANALYZE_WORKERS=2, BATCH_POOL_MIN_POEMS=2)
+    def test_pool_matches_inline(self):
+        texts = [VERSE, "", VERSE.split("*")[0]] * 3
+        self.addCleanup(batch._reset_pool)
+        self.assertEqual(batch.analyze_many(texts), [batch._analyze_safe(t) for t in texts])
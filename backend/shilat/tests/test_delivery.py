@@ -0,0 +1,69 @@
+import tempfile
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.models import GeneratedAudio
+from shilat.tests.factories import make_job
+
+
+class DeliveryTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name, MEDIA_URL="/media/", AUDIO_DELIVERY="django")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.job = make_job(status="succeeded")
+        self.name = default_storage.save("generated/a b.mp3", ContentFile(b"0123456789"))
+        GeneratedAudio.objects.create(job=self.job, audio_file=self.name, format="mp3")
+        self.client = APIClient()
+        self.client.force_authenticate(self.job.submission.user)
+        self.url = f"/api/download/{self.job.id}/"
+
+    def test_nginx_mode_hands_off_the_transfer(self):
+        with override_settings(AUDIO_DELIVERY="nginx"):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["X-Accel-Redirect"], "/protected-media/generated/a%20b.mp3")
+        self.assertEqual(res["Content-Type"], "audio/mpeg")
+        self.assertIn(f"shilat-{self.job.id}.mp3", res["Content-Disposition"])
+        self.assertEqual(res.content, b"")
+
+    def test_nginx_mode_still_checks_access(self):
+        other = make_job(status="succeeded")
+        self.client.force_authenticate(other.submission.user)
+        with override_settings(AUDIO_DELIVERY="nginx"):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 404)
+        self.assertNotIn("X-Accel-Redirect", res)
+
+    def test_full_body_with_validators(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), b"0123456789")
+        self.assertEqual((res["Content-Length"], res["Accept-Ranges"]), ("10", "bytes"))
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(again.status_code, 304)
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=res["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+    def test_ranges(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(b"".join(res.streaming_content), b"2345")
+        tail = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(tail.streaming_content), b"789")
+        open_ended = self.client.get(self.url, HTTP_RANGE="bytes=8-")
+        self.assertEqual(open_ended["Content-Range"], "bytes 8-9/10")
+        bad = self.client.get(self.url, HTTP_RANGE="bytes=20-30")
+        self.assertEqual((bad.status_code, bad["Content-Range"]), (416, "bytes */10"))
+
+    def test_stale_if_range_sends_whole_file(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), b"0123456789")
+        etag = self.client.get(self.url)["ETag"]
+        fresh = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE=etag)
+        self.assertEqual(fresh.status_code, 206)
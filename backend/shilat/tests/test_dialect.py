@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.test import TestCase
+from shilat.models import DialectLexiconRule
+from shilat.services import dialect
+from shilat.services.dialect import LexiconMatcher, apply_dialect_lexicon
+
+
+class LexiconMatcherTests(TestCase):
+    def test_longest_phrase_wins_in_one_pass(self):
+        m = LexiconMatcher([("يا", "يَا"), ("يا هلا", "يا هَلا"), ("يا هلا بك", "يَهلا بِك"), ("هلا", "هَلا")])
+        self.assertEqual(m.apply("يا هلا بك يا هلا\nهلا يا"), "يَهلا بِك يا هَلا\nهَلا يَا")
+
+    def test_phrase_words_must_be_adjacent(self):
+        m = LexiconMatcher([("يا هلا", "X")])
+        self.assertEqual(m.apply("يا، هلا"), "يا، هلا")
+        self.assertEqual(m.apply("يا \t هلا"), "X")
+        self.assertEqual(m.apply("يا\nهلا"), "يا\nهلا")
+
+    def test_no_partial_word_match(self):
+        m = LexiconMatcher([("قلب", "گلب")])
+        self.assertEqual(m.apply("قلبي قلب"), "قلبي گلب")
+
+
+class LexiconCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        dialect._matchers.clear()
+
+    def test_rebuilt_after_rule_changes(self):
+        rule = DialectLexiconRule.objects.create(dialect="najdi", source="قلب", alias="گلب")
+        self.assertEqual(apply_dialect_lexicon("قلب", "najdi"), "گلب")
+        with self.assertNumQueries(0):
+            apply_dialect_lexicon("قلب", "najdi")
+        rule.alias = "ﭽلب"
+        rule.save()
+        self.assertEqual(apply_dialect_lexicon("قلب", "najdi"), "ﭽلب")
+        rule.delete()
+        self.assertEqual(apply_dialect_lexicon("قلب", "najdi"), "قلب")
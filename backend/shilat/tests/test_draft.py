@@ -0,0 +1,109 @@
+import tempfile
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.models import MusicBed, VoiceConversionJob
+from shilat.services.voice_providers.elevenlabs import ElevenLabsProvider
+from shilat.tasks import mix_audio, request_job_music, synthesize_voice
+from shilat.tests.factories import make_job
+from shilat.tests.test_pipeline import _fake_post_process
+
+POEM = "البيت الأول\nالبيت الثاني\nالبيت الثالث\nالبيت الرابع"
+
+
+class FakeVoice:
+    def __init__(self):
+        self.texts = []
+
+    def stem_key(self, job):
+        return f"{job.voice_actor}:{job.quality}:{job.submission.cleaned_text}"
+
+    def synthesize_job(self, job):
+        self.texts.append(job.submission.cleaned_text)
+        return b"voice"
+
+
+@override_settings(DRAFT_MAX_VERSES=2)
+class DraftTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.voice = FakeVoice()
+        patch = mock.patch("shilat.tasks.providers.voice", return_value=self.voice)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_draft_synthesizes_first_verses_and_shares_stems(self):
+        draft = make_job(text=POEM, quality="draft")
+        self.assertTrue(synthesize_voice(str(draft.id)))
+        self.assertEqual(self.voice.texts, ["البيت الاول\nالبيت الثاني"])
+
+        again = make_job(text=POEM, quality="draft")
+        synthesize_voice(str(again.id))
+        self.assertEqual(len(self.voice.texts), 1)
+        draft.refresh_from_db()
+        again.refresh_from_db()
+        self.assertEqual(again.voice_stem.name, draft.voice_stem.name)
+
+        # The final render needs the whole poem on the full model: not compatible with the draft stem
+        final = make_job(text=POEM)
+        synthesize_voice(str(final.id))
+        self.assertEqual(len(self.voice.texts), 2)
+        self.assertEqual(self.voice.texts[1].count("\n"), 3)
+
+    def test_draft_music_never_waits_on_suno(self):
+        job = make_job(quality="draft", add_percussion=False)
+        with mock.patch("shilat.tasks.providers.music") as music:
+            self.assertTrue(request_job_music(str(job.id)))
+        music.assert_not_called()
+        job.voice_stem.save(f"{job.id}.mp3", ContentFile(b"voice"), save=True)
+        mixed = []
+        fake = lambda audio, j: mixed.append((j.add_music, j.add_percussion)) or _fake_post_process(audio, j)
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=fake):
+            self.assertTrue(mix_audio(str(job.id)))
+        # Mixed over the local beat without waiting, while the user's saved settings stay as they were
+        self.assertEqual(mixed, [(False, True)])
+        job.refresh_from_db()
+        self.assertEqual((job.add_music, job.add_percussion), (True, False))
+
+        bed = MusicBed.objects.create(rhythm_key="samri", tempo_bucket=96, style_key="najdi", status="ready",
+                                      task_id="bed-1", audio_url="https://cdn.example/bed.mp3")
+        job = make_job(quality="draft")
+        request_job_music(str(job.id))
+        job.refresh_from_db()
+        self.assertEqual((job.music_bed_id, job.music_audio_url), (bed.id, bed.audio_url))
+
+    @override_settings(ELEVENLABS_MODEL_ID="eleven_multilingual_v2", ELEVENLABS_DRAFT_MODEL_ID="eleven_flash_v2_5")
+    def test_draft_uses_cheapest_tts_model(self):
+        provider = ElevenLabsProvider()
+        self.assertEqual(provider.model_for(make_job(quality="draft")), "eleven_flash_v2_5")
+        self.assertEqual(provider.model_for(make_job()), "eleven_multilingual_v2")
+
+    @override_settings(ELEVENLABS_VOICE_ID="", ELEVENLABS_MODEL_ID="eleven_multilingual_v2",
+                       ELEVENLABS_DRAFT_MODEL_ID="eleven_flash_v2_5")
+    def test_stem_key_follows_the_voice_and_model_synthesized_with(self):
+        provider = ElevenLabsProvider()
+        job = make_job(text=POEM)
+        key = provider.stem_key(job)
+        self.assertNotEqual(provider.stem_key(make_job(text=POEM, quality="draft")), key)
+        with override_settings(ELEVENLABS_VOICE_ID="house-voice"):
+            # The configured voice overrides the job's actor, which then no longer changes the key
+            self.assertNotEqual(provider.stem_key(job), key)
+            job.voice_actor = "another-actor"
+            self.assertEqual(provider.stem_key(job), provider.stem_key(make_job(text=POEM)))
+
+    def test_generate_accepts_quality(self):
+        job = make_job()
+        client = APIClient()
+        client.force_authenticate(job.submission.user)
+        body = {"submission_id": str(job.submission_id), "style_key": "najdi", "rhythm_key": "samri",
+                "add_music": True, "music_provider": "suno_vocal", "quality": "draft"}
+        with mock.patch("shilat.api.views.generate_shilat_audio.delay"):
+            res = client.post("/api/generate/", body, format="json")
+            self.assertEqual(client.post("/api/generate/", {**body, "quality": "hq"}, format="json").status_code, 400)
+        created = VoiceConversionJob.objects.get(id=res.json()["job_id"])
+        self.assertEqual((created.quality, created.music_provider), ("draft", "sunoapi"))
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+import numpy as np
+from django.test import SimpleTestCase
+from shilat.services import effects
+
+SR = 16000
+
+
+def _tone(freq, seconds=1.0, amp=0.5):
+    t = np.arange(int(seconds * SR), dtype=np.float32) / SR
+    return (amp * np.sin(2 * np.pi * freq * t)).astype(np.float32)[None]
+
+
+def _peak_hz(x):
+    spectrum = np.abs(np.fft.rfft(x[0]))
+    return np.argmax(spectrum) * SR / len(x[0])
+
+
+class EffectsTests(SimpleTestCase):
+    def test_time_stretch_keeps_pitch(self):
+        x = _tone(440, 2.0)
+        y = effects.stretch_and_shift(x, 1.25, 0.0)
+        self.assertEqual(y.shape[1], int(round(x.shape[1] / 1.25)))
+        self.assertAlmostEqual(_peak_hz(y), 440, delta=5)
+
+    def test_pitch_shift_keeps_length(self):
+        x = _tone(440, 2.0)
+        y = effects.stretch_and_shift(x, 1.0, 12.0)
+        self.assertAlmostEqual(y.shape[1], x.shape[1], delta=SR // 100)
+        self.assertAlmostEqual(_peak_hz(y), 880, delta=8)
+        self.assertIs(effects.stretch_and_shift(x, 1.0, 0.0), x)
+
+    def test_compression_narrows_dynamics(self):
+        x = np.concatenate([_tone(220, 0.5, 0.9), _tone(220, 0.5, 0.1)], axis=1)
+        y = effects.compress(x, SR, 1.0)
+        loud, quiet = np.abs(y[0, 1000:7000]).max(), np.abs(y[0, 9000:15000]).max()
+        self.assertLess(loud / quiet, 0.9 / 0.1)
+        self.assertEqual(y.shape, x.shape)
+
+    def test_streaming_stages_match_whole_track(self):
+        rng = np.random.default_rng(3)
+        x = (rng.standard_normal((2, 3 * SR)) * 0.3).astype(np.float32)
+        whole = effects.reverb(effects.compress(x, SR, 0.8), SR, 0.4, "najdi")
+        blocks = (x[:, i:i + 3001] for i in range(0, x.shape[1], 3001))
+        streamed = np.concatenate(list(effects.stream(blocks, SR, 2, intensity=0.8, reverb_amount=0.4,
+                                                      style_key="najdi")), axis=1)
+        self.assertEqual(streamed.shape, x.shape)
+        np.testing.assert_allclose(streamed, whole, atol=1e-4)
+
+    def test_streamed_stretch_matches_whole_track(self):
+        rng = np.random.default_rng(4)
+        x = (rng.standard_normal((2, 3 * SR)) * 0.3).astype(np.float32)
+        for rate, semitones in ((1.2, 0.0), (0.8, -3.0)):
+            whole = effects.stretch_and_shift(x, rate, semitones)
+            blocks = (x[:, i:i + 3001] for i in range(0, x.shape[1], 3001))
+            streamed = np.concatenate(list(effects.stream(blocks, SR, 2, rate=rate, semitones=semitones)), axis=1)
+            self.assertEqual(streamed.shape, whole.shape)
+            np.testing.assert_allclose(streamed, whole, atol=1e-5)
+
+    def test_soft_clip(self):
+        x = np.array([[0.5, 0.95, 3.0, -3.0]], dtype=np.float32)
+        y = effects.soft_clip(x)
+        self.assertEqual(float(y[0, 0]), 0.5)
+        self.assertTrue(np.all(np.abs(y) <= 1.0))
+        self.assertGreater(y[0, 2], y[0, 1])
+
+    def test_reverb_tail_and_cached_ir(self):
+        x = np.zeros((2, SR), dtype=np.float32)
+        x[:, 0] = 1.0
+        y = effects.reverb(x, SR, 0.5, "najdi")
+        self.assertEqual(y.shape, x.shape)
+        self.assertGreater(np.abs(y[:, SR // 4:]).max(), 0)
+        self.assertIs(effects.impulse_response("najdi", 0.5, SR), effects.impulse_response("najdi", 0.5, SR))
+        self.assertFalse(np.array_equal(effects.impulse_response("hijazi", 0.5, SR),
+                                        effects.impulse_response("najdi", 0.5, SR)))
+
+    def test_job_params(self):
+        style = SimpleNamespace(key="najdi", default_tempo=100, default_reverb=0.3)
+        job = SimpleNamespace(cultural_style=style, tempo=120, pitch=-2.0, intensity=0.7)
+        params = effects.job_params(job)
+        self.assertAlmostEqual(params["rate"], 1.2)
+        self.assertEqual((params["semitones"], params["reverb_amount"], params["style_key"]), (-2.0, 0.3, "najdi"))
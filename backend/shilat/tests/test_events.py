@@ -0,0 +1,131 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import redis
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.services import events
+from shilat.tasks import mix_audio, persist_audio
+from shilat.tests.factories import make_job
+from shilat.tests.test_pipeline import _fake_post_process
+
+TEST_REDIS_URL = os.getenv("JOB_EVENTS_TEST_REDIS_URL", "redis://127.0.0.1:6379/15")
+
+
+def _redis_up() -> bool:
+    try:
+        return redis.Redis.from_url(TEST_REDIS_URL, socket_connect_timeout=0.2).ping()
+    except redis.RedisError:
+        return False
+
+
+@override_settings(JOB_EVENTS_REDIS_URL="", JOB_EVENTS_POLL_SEC=0.02)
+class JobEventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.job = make_job(stage="synthesizing")
+        self.user = self.job.submission.user
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/job-events/{self.job.id}/"
+
+    def test_snapshot_merges_stages_and_milestones(self):
+        events.publish(self.job.id, user_id=self.user.id, status="running", stage="synthesizing")
+        events.publish(self.job.id, milestone="voice_ready")
+        events.publish(self.job.id, stage="awaiting_music")
+        state = events.snapshot(self.job.id)
+        self.assertEqual((state["stage"], state["progress"], state["seq"]), ("awaiting_music", 50, 3))
+        self.assertFalse(events.finished(state))
+
+    def test_unreachable_redis_never_fails_the_pipeline(self):
+        with override_settings(JOB_EVENTS_REDIS_URL="redis://127.0.0.1:1/0"):
+            events.publish(self.job.id, status="running")
+            self.assertIsNone(events.snapshot(self.job.id))
+            # The endpoint still answers from the database
+            self.assertEqual(self.client.get(self.url, {"wait": 0}).json()["stage"], "synthesizing")
+
+    def test_pipeline_publishes_until_done(self):
+        self.job.add_music = False
+        self.job.voice_stem.save(f"{self.job.id}.mp3", ContentFile(b"voice"), save=True)
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process):
+            persist_audio(mix_audio(str(self.job.id)), str(self.job.id))
+        state = events.snapshot(self.job.id)
+        self.assertEqual((state["status"], state["stage"], state["progress"]), ("succeeded", "done", 100))
+        self.assertTrue(state["has_audio"] and events.finished(state))
+
+    def test_long_poll_reads_only_the_cache_once_seeded(self):
+        first = self.client.get(self.url).json()
+        self.assertEqual((first["status"], first["stage"], first["progress"]), ("running", "synthesizing", 5))
+        self.assertNotIn("user_id", first)
+        with self.assertNumQueries(0):
+            again = self.client.get(self.url, {"since": first["seq"], "wait": 0})
+        self.assertEqual(again.json()["seq"], first["seq"])
+
+    def test_long_poll_returns_on_the_next_event(self):
+        seq = self.client.get(self.url).json()["seq"]
+        timer = threading.Timer(0.1, events.publish, args=(self.job.id,), kwargs={"stage": "mixing"})
+        timer.start()
+        self.addCleanup(timer.cancel)
+        res = self.client.get(self.url, {"since": seq, "wait": 5}).json()
+        self.assertEqual((res["stage"], res["progress"], res["seq"]), ("mixing", 80, seq + 1))
+
+    def test_other_users_job_is_hidden(self):
+        other = make_job()
+        self.client.force_authenticate(other.submission.user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        events.publish(self.job.id, user_id=self.user.id)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_event_stream_ends_when_job_finishes(self):
+        events.publish(self.job.id, user_id=self.user.id, status="running", stage="mixing")
+        timer = threading.Timer(0.1, events.publish, args=(self.job.id,),
+                                kwargs={"status": "succeeded", "stage": "done", "has_audio": True})
+        timer.start()
+        self.addCleanup(timer.cancel)
+        res = self.client.get(self.url, HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(res["Content-Type"], "text/event-stream")
+        body = b"".join(res.streaming_content).decode()
+        self.assertTrue(body.startswith("retry: "))
+        self.assertIn("id: 1\nevent: progress\n", body)
+        self.assertIn('"status": "succeeded"', body)
+        self.assertTrue(body.endswith("\n\n"))
+
+    def test_event_stream_resumes_after_last_event_id(self):
+        events.publish(self.job.id, user_id=self.user.id, status="failed", error_message="x")
+        res = self.client.get(self.url, HTTP_ACCEPT="text/event-stream", HTTP_LAST_EVENT_ID="1")
+        self.assertNotIn("event: progress", b"".join(res.streaming_content).decode())
+
+
+@unittest.skipUnless(_redis_up(), "redis not reachable at JOB_EVENTS_TEST_REDIS_URL")
+@override_settings(JOB_EVENTS_REDIS_URL=TEST_REDIS_URL, JOB_EVENTS_POLL_SEC=0.02)
+class RedisJobEventsTests(JobEventsTests):
+    """The same behaviour with the snapshot kept in a Redis hash and readers woken by pub/sub."""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(redis.Redis.from_url(TEST_REDIS_URL).delete, events._key(self.job.id))
+
+    def test_parallel_stages_never_lose_updates(self):
+        def stage(field, n):
+            for i in range(n):
+                events.publish(self.job.id, **{field: f"{field}-{i}"})
+        threads = [threading.Thread(target=stage, args=(f, 50)) for f in ("status", "stage", "error_message")]
+        threads.append(threading.Thread(target=lambda: [events.publish(self.job.id, milestone="voice_ready")
+                                                        for _ in range(50)]))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        state = events.snapshot(self.job.id)
+        self.assertEqual(state["seq"], 200)
+        self.assertEqual((state["status"], state["stage"], state["error_message"]),
+                         ("status-49", "stage-49", "error_message-49"))
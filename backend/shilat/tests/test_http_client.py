@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase, override_settings
+from shilat.services import http_client
+
+class HttpClientTests(SimpleTestCase):
+    def setUp(self):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+
+    def test_session_reused_per_provider(self):
+        a = http_client.session("elevenlabs")
+        self.assertIs(a, http_client.session("elevenlabs"))
+        self.assertIsNot(a, http_client.session("sunoapi"))
+
+    @override_settings(PROVIDER_HTTP={"default": {"pool_maxsize": 7}, "sunoapi": {"retry_methods": ("GET",), "timeouts": {"default": 12}}})
+    def test_provider_overrides(self):
+        adapter = http_client.session("sunoapi").get_adapter("https://api.sunoapi.org")
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.allowed_methods, frozenset({"GET"}))
+        self.assertTrue(adapter.max_retries.respect_retry_after_header)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertEqual(http_client.timeout("sunoapi"), 12)
+        self.assertEqual(http_client.timeout("sunoapi", "tts"), 12)
+
+    def test_billed_posts_are_not_retried(self):
+        retry = http_client.session("elevenlabs").get_adapter("https://api.elevenlabs.io").max_retries
+        self.assertNotIn("POST", retry.allowed_methods)
+        self.assertIn("GET", retry.allowed_methods)
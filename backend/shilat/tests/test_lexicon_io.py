@@ -0,0 +1,60 @@
+import io
+import json
+import os
+import tempfile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from shilat.models import DialectLexiconRule, MelodyTemplate
+from shilat.services.dialect import apply_dialect_lexicon
+
+
+class LexiconImportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def _import(self, path, *args):
+        out = io.StringIO()
+        call_command("lexicon_import", path, *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_upsert_reports_diff(self):
+        path = self._write("a.csv", "dialect,source,alias,notes,is_active\n"
+                                    "najdi,وش,وِش,,1\nnajdi,يا هلا,يا هَلا,,1\nfoo,x,y,,1\n")
+        self.assertIn("created=2, updated=0, unchanged=0, deactivated=0, invalid=1", self._import(path))
+        self.assertEqual(apply_dialect_lexicon("يا هلا وش", "najdi"), "يا هَلا وِش")
+
+        path = self._write("b.jsonl", "\n".join(json.dumps(r, ensure_ascii=False) for r in [
+            {"dialect": "najdi", "source": "وش", "alias": "وِشْ"},
+            {"dialect": "hijazi", "source": "فين", "alias": "فِين"},
+        ]))
+        out = self._import(path, "--deactivate-missing", "--dry-run")
+        self.assertIn("created=1, updated=1, unchanged=0, deactivated=1", out)
+        self.assertEqual(DialectLexiconRule.objects.count(), 2)
+
+        self._import(path, "--deactivate-missing")
+        self.assertFalse(DialectLexiconRule.objects.get(source="يا هلا").is_active)
+        # Bulk writes bypass signals but still invalidate the compiled matcher
+        self.assertEqual(apply_dialect_lexicon("يا هلا وش", "najdi"), "يا هلا وِشْ")
+
+    def test_export_round_trip(self):
+        DialectLexiconRule.objects.create(dialect="khaliji", source="شلونك", alias="شِلونِك", notes="تطبيع")
+        out = io.StringIO()
+        call_command("lexicon_export", "--format", "jsonl", stdout=out)
+        path = self._write("rt.jsonl", out.getvalue())
+        self.assertIn("created=0, updated=0, unchanged=1", self._import(path))
+
+    def test_seed_is_idempotent(self):
+        call_command("seed_rhythms", stdout=io.StringIO())
+        call_command("seed_rhythms", stdout=io.StringIO())
+        self.assertEqual(MelodyTemplate.objects.get(rhythm_key="samri").school.key, "samri")
+        self.assertEqual(DialectLexiconRule.objects.count(), 5)
@@ -0,0 +1,87 @@
+import io
+import shutil
+import tracemalloc
+import unittest
+import wave
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from shilat.services import audio_io, effects, postprocess
+from shilat.tests.factories import make_job
+
+SR = 22050
+
+
+def _voice(seconds):
+    rng = np.random.default_rng(1)
+    for _ in range(seconds):
+        yield (rng.standard_normal((2, SR)) * 0.2).astype(np.float32)
+
+
+def _peak_bytes(seconds, **params):
+    """Peak traced allocation of the streaming chain over a vocal of the given length."""
+    music = audio_io.LoopReader(np.full((2, 7 * SR + 123), 0.1, dtype=np.float32))
+    beat = audio_io.LoopReader(np.full((1, 3 * SR), 0.05, dtype=np.float32))
+    tracemalloc.start()
+    try:
+        blocks = effects.stream(_voice(seconds), SR, 2, intensity=0.7, reverb_amount=0.3, style_key="najdi", **params)
+        blocks = postprocess.mix_voice_with_music(postprocess.mix_voice_with_music(blocks, music, -10.0), beat, -12.0)
+        samples = sum(effects.soft_clip(b).shape[1] for b in blocks)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return samples, peak
+
+
+class StreamingMixTests(SimpleTestCase):
+    def test_music_loops_under_voice(self):
+        music = audio_io.LoopReader(np.arange(5, dtype=np.float32)[None])
+        voice = [np.zeros((1, 3), dtype=np.float32), np.zeros((1, 4), dtype=np.float32)]
+        out = np.concatenate(list(postprocess.mix_voice_with_music(voice, music, 0.0)), axis=1)
+        np.testing.assert_array_equal(out[0], [0, 1, 2, 3, 4, 0, 1])
+        short = audio_io.LoopReader(np.ones((1, 2), dtype=np.float32), loop=False)
+        out = next(postprocess.mix_voice_with_music([np.zeros((1, 4), dtype=np.float32)], short, 0.0))
+        np.testing.assert_array_equal(out[0], [1, 1, 0, 0])
+
+    def test_peak_memory_does_not_grow_with_duration(self):
+        samples, short_peak = _peak_bytes(30)
+        self.assertGreaterEqual(samples, 30 * SR)
+        samples, long_peak = _peak_bytes(300)
+        self.assertGreaterEqual(samples, 300 * SR)
+        # A materialized 5-minute stereo float32 mix alone would be ~53 MB
+        self.assertLess(long_peak, 8 * 1024 * 1024)
+        self.assertLess(long_peak, short_peak * 1.5)
+
+    def test_peak_memory_with_tempo_and_pitch_change(self):
+        samples, short_peak = _peak_bytes(30, rate=1.2, semitones=2.0)
+        self.assertAlmostEqual(samples, 30 * SR / 1.2, delta=SR // 10)
+        samples, long_peak = _peak_bytes(300, rate=1.2, semitones=2.0)
+        self.assertAlmostEqual(samples, 300 * SR / 1.2, delta=SR // 10)
+        self.assertLess(long_peak, 8 * 1024 * 1024)
+        self.assertLess(long_peak, short_peak * 1.5)
+
+
+def _wav(seconds, freq=220.0):
+    t = np.arange(int(seconds * SR)) / SR
+    pcm = (np.sin(2 * np.pi * freq * t) * 0.5 * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SR)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg not installed")
+class PostProcessTests(TestCase):
+    def test_voice_with_local_beat(self):
+        job = make_job(add_music=False, music_provider="none", add_percussion=True, tempo=100)
+        job.melody.pattern_json = {"time_signature": "2/4", "phrase_beats": 8, "hits": [1, 0, 1, 0]}
+        meta = postprocess.post_process_audio(_wav(4), job)
+        try:
+            self.assertAlmostEqual(meta["duration"], 4.0, delta=0.3)
+            self.assertIn("percussion", meta)
+            pcm, sr = audio_io.decode(meta["django_file"].read())
+            self.assertLessEqual(float(np.abs(pcm).max()), 1.0)
+        finally:
+            meta["django_file"].cleanup()
@@ -0,0 +1,105 @@
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.models import MusicBed, VoiceConversionJob
+from shilat.services import music_beds
+from shilat.services.music_providers import sunoapi
+from shilat.tasks import request_job_music, sweep_pending_music
+from shilat.tests.factories import make_job
+from shilat.tests.test_music_callback import FakeSuno
+
+DONE = {"status": "SUCCESS", "response": {"sunoData": [{"audioUrl": "https://cdn.example/bed.mp3"}]}}
+
+
+@override_settings(SUNOAPI_TOKEN="test", SUNOAPI_CALLBACK_BASE_URL="http://testserver/api", MUSIC_BED_TEMPO_BUCKET=8)
+class MusicBedTests(TestCase):
+    def setUp(self):
+        self.fake = FakeSuno().__enter__()
+        self.addCleanup(self.fake.__exit__)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SUNOAPI_BASE_URL=self.fake.url, MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        store = mock.patch("shilat.tasks.store_music_bed.delay")
+        self.store = store.start()
+        self.addCleanup(store.stop)
+
+    def test_jobs_of_one_slot_share_a_single_render(self):
+        first, second = make_job(tempo=95), make_job(tempo=98)
+        self.assertTrue(request_job_music(str(first.id)))
+        self.assertTrue(request_job_music(str(second.id)))
+        self.assertEqual(len(self.fake.generated), 1)
+        self.assertIn("Tempo around 96 BPM", self.fake.generated[0]["prompt"])
+        bed = MusicBed.objects.get()
+        self.assertEqual((bed.status, bed.tempo_bucket, bed.style_key), ("pending", 96, "najdi"))
+
+        body = {"code": 200, "data": {"callbackType": "complete", "task_id": bed.task_id,
+                                      "data": [{"audio_url": "https://cdn.example/bed.mp3"}]}}
+        with mock.patch("shilat.tasks.enqueue_mix") as finish:
+            APIClient().post(f"/api/music-callback/{first.id}/{sunoapi.callback_token(first.id)}/", body, format="json")
+        self.assertEqual(finish.call_count, 2)
+        self.store.assert_called_once_with(bed.id)
+        for job in (first, second):
+            job.refresh_from_db()
+            self.assertEqual(job.music_audio_url, "https://cdn.example/bed.mp3")
+
+    def test_ready_beds_rotate_and_share_the_stored_file(self):
+        slot = {"school_key": "", "rhythm_key": "samri", "tempo_bucket": 96, "style_key": "najdi"}
+        beds = [MusicBed.objects.create(status="ready", task_id=f"t{i}", audio_url=f"https://cdn.example/{i}.mp3", **slot)
+                for i in range(2)]
+        beds[0].audio_file.save("bed-0.mp3", ContentFile(b"bed"), save=True)
+        jobs = [make_job(tempo=96) for _ in range(3)]
+        for job in jobs:
+            request_job_music(str(job.id))
+        self.assertEqual(self.fake.generated, [])
+        jobs = [VoiceConversionJob.objects.get(id=job.id) for job in jobs]
+        self.assertEqual([job.music_bed_id for job in jobs], [beds[0].id, beds[1].id, beds[0].id])
+        self.assertEqual(jobs[0].music_stem.name, beds[0].audio_file.name)
+        self.assertEqual(jobs[1].music_audio_url, "https://cdn.example/1.mp3")
+        self.assertEqual(sorted(MusicBed.objects.values_list("use_count", flat=True)), [1, 2])
+
+    def test_concurrent_jobs_of_an_empty_slot_wait_for_one_render(self):
+        first, second = make_job(tempo=95), make_job(tempo=98)
+        key = "music-bed-slot:" + ":".join(str(v) for v in music_beds.slot(first).values())
+        # Another worker is requesting the slot's render: this one attaches to it once recorded
+        cache.add(key, 1)
+        self.addCleanup(cache.delete, key)
+        recorded = lambda _: MusicBed.objects.create(task_id="other", **music_beds.slot(first))
+        with mock.patch("shilat.services.music_beds.time.sleep", side_effect=recorded):
+            self.assertTrue(request_job_music(str(first.id)))
+        self.assertEqual(self.fake.generated, [])
+        self.assertEqual(VoiceConversionJob.objects.get(id=first.id).music_task_id, "other")
+
+        MusicBed.objects.all().delete()
+        with override_settings(MUSIC_BED_SLOT_WAIT_SEC=0):
+            self.assertFalse(request_job_music(str(second.id)))
+        self.assertEqual(self.fake.generated, [])
+        self.assertTrue(VoiceConversionJob.objects.get(id=second.id).music_error)
+
+    @override_settings(MUSIC_BED_LIBRARY=False)
+    def test_library_can_be_disabled(self):
+        job = make_job()
+        request_job_music(str(job.id))
+        self.assertFalse(MusicBed.objects.exists())
+        self.assertEqual(len(self.fake.generated), 1)
+
+    def test_prewarm_fills_missing_slots_and_sweeper_completes_them(self):
+        make_job()
+        out = StringIO()
+        call_command("prewarm_music_beds", "--tempos", "90,100", stdout=out)
+        self.assertIn("requested=2", out.getvalue())
+        call_command("prewarm_music_beds", "--tempos", "90,100", stdout=out)
+        self.assertIn("requested=0, full=2", out.getvalue())
+        self.assertEqual(sorted(MusicBed.objects.values_list("tempo_bucket", flat=True)), [88, 96])
+
+        self.fake.details = DONE
+        sweep_pending_music()
+        self.assertEqual(set(MusicBed.objects.values_list("status", flat=True)), {"ready"})
+        self.assertEqual(self.store.call_count, 2)
+        self.assertEqual(music_beds.tempo_bucket(101), 104)
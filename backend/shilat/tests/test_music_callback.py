@@ -0,0 +1,109 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.services.music_providers import sunoapi
+from shilat.services.postprocess import request_music
+from shilat.tasks import sweep_pending_music
+from shilat.tests.factories import make_job
+
+class FakeSuno:
+    """Minimal stand-in for api.sunoapi.org: /generate and /generate/record-info."""
+
+    def __init__(self):
+        self.generated = []
+        self.details = {"status": "PENDING"}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body):
+                raw = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.generated.append(payload)
+                self._reply({"code": 200, "data": {"taskId": f"task-{len(fake.generated)}"}})
+
+            def do_GET(self):
+                self._reply({"code": 200, "data": fake.details})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v1"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(SUNOAPI_TOKEN="test", SUNOAPI_CALLBACK_BASE_URL="http://testserver/api")
+class MusicCallbackTests(TestCase):
+    def setUp(self):
+        self.fake = FakeSuno().__enter__()
+        self.addCleanup(self.fake.__exit__)
+        self.settings_override = override_settings(SUNOAPI_BASE_URL=self.fake.url)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client = APIClient()
+
+    def _callback(self, job, body, token=None):
+        path = f"/api/music-callback/{job.id}/{token or sunoapi.callback_token(job.id)}/"
+        return self.client.post(path, body, format="json")
+
+    def test_callback_records_url_and_enqueues_mix_once(self):
+        job = make_job()
+        task_id = request_music(job, sunoapi.callback_url(job.id))
+        self.assertEqual(self.fake.generated[0]["callBackUrl"], f"http://testserver/api/music-callback/{job.id}/{sunoapi.callback_token(job.id)}/")
+
+        body = {"code": 200, "msg": "ok", "data": {"callbackType": "complete", "task_id": task_id,
+                                                   "data": [{"audio_url": "https://cdn.example/a.mp3"}]}}
+        with mock.patch("shilat.tasks.enqueue_mix") as finish:
+            self.assertEqual(self._callback(job, body).status_code, 200)
+            self.assertEqual(self._callback(job, body).status_code, 200)
+        finish.assert_called_once_with(str(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.music_audio_url, "https://cdn.example/a.mp3")
+
+    def test_interim_and_foreign_callbacks_are_ignored(self):
+        job = make_job(music_task_id="task-9")
+        with mock.patch("shilat.tasks.enqueue_mix") as finish:
+            self._callback(job, {"code": 200, "data": {"callbackType": "text", "task_id": "task-9", "data": []}})
+            self._callback(job, {"code": 200, "data": {"callbackType": "complete", "task_id": "other",
+                                                       "data": [{"audio_url": "https://cdn.example/x.mp3"}]}})
+        finish.assert_not_called()
+
+    def test_error_callback_mixes_without_music(self):
+        job = make_job(music_task_id="task-1")
+        with mock.patch("shilat.tasks.enqueue_mix") as finish:
+            self._callback(job, {"code": 501, "msg": "failed", "data": {"callbackType": "error", "task_id": "task-1"}})
+        finish.assert_called_once()
+        job.refresh_from_db()
+        self.assertIn("failed", job.music_error)
+
+    def test_bad_token_rejected(self):
+        job = make_job()
+        self.assertEqual(self._callback(job, {"code": 200}, token="nope").status_code, 404)
+
+    def test_sweeper_picks_up_finished_task(self):
+        job = make_job(music_task_id="task-1")
+        with mock.patch("shilat.tasks.enqueue_mix") as finish:
+            self.assertEqual(sweep_pending_music(), 0)
+            self.fake.details = {"status": "SUCCESS", "response": {"sunoData": [{"audioUrl": "https://cdn.example/b.mp3"}]}}
+            self.assertEqual(sweep_pending_music(), 1)
+        finish.assert_called_once_with(str(job.id))
+        job.refresh_from_db()
+        self.assertEqual(job.music_audio_url, "https://cdn.example/b.mp3")
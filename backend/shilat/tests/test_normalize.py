@@ -0,0 +1,37 @@
+from django.test import SimpleTestCase
+from shilat.services.dialect import LexiconMatcher
+from shilat.services.meter import detect_bahr
+from shilat.services.normalize import normalize_text, plain
+from shilat.services.text_prep import clean_arabic_text
+from shilat.services.tts_chunking import split_verses
+
+RAW = "  أَلا  يا ليلـــى‏  \r\n\n\tإلى متى؟  آخر"
+
+
+class NormalizeTests(SimpleTestCase):
+    def test_cleaned_text(self):
+        doc = normalize_text(RAW)
+        self.assertEqual(doc.cleaned, "اَلا يا ليلي\nالي متي؟\nاخر")
+        self.assertEqual(clean_arabic_text(RAW), doc.cleaned)
+        self.assertEqual([v.text for v in doc.verses], doc.cleaned.split("\n"))
+
+    def test_offsets(self):
+        doc = normalize_text(RAW)
+        for word, start, end in doc.tokens:
+            self.assertEqual(doc.cleaned[start:end], word)
+        self.assertEqual([t[0] for t in doc.verses[1].tokens], ["الي", "متي؟"])
+        self.assertEqual(RAW[doc.verses[2].raw_start:doc.verses[2].raw_end], "آخر")
+        # The raw span keeps the tatweel and the original alef maqsura
+        self.assertEqual(RAW[slice(*doc.raw_span(doc.tokens[2]))], "ليلـــى")
+
+    def test_plain_forms(self):
+        doc = normalize_text(RAW)
+        self.assertEqual(doc.plain_forms(), ["الا يا ليلي", "الي متي", "اخر"])
+        self.assertEqual(plain("أَلا، يا ليلـى!"), "الا يا ليلي")
+
+    def test_consumers_share_the_structure(self):
+        doc = normalize_text("قفا نبك من ذكرى حبيب ومنزل\nبسقط اللوى بين الدخول فحومل")
+        self.assertEqual(detect_bahr(doc), detect_bahr(doc.cleaned))
+        m = LexiconMatcher([("نبك", "نبكي"), ("بين الدخول", "X")])
+        self.assertEqual(m.apply(doc.cleaned, doc.tokens), m.apply(doc.cleaned))
+        self.assertEqual([c.text for c in split_verses(doc)], [c.text for c in split_verses(doc.cleaned)])
@@ -0,0 +1,41 @@
+import numpy as np
+from django.test import TestCase
+from shilat.models import ShilaSchool
+from shilat.services import percussion
+from shilat.tests.factories import make_job
+
+SAMRI = {"time_signature": "2/4", "phrase_beats": 16, "hits": [1, 0, 1, 0], "accent": [1, 0, 0, 1]}
+
+
+class PercussionTests(TestCase):
+    def setUp(self):
+        percussion._cycles.clear()
+
+    def test_cycle_follows_pattern_and_tempo(self):
+        sr = 8000
+        loop = percussion.cycle("samri", SAMRI, 120, "tar", sr)
+        # 16 beats at 120 BPM
+        self.assertEqual(len(loop), 8 * sr)
+        step = sr // 4
+        self.assertGreater(abs(loop[0]), 0.1)
+        self.assertGreater(np.abs(loop[2 * step:2 * step + 50]).max(), 0.1)
+        self.assertLess(np.abs(loop[step + 800:2 * step - 10]).max(), 0.05)
+        self.assertIs(percussion.cycle("samri", SAMRI, 120, "tar", sr), loop)
+        self.assertIsNot(percussion.cycle("samri", SAMRI, 100, "tar", sr), loop)
+
+    def test_render_exact_length_and_free_rhythm(self):
+        bed = percussion.render("samri", SAMRI, 96, "tabl", 8000, 123457)
+        self.assertEqual(len(bed), 123457)
+        self.assertLessEqual(float(np.abs(bed).max()), 1.0)
+        self.assertIsNone(percussion.render("mawal", {"time_signature": "free", "hits": []}, 96, "tabl", 8000, 1000))
+
+    def test_bed_for_job(self):
+        job = make_job(add_music=False, music_provider="none", tempo=100)
+        job.melody.pattern_json = SAMRI
+        job.melody.school = ShilaSchool.objects.create(key="dahha", name_ar="الدحة")
+        job.melody.save()
+        loop, kit = percussion.bed(job, 16000)
+        self.assertEqual(kit, "clap")
+        self.assertIs(loop, percussion.cycle(job.melody.rhythm_key, SAMRI, 100, "clap", 16000))
+        job.melody.pattern_json = {"time_signature": "free", "hits": []}
+        self.assertEqual(percussion.bed(job, 16000), (None, ""))
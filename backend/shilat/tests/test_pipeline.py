@@ -0,0 +1,99 @@
+import tempfile
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from shilat.models import GeneratedAudio, VoiceConversionJob
+from rest_framework.test import APIClient
+from shilat.services.postprocess import fetch_music_stem
+from shilat.tasks import mix_audio, persist_audio, request_job_music, synthesize_voice
+from shilat.tests.factories import make_job
+
+def _fake_post_process(audio_bytes, job):
+    return {"format": "mp3", "duration": 1.5, "django_file": ContentFile(audio_bytes or b"mix", name="out.mp3")}
+
+class PipelineStageTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _job_with_stem(self, **kwargs):
+        job = make_job(stage="synthesizing", **kwargs)
+        job.voice_stem.save(f"{job.id}.mp3", ContentFile(b"voice"), save=True)
+        return job
+
+    def test_mix_waits_for_music(self):
+        job = self._job_with_stem()
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process) as pp:
+            self.assertIsNone(mix_audio(str(job.id)))
+        pp.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.stage, "awaiting_music")
+
+    def test_mix_runs_once_then_persists(self):
+        job = self._job_with_stem(music_audio_url="https://cdn.example/a.mp3")
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process) as pp:
+            meta = mix_audio(str(job.id))
+            self.assertIsNone(mix_audio(str(job.id)))
+        pp.assert_called_once()
+        self.assertTrue(meta["name"].startswith("generated/"))
+
+        self.assertTrue(persist_audio(meta, str(job.id)))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.stage), ("succeeded", "done"))
+        audio = GeneratedAudio.objects.get(job=job)
+        self.assertEqual(audio.duration_sec, 1.5)
+        self.assertEqual(audio.audio_file.read(), b"voice")
+
+    def test_voice_only_job_does_not_wait(self):
+        job = self._job_with_stem(add_music=False, music_provider="none")
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process):
+            self.assertIsNotNone(mix_audio(str(job.id)))
+        self.assertFalse(persist_audio(None, str(job.id)))
+        self.assertEqual(VoiceConversionJob.objects.get(id=job.id).stage, "mixing")
+
+class CheckpointTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_tts_not_repeated_when_stem_exists(self):
+        job = make_job()
+        job.voice_stem.save(f"{job.id}.mp3", ContentFile(b"voice"), save=True)
+        with mock.patch("shilat.tasks.providers.voice") as provider:
+            self.assertTrue(synthesize_voice(str(job.id)))
+        provider.assert_not_called()
+
+    def test_suno_not_resubmitted_when_task_exists(self):
+        job = make_job(music_task_id="task-1", music_audio_url="https://cdn.example/a.mp3")
+        with mock.patch("shilat.tasks.request_music") as submit:
+            self.assertTrue(request_job_music(str(job.id)))
+        submit.assert_not_called()
+
+    def test_music_downloaded_once(self):
+        job = make_job(music_audio_url="https://cdn.example/a.mp3?sig=1")
+        with mock.patch("shilat.services.postprocess._download", return_value=b"music") as download:
+            self.assertEqual(fetch_music_stem(job), b"music")
+            job = VoiceConversionJob.objects.get(id=job.id)
+            self.assertEqual(fetch_music_stem(job), b"music")
+        download.assert_called_once()
+        self.assertTrue(job.music_stem.name.endswith(".mp3"))
+
+    def test_resume_only_failed_jobs(self):
+        job = make_job(status="failed", stage="mixing")
+        client = APIClient()
+        client.force_authenticate(job.submission.user)
+        with mock.patch("shilat.api.views.generate_shilat_audio.delay") as delay:
+            res = client.post(f"/api/job-resume/{job.id}/")
+            self.assertEqual(res.status_code, 202)
+            VoiceConversionJob.objects.filter(id=job.id).update(status="running")
+            self.assertEqual(client.post(f"/api/job-resume/{job.id}/").status_code, 409)
+        delay.assert_called_once_with(str(job.id))
+        status = client.get(f"/api/job-status/{job.id}/").json()
+        self.assertEqual(status["stage"], "mixing")
+        self.assertFalse(status["checkpoints"]["voice_stem"])
@@ -0,0 +1,49 @@
+import sys
+import tempfile
+from django.test import TestCase, override_settings
+from shilat.models import VoiceConversionJob
+from shilat.services import providers
+from shilat.tasks import synthesize_voice
+from shilat.tests.factories import make_job
+
+
+class EchoProvider:
+    instances = 0
+
+    def __init__(self):
+        EchoProvider.instances += 1
+
+    def synthesize_job(self, job):
+        return job.submission.cleaned_text.encode()
+
+
+class ProviderRegistryTests(TestCase):
+    def setUp(self):
+        providers.reset()
+        EchoProvider.instances = 0
+        providers.register(providers.VOICE, "echo", f"{__name__}:EchoProvider")
+        self.addCleanup(providers._targets.pop, (providers.VOICE, "echo"))
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_instantiated_once_per_process(self):
+        self.assertIs(providers.voice("echo"), providers.voice("echo"))
+        self.assertEqual(EchoProvider.instances, 1)
+        self.assertIn("echo", providers.keys(providers.VOICE))
+
+    def test_unknown_key(self):
+        with self.assertRaises(ValueError):
+            providers.voice("nope")
+
+    def test_google_sdk_not_imported_by_the_pipeline(self):
+        self.assertNotIn("shilat.services.voice_providers.google_tts", sys.modules)
+
+    def test_task_uses_registered_provider(self):
+        job = make_job(voice_provider="echo", add_music=False)
+        self.assertTrue(synthesize_voice(str(job.id)))
+        job = VoiceConversionJob.objects.get(id=job.id)
+        with job.voice_stem.open("rb") as f:
+            self.assertEqual(f.read().decode(), job.submission.cleaned_text)
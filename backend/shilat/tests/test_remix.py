@@ -0,0 +1,108 @@
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.models import GeneratedAudio, MusicBed, VoiceConversionJob
+from shilat.tasks import release_stale_remixes
+from shilat.tests.factories import make_job
+
+
+def _fake_post_process(audio_bytes, job):
+    settings = {"volume": job.music_volume_db, "percussion": job.add_percussion, "music": job.add_music}
+    return {"format": "mp3", "duration": 1.5, "settings": settings,
+            "django_file": ContentFile(audio_bytes + b"-mix", name="remix.mp3")}
+
+
+@override_settings(REMIX_SYNC_MAX_SEC=60)
+class RemixTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _finished_job(self, duration=30.0, **kwargs):
+        job = make_job(status="succeeded", stage="done", music_audio_url="https://cdn.example/a.mp3", **kwargs)
+        job.voice_stem.save(f"{job.id}.mp3", ContentFile(b"voice"), save=False)
+        job.music_stem.save(f"{job.id}-music.mp3", ContentFile(b"music"), save=True)
+        name = default_storage.save("generated/first.mp3", ContentFile(b"first"))
+        GeneratedAudio.objects.create(job=job, audio_file=name, duration_sec=duration)
+        client = APIClient()
+        client.force_authenticate(job.submission.user)
+        return job, client, name
+
+    def test_short_track_remixed_inline_from_stems(self):
+        job, client, first = self._finished_job()
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process), \
+                mock.patch("shilat.tasks.providers") as providers:
+            res = client.post(f"/api/remix/{job.id}/", {"music_volume_db": -20, "add_percussion": False}, format="json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["meta"]["settings"], {"volume": -20.0, "percussion": False, "music": True})
+        providers.voice.assert_not_called()
+        providers.music.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.stage), ("succeeded", "done"))
+        audio = GeneratedAudio.objects.get(job=job)
+        self.assertEqual(audio.audio_file.read(), b"voice-mix")
+        self.assertTrue(audio.meta_json["remix"])
+        self.assertEqual(audio.meta_json["stems"]["voice"], job.voice_stem.name)
+        self.assertFalse(default_storage.exists(first))
+
+    def test_long_track_queued_and_settings_clamped(self):
+        job, client, _ = self._finished_job(duration=600.0)
+        with mock.patch("shilat.api.views.remix_audio.delay") as delay:
+            res = client.post(f"/api/remix/{job.id}/", {"music_volume_db": -90, "tempo": 120}, format="json")
+        self.assertEqual(res.status_code, 202)
+        delay.assert_called_once_with(str(job.id), {"music_volume_db": -40.0, "tempo": 120})
+        job.refresh_from_db()
+        # The settings are saved only with the mix made from them
+        self.assertEqual((job.stage, job.music_volume_db, job.tempo), ("mixing", -10.0, 96))
+        # A second remix while this one runs is refused
+        self.assertEqual(client.post(f"/api/remix/{job.id}/", {}, format="json").status_code, 409)
+
+        # The queued remix was lost: once its lease runs out the sweeper frees the job
+        self.assertEqual(release_stale_remixes(), 0)
+        cache.delete(f"remix-claim:{job.id}")
+        self.assertEqual(release_stale_remixes(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.stage), ("succeeded", "done"))
+        with mock.patch("shilat.api.views.remix_audio.delay"):
+            self.assertEqual(client.post(f"/api/remix/{job.id}/", {}, format="json").status_code, 202)
+
+    def test_failed_remix_keeps_previous_settings(self):
+        job, client, first = self._finished_job()
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=RuntimeError("ffmpeg exploded")), \
+                self.assertLogs("shilat.api.views", "ERROR"):
+            res = client.post(f"/api/remix/{job.id}/", {"music_volume_db": -20, "tempo": 130}, format="json")
+        self.assertEqual(res.status_code, 500)
+        self.assertNotIn("ffmpeg", res.json()["detail"])
+        old = VoiceConversionJob.objects.get(id=job.id)
+        self.assertEqual((old.stage, old.music_volume_db, old.tempo), ("done", job.music_volume_db, job.tempo))
+        self.assertEqual(GeneratedAudio.objects.get(job=job).audio_file.name, first)
+        # The claim is released at once
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process):
+            self.assertEqual(client.post(f"/api/remix/{job.id}/", {"tempo": 130}, format="json").status_code, 200)
+        self.assertEqual(VoiceConversionJob.objects.get(id=job.id).tempo, 130)
+
+    def test_swap_to_library_bed(self):
+        job, client, _ = self._finished_job()
+        bed = MusicBed.objects.create(rhythm_key="samri", tempo_bucket=96, style_key="najdi", status="ready",
+                                      task_id="bed-1", audio_url="https://cdn.example/bed.mp3")
+        bed.audio_file.save("bed-1.mp3", ContentFile(b"bed"), save=True)
+        with mock.patch("shilat.tasks.post_process_audio", side_effect=_fake_post_process):
+            self.assertEqual(client.post(f"/api/remix/{job.id}/", {"music_bed_id": bed.id}, format="json").status_code, 200)
+        job.refresh_from_db()
+        self.assertEqual((job.music_bed_id, job.music_stem.name), (bed.id, bed.audio_file.name))
+        self.assertEqual(client.post(f"/api/remix/{job.id}/", {"music_bed_id": 999}, format="json").status_code, 400)
+
+    def test_only_finished_jobs_with_a_voice_stem(self):
+        job, client, _ = self._finished_job()
+        VoiceConversionJob.objects.filter(id=job.id).update(status="running")
+        self.assertEqual(client.post(f"/api/remix/{job.id}/", {}, format="json").status_code, 409)
+        vocal = make_job(status="succeeded", music_provider="suno_vocal")
+        client.force_authenticate(vocal.submission.user)
+        self.assertEqual(client.post(f"/api/remix/{vocal.id}/", {}, format="json").status_code, 409)
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase
+from shilat.services import tts_cache
+from shilat.services.tts_cache import TTSCache, cache_key
+
+class TTSCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_key_depends_on_every_part(self):
+        base = cache_key("elevenlabs", "v1", "m1", {"stability": 0.35}, "", "نص")
+        self.assertEqual(base, cache_key("elevenlabs", "v1", "m1", {"stability": 0.35}, "", "نص"))
+        self.assertNotEqual(base, cache_key("elevenlabs", "v1", "m1", {"stability": 0.4}, "", "نص"))
+        self.assertNotEqual(base, cache_key("google", "v1", "m1", {"stability": 0.35}, "", "نص"))
+        self.assertNotEqual(base, cache_key("elevenlabs", "v1", "m1", {"stability": 0.35}, "", "نص آخر"))
+
+    def test_hit_skips_synthesis(self):
+        cache = TTSCache(self.tmp.name, max_bytes=1024)
+        calls = []
+        def synth():
+            calls.append(1)
+            return b"audio"
+        before = tts_cache.stats()
+        self.assertEqual(cache.get_or_synthesize("ab" * 32, synth), b"audio")
+        self.assertEqual(cache.get_or_synthesize("ab" * 32, synth), b"audio")
+        after = tts_cache.stats()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTSCache(self.tmp.name, max_bytes=25)
+        cache.put("aa" * 32, b"x" * 10)
+        cache.put("bb" * 32, b"x" * 10)
+        os.utime(cache._path("aa" * 32), (1, 1))
+        os.utime(cache._path("bb" * 32), (2, 2))
+        cache.get("aa" * 32)
+        cache.put("cc" * 32, b"x" * 10)
+        self.assertIsNotNone(cache.get("aa" * 32))
+        self.assertIsNone(cache.get("bb" * 32))
+        self.assertIsNotNone(cache.get("cc" * 32))
+
+    def test_writes_scan_only_when_over_budget(self):
+        cache = TTSCache(self.tmp.name, max_bytes=100)
+        cache.put("aa" * 32, b"x" * 10)
+        with mock.patch.object(TTSCache, "_scan", wraps=cache._scan) as scan:
+            cache.put("bb" * 32, b"x" * 10)
+            cache.put("cc" * 32, b"x" * 10)
+        scan.assert_not_called()
+        self.assertEqual((cache.root / ".size").read_text(), "30")
+        cache.put("dd" * 32, b"x" * 80)
+        self.assertLessEqual(int((cache.root / ".size").read_text()), 90)
@@ -0,0 +1,54 @@
+import io
+import threading
+import time
+from django.test import SimpleTestCase, override_settings
+from pydub import AudioSegment
+from shilat.services.tts_chunking import Chunk, pack_chunks, split_verses, stitch, synthesize_units
+
+def _wav(ms: int) -> bytes:
+    buf = io.BytesIO()
+    AudioSegment.silent(duration=ms, frame_rate=16000).export(buf, format="wav")
+    return buf.getvalue()
+
+@override_settings(TTS_VERSE_GAP_MS=300, TTS_HEMISTICH_GAP_MS=100, TTS_CROSSFADE_MS=0, TTS_CHUNK_MAX_CHARS=40)
+class TTSChunkingTests(SimpleTestCase):
+    def test_one_chunk_per_verse(self):
+        chunks = split_verses("قفا نبك من ذكرى حبيب ومنزل\n\nبسقط اللوى بين الدخول فحومل")
+        self.assertEqual([c.text for c in chunks], ["قفا نبك من ذكرى حبيب ومنزل", "بسقط اللوى بين الدخول فحومل"])
+        self.assertEqual([c.gap_ms for c in chunks], [300, 0])
+
+    def test_long_verse_split_into_hemistichs(self):
+        line = "قفا نبك من ذكرى حبيب ومنزل بسقط اللوى بين الدخول فحومل"
+        chunks = split_verses(line + "\nسطر")
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(" ".join(c.text for c in chunks[:2]), line)
+        self.assertEqual(chunks[0].gap_ms, 100)
+        self.assertEqual(chunks[1].gap_ms, 300)
+
+    def test_pack_respects_byte_limit(self):
+        chunks = [Chunk("ا" * 10, 300) for _ in range(5)]
+        packed = pack_chunks(chunks, max_bytes=45)
+        self.assertEqual(len(packed), 3)
+        self.assertTrue(all(len(c.text.encode("utf-8")) <= 45 for c in packed))
+
+    def test_units_run_concurrently_in_order(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        def synth(text):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return text.encode()
+        chunks = [Chunk(str(i), 0) for i in range(6)]
+        out = synthesize_units(chunks, synth, max_workers=3)
+        self.assertEqual(out, [str(i).encode() for i in range(6)])
+        self.assertEqual(peak[0], 3)
+
+    def test_stitch_adds_gaps(self):
+        chunks = [Chunk("a", 300), Chunk("b", 0)]
+        out = stitch(chunks, [_wav(500), _wav(700)], fmt="wav")
+        seg = AudioSegment.from_file(io.BytesIO(out), format="wav")
+        self.assertAlmostEqual(len(seg), 1500, delta=5)
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from shilat.models import AudioVariant, GeneratedAudio
+from shilat.services import variants
+from shilat.tasks import persist_audio
+from shilat.tests.factories import make_job
+from shilat.tests.test_mixer import _wav
+
+
+class ChooseTests(SimpleTestCase):
+    def test_query_parameter_wins_and_bitrate_snaps(self):
+        self.assertEqual(variants.choose("opus", "40k", "audio/mp4"), ("opus", 32))
+        self.assertEqual(variants.choose("m4a"), ("aac", 96))
+        self.assertEqual(variants.choose("hls", "1000"), ("hls", 128))
+        self.assertIsNone(variants.choose("mp3", None, "audio/ogg"))
+        with self.assertRaises(ValueError):
+            variants.choose("flac")
+
+    def test_accept_header(self):
+        self.assertEqual(variants.choose("", None, "audio/mp4;q=0.5, audio/ogg; codecs=opus"), ("opus", 48))
+        self.assertEqual(variants.choose("", None, "application/vnd.apple.mpegurl"), ("hls", 96))
+        self.assertIsNone(variants.choose("", None, "audio/mpeg, audio/ogg;q=0.2"))
+        self.assertIsNone(variants.choose("", None, "*/*"))
+
+
+class DownloadVariantTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name, MEDIA_URL="/media/")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.job = make_job(status="succeeded")
+        name = default_storage.save("generated/a.m4a", ContentFile(b"original"))
+        self.audio = GeneratedAudio.objects.create(job=self.job, audio_file=name, format="m4a")
+        self.client = APIClient()
+        self.client.force_authenticate(self.job.submission.user)
+        self.url = f"/api/download/{self.job.id}/"
+
+    def test_original_keeps_its_format(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res["Content-Type"], "audio/mp4")
+        self.assertIn(f"shilat-{self.job.id}.m4a", res["Content-Disposition"])
+        self.assertEqual(b"".join(res.streaming_content), b"original")
+
+    def test_variant_encoded_once_then_served(self):
+        with mock.patch("shilat.tasks.build_audio_variant.delay") as build:
+            first = self.client.get(self.url, HTTP_ACCEPT="audio/ogg")
+            second = self.client.get(self.url, {"variant": "opus"})
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(first["Retry-After"], "2")
+        variant = AudioVariant.objects.get()
+        build.assert_called_once_with(variant.id)
+
+        variant.file.name = default_storage.save("variants/x/audio.opus", ContentFile(b"opus"))
+        AudioVariant.objects.filter(id=variant.id).update(status="ready", file=variant.file.name)
+        res = self.client.get(self.url, {"variant": "opus", "bitrate": "48"})
+        self.assertEqual((res.status_code, res["Content-Type"]), (200, "audio/ogg"))
+        self.assertEqual(b"".join(res.streaming_content), b"opus")
+        self.assertEqual(self.client.get(self.url, {"variant": "flac"}).status_code, 400)
+
+    def test_hls_segments_are_served_behind_the_access_check(self):
+        variant = AudioVariant.objects.create(audio=self.audio, kind="hls", bitrate=96, status="ready")
+        folder = variants._store_dir(variant)
+        self.assertEqual(folder, f"variants/{variant.key.hex}")
+        seg = default_storage.save(f"{folder}/seg0000.ts", ContentFile(b"ts"))
+        playlist = default_storage.save(f"{folder}/index.m3u8",
+                                        ContentFile(b"#EXTM3U\n#EXTINF:6.0,\nseg0000.ts\n#EXT-X-ENDLIST\n"))
+        AudioVariant.objects.filter(id=variant.id).update(file=playlist)
+        res = self.client.get(self.url, {"variant": "hls"})
+        self.assertEqual(res["Content-Type"], "application/vnd.apple.mpegurl")
+        segment_url = f"http://testserver{self.url}hls/{variant.key}/seg0000.ts"
+        self.assertIn(f"{segment_url}\n", res.content.decode())
+        self.assertNotIn("/media/", res.content.decode())
+
+        res = self.client.get(segment_url)
+        self.assertEqual((res.status_code, res["Content-Type"]), (200, "video/mp2t"))
+        self.assertEqual(b"".join(res.streaming_content), b"ts")
+        self.assertEqual(self.client.get(f"{self.url}hls/{variant.key}/index.m3u8").status_code, 404)
+        stranger = APIClient()
+        stranger.force_authenticate(make_job().submission.user)
+        self.assertEqual(stranger.get(segment_url).status_code, 404)
+        self.assertEqual(APIClient().get(segment_url).status_code, 401)
+
+        # A new mix drops the variants and their files
+        persist_audio({"name": "generated/b.mp3", "duration": 1.0}, str(self.job.id))
+        self.assertFalse(AudioVariant.objects.exists())
+        self.assertFalse(default_storage.exists(seg) or default_storage.exists(playlist))
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg not installed")
+class BuildVariantTests(TestCase):
+    def test_build_opus_and_hls(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with override_settings(MEDIA_ROOT=tmp.name, HLS_SEGMENT_SEC=2):
+            job = make_job(status="succeeded")
+            audio = GeneratedAudio.objects.create(job=job, format="wav", duration_sec=5.0,
+                                                  audio_file=default_storage.save("generated/a.wav", ContentFile(_wav(5))))
+            for kind in ("opus", "hls"):
+                variant = AudioVariant.objects.create(audio=audio, kind=kind, bitrate=64)
+                variants.build(variant)
+                self.assertEqual(variant.status, "ready")
+                self.assertGreater(variant.size, 0)
+            hls = AudioVariant.objects.get(kind="hls")
+            self.assertGreaterEqual(variants.playlist(hls, "/").count(".ts"), 2)
@@ -0,0 +1,58 @@
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from shilat.services import voice_catalog
+
+VOICES = [
+    ("base", {"voice_id": "v1", "name": "Rachel", "labels": {"language": "en", "gender": "female"}}),
+    ("base", {"voice_id": "v2", "name": "Fahad", "labels": {"language": "ar", "accent": "najdi", "gender": "male"}}),
+    ("community", {"voice_id": "v3", "name": "Lulwa", "labels": {"language": "ar", "accent": "kuwait", "gender": "female"}}),
+    ("catalog", {"voice_id": "v4", "name": "Majed", "labels": {"accent": "hijazi", "gender": "male"},
+                 "verified_languages": [{"language": "ar"}]}),
+]
+
+
+@override_settings(ELEVENLABS_API_KEY="test", VOICE_CATALOG_FRESH_SEC=900, VOICE_CATALOG_LOCAL_TTL_SEC=0)
+class VoiceCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        voice_catalog._local.clear()
+        patcher = mock.patch(
+            "shilat.services.voice_providers.elevenlabs.ElevenLabsProvider.fetch_catalog", return_value=VOICES
+        )
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _ids(self, **kwargs):
+        return [v["voice_id"] for v in voice_catalog.elevenlabs_voices(**kwargs)]
+
+    def test_filters_answered_from_one_fetch(self):
+        self.assertEqual(self._ids(), ["v2", "v3"])
+        self.assertEqual(self._ids(include_verified=True, include_catalog=True), ["v2", "v3", "v4"])
+        self.assertEqual(self._ids(dialect="khaliji"), ["v3"])
+        self.assertEqual(self._ids(gender="male", include_verified=True, include_catalog=True), ["v2", "v4"])
+        self.assertEqual(self._ids(language="all", include_community=False), ["v1", "v2"])
+        self.assertEqual(self.fetch.call_count, 2)  # "ar" and "all" snapshots
+
+    def test_stale_snapshot_served_while_refresh_is_scheduled_once(self):
+        self._ids()
+        key = voice_catalog._cache_key("elevenlabs", "ar")
+        snap = cache.get(key)
+        snap["fetched_at"] = time.time() - 3600
+        cache.set(key, snap)
+        with mock.patch("shilat.tasks.refresh_voice_catalog.delay") as delay:
+            self.assertEqual(self._ids(), ["v2", "v3"])
+            self.assertEqual(self._ids(), ["v2", "v3"])
+        delay.assert_called_once_with("elevenlabs", "ar")
+        self.assertEqual(self.fetch.call_count, 1)
+
+    @override_settings(VOICE_CATALOG_COLD_WAIT_SEC=0)
+    def test_cold_miss_fetched_by_one_request_only(self):
+        # Another request holds the cold-fetch lock: this one answers empty instead of fetching too
+        cache.add(voice_catalog._cache_key("elevenlabs", "ar") + ":building", 1)
+        self.assertEqual(self._ids(), [])
+        self.fetch.assert_not_called()
+        cache.delete(voice_catalog._cache_key("elevenlabs", "ar") + ":building")
+        self.assertEqual(self._ids(), ["v2", "v3"])
+        self.assertEqual(self.fetch.call_count, 1)
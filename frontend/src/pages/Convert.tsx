@@ -16,6 +16,7 @@ export default function Convert() {
   const [meter, setMeter] = useState<string>("");
   const [conf, setConf] = useState<number>(0);
   const [meterDetails, setMeterDetails] = useState<any>(null);
+  const [live, setLive] = useState<{ meter_guess: string; meter_confidence: number; lines: { bahr: string; pattern: string }[] } | null>(null);
 
   const [styles, setStyles] = useState<Style[]>([]);
   const [schools, setSchools] = useState<School[]>([]);
@@ -139,14 +140,37 @@ export default function Convert() {
   };
 
   useEffect(()=>{
-    if(!jobId) return;
+    // تحليل البحر أثناء الكتابة (بعد توقف قصير، دون حفظ)
+    if (step !== 1 || !text.trim()) { setLive(null); return; }
     let stop = false;
-    const timer = setInterval(async ()=>{
+    const timer = setTimeout(async ()=>{
       try{
-        const res = await api.get(`/job-status/${jobId}/`);
+        const res = await api.post("/analyze/", { text });
+        if (!stop) setLive(res.data);
+      }catch{}
+    }, 400);
+    return ()=>{ stop=true; clearTimeout(timer); };
+  }, [text, step]);
+
+  useEffect(()=>{
+    if(!jobId) return;
+    // متابعة التقدم بالانتظار الطويل: يرد الخادم فور تغيّر المرحلة بدل الاستعلام الدوري
+    let stop = false;
+    (async ()=>{
+      let since = -1;
+      while (!stop) {
+        let data: any;
+        try{
+          const res = await api.get(`/job-events/${jobId}/`, { params: { since, wait: 25 } });
+          data = res.data;
+        }catch{
+          await new Promise(r => setTimeout(r, 1500));
+          continue;
+        }
         if (stop) return;
-        setJobStatus(res.data.status);
-        if (res.data.status === "succeeded") {
+        since = data.seq;
+        setJobStatus(data.status);
+        if (data.status === "succeeded" && data.stage === "done") {
           try{
             const file = await api.get(`/download/${jobId}/`, { responseType: "blob" });
             const blob = new Blob([file.data], { type: "audio/mpeg" });
@@ -156,15 +180,15 @@ export default function Convert() {
           }catch{
             setErr("تعذر تحميل الملف. تأكد من تسجيل الدخول.");
           }
-          clearInterval(timer);
+          return;
         }
-        if (res.data.status === "failed") {
-          clearInterval(timer);
-          setErr(res.data.error_message || "فشل التوليد.");
+        if (data.status === "failed") {
+          setErr(data.error_message || "فشل التوليد.");
+          return;
         }
-      }catch{}
-    }, 1500);
-    return ()=>{ stop=true; clearInterval(timer); };
+      }
+    })();
+    return ()=>{ stop=true; };
   }, [jobId]);
 
   useEffect(()=>{
@@ -208,6 +232,12 @@ export default function Convert() {
             value={title} onChange={(e)=>setTitle(e.target.value)} />
           <textarea className="w-full h-48 px-3 py-2 rounded-lg bg-black/40 border border-white/10 leading-8"
             value={text} onChange={(e)=>setText(e.target.value)} />
+          {live?.meter_guess && (
+            <div className="text-xs text-white/60">
+              البحر أثناء الكتابة: <span className="text-saudiGold">{live.meter_guess}</span>{" "}
+              (ثقة {Math.round(live.meter_confidence*100)}%) — {live.lines.filter(l=>l.bahr===live.meter_guess).length}/{live.lines.length} أبيات
+            </div>
+          )}
           <button onClick={submitText} className="px-4 py-2 rounded-lg bg-saudiGreen hover:opacity-90">
             كشف البحر + متابعة
           </button>